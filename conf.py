@@ -8,6 +8,9 @@ conf = {
     "s3_list": "s3_list.json",
     "s3_list_local": "s3_list_local.json",
     "hls_links": "hls_links.json",
+    "hls_index": "hls_index.json",
+    "extract_state": "extract_state.npz",
+    "run_manifest": "run_manifest.json",
     "s3_cred_endpoints": {
         'POCLOUD':'https://archive.swot.podaac.earthdata.nasa.gov/s3credentials',
         'lpdaac':'https://data.lpdaac.earthdatacloud.nasa.gov/s3credentials',
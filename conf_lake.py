@@ -2,6 +2,7 @@ conf = {
     "cycle_passes": "cycle_passes_lake.json",
     "passes": "passes_lake.json",
     "lake": "lakes.json",
+    "lake_s3": "s3_lake.json",
     "s3_list": "s3_list_lake.json",
     "s3_list_local": "s3_list_lake_local.json",
     "s3_cred_endpoints": {
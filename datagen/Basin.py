@@ -1,5 +1,5 @@
-# Standard imports
-import re
+# Third-party imports
+import numpy as np
 
 class Basin:
     """
@@ -12,8 +12,10 @@ class Basin:
     ----------
     basin_data: list
         list of dictionaries of basin identifier keys and filename values
-    reach_ids: list
-        list of string reach identifiers
+    basin_indices: list
+        list of arrays of the reach_ids indexes in each basin_data element
+    reach_ids: numpy.ndarray
+        array of integer reach identifiers
     sos_filename: str
         name of SOS file
     sword_filename: str
@@ -34,6 +36,7 @@ class Basin:
         """
         
         self.basin_data = []
+        self.basin_indices = []
         self.reach_ids = reach_ids
         self.sos_filename = sos_filename
         self.sword_filename = sword_filename
@@ -57,33 +60,34 @@ class Basin:
         return self.basin_data
         
     def get_sword(self):
-        """Associate basin identifiers, reach identifiers and SWORD file names."""
+        """Associate basin identifiers, reach identifiers and SWORD file names.
+        
+        The basin identifier is the first 4 digits of the 11 digit reach
+        identifier so reaches are grouped by basin with a single stable sort,
+        each basin's reaches in reach_ids order.
+        """
         
-        basin_ids = set(list(map(lambda x: int(str(x)[0:4]), self.reach_ids)))
-        for basin_id in basin_ids:
+        reach_ids = np.asarray(self.reach_ids).astype(np.int64)
+        basin_of_reach = reach_ids // 10**7
+        order = np.argsort(basin_of_reach, kind="stable")
+        basins, counts = np.unique(basin_of_reach, return_counts=True)
+        
+        # Basins in ascending identifier order: array jobs pick a basin by its
+        # position in basin.json, so the order must not depend on how a set
+        # happens to iterate, as it did when basins were collected in one
+        basin_ids = basins.tolist()
+        indices = np.split(order, np.cumsum(counts)[:-1])
+        reach_strs = [str(reach_id) for reach_id in reach_ids.tolist()]
+        for basin_id, basin_indices in zip(basin_ids, indices):
+            self.basin_indices.append(basin_indices)
             self.basin_data.append({"basin_id": basin_id, 
-                                    "reach_id": extract_reach_ids(basin_id, self.reach_ids),
+                                    "reach_id": [reach_strs[i] for i in basin_indices.tolist()],
                                     "sword": self.sword_filename,
                                     "sos": self.sos_filename})
             
     def get_swot(self):
         """Assign SWOT file names to basin_data dictionaries."""
         
-        for element in self.basin_data:
-            element["swot"] = []
-            for reach_id in element["reach_id"]:
-                element["swot"].append(f"{reach_id}_SWOT.nc")
-
-def extract_reach_ids(basin_id, reach_ids):
-    """Extract all reach identfiers for basin.
-
-    Parameters
-    ----------
-    basin_id: int
-        basin identifier
-    reach_ids: numpy.ndarray
-        numpy array of integer reach identifiers
-    """
-
-    basin_r = re.compile(f"^{basin_id}.*")
-    return(list(filter(basin_r.match, reach_ids)))
\ No newline at end of file
+        swot_files = [f"{reach_id}_SWOT.nc" for reach_id in np.asarray(self.reach_ids).tolist()]
+        for element, indices in zip(self.basin_data, self.basin_indices):
+            element["swot"] = [swot_files[i] for i in indices.tolist()]
@@ -0,0 +1,239 @@
+# Standard imports
+import struct
+import zipfile
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from datagen.JsonWriter import atomic_open
+
+class ColumnarReader:
+    """
+    A class that reads single rows of a columnar output file.
+
+    Only the rows asked for are read: every column is memory mapped from the
+    uncompressed npz file, so a row costs a few page reads whatever the size
+    of the file.
+
+    Attributes
+    ----------
+    arrays: dict
+        dictionary of array name keys and memory mapped array values
+    columns: list
+        list of column names
+    filename: Path
+        path to npz file
+    members: dict
+        dictionary of array name keys and (dtype, shape, order, offset) values
+    reach_order: numpy.ndarray
+        row of each reach identifier in sorted order, None until read_reach
+        is called or when the reach_id column is already sorted
+    sorted_reach_ids: numpy.ndarray
+        reach identifiers in sorted order, set by read_reach
+
+    Methods
+    -------
+    read_row(index)
+        returns the values of a row by index
+    read_reach(reach_id)
+        returns the values of the row of a reach identifier
+    read_values(name, start, stop)
+        returns the values of a column for a range of rows
+    """
+
+    def __init__(self, filename):
+        """
+        Parameters
+        ----------
+        filename: Path
+            path to npz file
+        """
+
+        self.filename = filename
+        self.members = {}
+        self.arrays = {}
+        self.reach_order = None
+        self.sorted_reach_ids = None
+        with open(filename, "rb") as fh, zipfile.ZipFile(fh) as zf:
+            for info in zf.infolist():
+                if info.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError(f"{filename} member {info.filename} is compressed and can't be memory mapped.")
+                # Array data follows the local file header and the npy header
+                fh.seek(info.header_offset)
+                name_length, extra_length = struct.unpack("<HH", fh.read(30)[26:30])
+                fh.seek(info.header_offset + 30 + name_length + extra_length)
+                version = np.lib.format.read_magic(fh)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fh)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fh)
+                order = "F" if fortran_order else "C"
+                self.members[info.filename[:-len(".npy")]] = (dtype, shape, order, fh.tell())
+        self.columns = list(dict.fromkeys(name.split(".")[0] for name in self.members))
+
+    def __len__(self):
+        """Return the number of rows."""
+
+        name = self.columns[0]
+        for member in (name, f"{name}.codes"):
+            if member in self.members:
+                return self.members[member][1][0]
+        return self.members[f"{name}.offsets"][1][0] - 1
+
+    def array(self, name):
+        """Return a memory mapped array of the file."""
+
+        if name not in self.arrays:
+            dtype, shape, order, offset = self.members[name]
+            if np.prod(shape) == 0:
+                self.arrays[name] = np.empty(shape, dtype=dtype, order=order)
+            else:
+                self.arrays[name] = np.memmap(self.filename, dtype=dtype, mode="r", offset=offset, shape=shape, order=order)
+        return self.arrays[name]
+
+    def read_row(self, index):
+        """Return a dictionary of column name keys and row values.
+
+        Parameters
+        ----------
+        index: int
+            row index, the array index of the JSON file entry
+        """
+
+        return {column: self.read_values(column, index, index + 1)[0] for column in self.columns}
+
+    def read_reach(self, reach_id):
+        """Return a dictionary of column name keys and row values for a reach,
+        None if the reach is not in the file.
+
+        Parameters
+        ----------
+        reach_id: int
+            reach identifier
+        """
+
+        # Reach identifiers are searched in sorted order, rows need not be
+        if self.sorted_reach_ids is None:
+            reach_ids = self.array("reach_id")
+            if np.all(reach_ids[:-1] <= reach_ids[1:]):
+                self.sorted_reach_ids = reach_ids
+            else:
+                self.reach_order = np.argsort(reach_ids, kind="stable")
+                self.sorted_reach_ids = reach_ids[self.reach_order]
+
+        index = int(np.searchsorted(self.sorted_reach_ids, int(reach_id)))
+        if index == len(self.sorted_reach_ids) or self.sorted_reach_ids[index] != int(reach_id):
+            return None
+        if self.reach_order is not None:
+            index = int(self.reach_order[index])
+        return self.read_row(index)
+
+    def read_values(self, name, start, stop):
+        """Return a list of the values of a column for rows start to stop.
+
+        Parameters
+        ----------
+        name: str
+            column name
+        start: int
+            first row
+        stop: int
+            row after the last row
+        """
+
+        if name in self.members:
+            return self.array(name)[start:stop].tolist()
+        if f"{name}.codes" in self.members:
+            return self.array(f"{name}.values")[self.array(f"{name}.codes")[start:stop]].tolist()
+        offsets = self.array(f"{name}.offsets")[start:stop + 1].tolist()
+        return [self.read_values(f"{name}.items", first, last) for first, last in zip(offsets[:-1], offsets[1:])]
+
+def int_column(name, values):
+    """Return the arrays of an integer column.
+
+    Parameters
+    ----------
+    name: str
+        column name
+    values: numpy.ndarray
+        integer values
+    """
+
+    return {name: np.asarray(values, dtype=np.int64)}
+
+def string_column(name, values):
+    """Return the arrays of a dictionary encoded string column: an index per
+    row into the column's distinct values.
+
+    Parameters
+    ----------
+    name: str
+        column name
+    values: list
+        string values
+    """
+
+    values, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return {f"{name}.codes": codes.astype(np.int32), f"{name}.values": values}
+
+def list_column(name, offsets, items):
+    """Return the arrays of a column of lists stored as offsets and values,
+    row i holding items[offsets[i]:offsets[i+1]].
+
+    Parameters
+    ----------
+    name: str
+        column name
+    offsets: numpy.ndarray
+        offset of each row's first item, followed by the number of items
+    items: numpy.ndarray
+        integer or string items of all rows
+    """
+
+    items = np.asarray(items)
+    item_column = int_column if np.issubdtype(items.dtype, np.integer) else string_column
+    return {f"{name}.offsets": np.asarray(offsets, dtype=np.int64), **item_column(f"{name}.items", items)}
+
+def list_offsets(lists):
+    """Return the offsets and concatenated items of a list of lists."""
+
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(items) for items in lists], out=offsets[1:])
+    return offsets, [item for items in lists for item in items]
+
+def write_npz(table, filename):
+    """Write a table of arrays as an uncompressed npz file.
+
+    Parameters
+    ----------
+    table: dict
+        dictionary of array name keys and array values
+    filename: Path
+        path to npz file
+    """
+
+    with atomic_open(filename, "wb") as fh:
+        np.savez(fh, **table)
+
+# Serializers by format name, each takes a table of arrays and a file name
+SERIALIZERS = {
+    "npz": write_npz
+}
+
+def write_columns(table, json_file, binary_format):
+    """Write a table next to its JSON file in a binary columnar format.
+
+    Parameters
+    ----------
+    table: dict
+        dictionary of array name keys and array values
+    json_file: Path
+        path to JSON file with the same data
+    binary_format: str
+        name of the serializer to write with
+    """
+
+    filename = json_file.with_suffix(f".{binary_format}")
+    print(f"Writing {binary_format} data to: {filename}")
+    SERIALIZERS[binary_format](table, filename)
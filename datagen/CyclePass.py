@@ -1,3 +1,6 @@
+# Third-party imports
+import numpy as np
+
 class CyclePass:
     """A class that map cycle pass combinations to numeric idenitifiers.
     
@@ -6,33 +9,43 @@ class CyclePass:
     
     Attributes
     ----------
-    shp_files: list
-        list of shapefiles
+    granules: GranuleTable
+        table of shapefiles
         
     Methods
     -------
+    get_cycle_pass_data()
+        returns cycle pass combinations and their numeric identifiers
     """
     
-    def __init__(self, shp_files):
+    def __init__(self, granules):
         """
-        shp_files: list
-            list of shapefiles
+        granules: GranuleTable
+            table of shapefiles
         """
         
-        self.shp_files = shp_files
+        self.granules = granules
         self.cycle_pass_data = {}
         self.pass_num = {}
         
     def get_cycle_pass_data(self):
-        """Return cycle pass combinations associated with numeric identifier."""
+        """Return cycle pass combinations associated with numeric identifier.
         
-        p = 1
-        for shp_file in self.shp_files:
-            shp_name = shp_file.split('/')[-1]
-            cycle_no = shp_name.split('_')[5]
-            pass_no = shp_name.split('_')[6]
-            if not f"{cycle_no}_{pass_no}" in self.cycle_pass_data:
-                self.cycle_pass_data[f"{cycle_no}_{pass_no}"] = p
-                self.pass_num[p] = [cycle_no, pass_no]
-            p += 1
-        return self.cycle_pass_data, self.pass_num
\ No newline at end of file
+        The identifier of a combination is one more than the position of its
+        first shapefile. Cycle and pass are the sixth and seventh fields of
+        the file name as they are written, so a name whose fields are not
+        numbers keeps them; a name without those fields is left out.
+        """
+        
+        fields = [name.split("_")[5:7] for name in self.granules.name.tolist()]
+        has_fields = np.array([len(field) == 2 for field in fields], dtype=bool)
+        if not has_fields.any():
+            return self.cycle_pass_data, self.pass_num
+        positions = np.flatnonzero(has_fields)
+        keys = np.array([fields[i] for i in positions.tolist()], dtype=str)
+        _, first = np.unique(keys, axis=0, return_index=True)
+        for i in np.sort(first).tolist():
+            cycle_no, pass_no = keys[i].tolist()
+            self.cycle_pass_data[f"{cycle_no}_{pass_no}"] = int(positions[i]) + 1
+            self.pass_num[int(positions[i]) + 1] = [cycle_no, pass_no]
+        return self.cycle_pass_data, self.pass_num
@@ -0,0 +1,93 @@
+# Standard imports
+import struct
+
+# Third-party imports
+import numpy as np
+
+# Table file header: record count, header length and record length
+DBF_HEADER = struct.Struct("<4xIHH20x")
+
+# Field descriptor: name, type, length and decimal count
+DBF_FIELD = struct.Struct("<11sc4xBB14x")
+
+def read_dbf_column(dbf, field):
+    """Return the values of one field of a DBF table as an array.
+
+    Only the bytes of the field are decoded, the other fields of each record
+    are skipped. Deleted records, those whose flag is not a blank, are left
+    out. The type of the values comes from the field descriptor, so every
+    file of a field gives the same type: character fields are strings
+    stripped of padding, numeric fields without decimals integers and
+    numeric fields with decimals floats. Numeric values are read as pyshp
+    reads them: asterisks, which some writers fill empty values with, are
+    dropped, and empty or unparseable integer values, which pyshp reads as
+    None, are left out while empty or unparseable float values are NaN.
+
+    Parameters
+    ----------
+    dbf: file object
+        binary DBF file
+    field: str
+        name of the field to read
+    """
+
+    data = dbf.read()
+    num_records, header_length, record_length = DBF_HEADER.unpack_from(data)
+
+    # Field descriptors follow the file header until a 0x0D terminator,
+    # the first byte of each record is its deletion flag
+    offset = 1
+    position = DBF_HEADER.size
+    while data[position] != 0x0D:
+        name, field_type, length, decimals = DBF_FIELD.unpack_from(data, position)
+        if name.split(b"\x00")[0].decode() == field:
+            break
+        offset += length
+        position += DBF_FIELD.size
+    else:
+        raise KeyError(f"DBF table has no field named {field}.")
+
+    records = np.frombuffer(data, dtype=np.uint8, count=num_records * record_length,
+                            offset=header_length).reshape(num_records, record_length)
+    records = records[records[:, 0] == ord(" ")]
+    values = np.ascontiguousarray(records[:, offset:offset + length]).view(f"S{length}").ravel()
+    if field_type in (b"N", b"F"):
+        values = np.char.strip(values, b" *")
+        if decimals == 0:
+            return to_int64(values)
+        return to_float64(values)
+    return np.char.decode(np.char.strip(values), "utf-8")
+
+def to_int64(values):
+    """Return numeric field values as integers, leaving out those that are
+    empty or not numbers. Values written as floats are truncated."""
+
+    values = values[np.char.str_len(values) > 0]
+    try:
+        return values.astype(np.int64)
+    except ValueError:
+        numbers = []
+        for value in values.tolist():
+            try:
+                numbers.append(int(value))
+            except ValueError:
+                try:
+                    numbers.append(int(float(value)))
+                except ValueError:
+                    pass
+        return np.array(numbers, dtype=np.int64)
+
+def to_float64(values):
+    """Return numeric field values as floats, NaN for those that are empty
+    or not numbers."""
+
+    try:
+        return np.where(np.char.str_len(values) == 0, b"nan", values).astype(np.float64)
+    except ValueError:
+        numbers = np.full(len(values), np.nan)
+        for i, value in enumerate(values.tolist()):
+            try:
+                numbers[i] = float(value)
+            except ValueError:
+                pass
+        return numbers
@@ -0,0 +1,192 @@
+# Standard imports
+import re
+
+# Third-party imports
+import numpy as np
+
+# Fields of a SWOT granule file name, e.g.
+# SWOT_L2_HR_RiverSP_Reach_010_020_NA_20230610T193337_20230610T193344_PIA1_01
+GRANULE_DTYPE = np.dtype([
+    ("cycle", np.int32),
+    ("pass", np.int32),
+    ("tile", "U8"),
+    ("type", "U16"),
+    ("start", "datetime64[s]"),
+    ("end", "datetime64[s]"),
+    ("crid", "U8"),
+    ("counter", np.int32)
+])
+
+class GranuleTable:
+    """
+    A class that parses SWOT granule file names once into a table.
+
+    Each URI is split into its cycle, pass, tile, type, start and end times,
+    CRID and product counter when the table is created, along with its rank
+    in natural sort order (numbers compared as numbers). Sorting, filtering
+    and grouping then work on the table's arrays instead of the strings.
+
+    Attributes
+    ----------
+    data: numpy.ndarray
+        structured array of file name fields, fields of names that do not
+        parse are -1, empty or NaT
+    granule: numpy.ndarray
+        URIs without their product counter and extension
+    name: numpy.ndarray
+        file names without their directory and extension
+    rank: numpy.ndarray
+        position of each URI in natural sort order
+    uri: numpy.ndarray
+        URIs or paths of the files
+
+    Methods
+    -------
+    filter(mask)
+        returns the table of the granules where mask is True
+    in_passes(pass_list)
+        returns a mask of the granules with a pass in pass_list
+    latest()
+        returns the table without granules superseded by a higher counter
+    sorted()
+        returns the table in natural sort order
+    take(indices)
+        returns the table of the granules at indices
+    tolist()
+        returns the URIs as a list
+    unique()
+        returns the table without repeated URIs
+    """
+
+    def __init__(self, uris):
+        """
+        Parameters
+        ----------
+        uris: list
+            list of URIs or paths of granule files
+        """
+
+        self.uri = np.array([str(uri) for uri in uris], dtype=str)
+        self.name = np.empty(len(self.uri), dtype=object)
+        self.granule = np.empty(len(self.uri), dtype=object)
+        self.data = np.zeros(len(self.uri), dtype=GRANULE_DTYPE)
+        uris = self.uri.tolist()
+        rows = []
+        for i, uri in enumerate(uris):
+            name = uri.rsplit("/", 1)[-1].split(".")[0]
+            self.name[i] = name
+            self.granule[i] = uri.rsplit("_", 1)[0]
+            rows.append(parse_name(name))
+        if rows:
+            self.data[:] = rows
+        self.name = self.name.astype(str)
+        self.granule = self.granule.astype(str)
+
+        # Rank in the order of natural_key, computed once for every URI
+        keys = [natural_key(uri) for uri in uris]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.rank = np.empty(len(self.uri), dtype=np.int64)
+        self.rank[order] = np.arange(len(self.uri))
+
+    def __len__(self):
+        """Return the number of granules."""
+
+        return len(self.uri)
+
+    def take(self, indices):
+        """Return the table of the granules at indices, in that order."""
+
+        table = object.__new__(GranuleTable)
+        table.uri = self.uri[indices]
+        table.name = self.name[indices]
+        table.granule = self.granule[indices]
+        table.data = self.data[indices]
+        table.rank = self.rank[indices]
+        return table
+
+    def filter(self, mask):
+        """Return the table of the granules where mask is True.
+
+        Parameters
+        ----------
+        mask: numpy.ndarray
+            boolean per granule
+        """
+
+        return self.take(np.flatnonzero(mask))
+
+    def in_passes(self, pass_list):
+        """Return a boolean mask of the granules whose pass is in pass_list.
+
+        Parameters
+        ----------
+        pass_list: list
+            pass numbers as integers or as the zero-padded strings of file
+            names, e.g. 20 or "020"
+        """
+
+        numbers = [p for p in pass_list if isinstance(p, int)]
+        texts = [p for p in pass_list if isinstance(p, str)]
+        passes = self.data["pass"]
+        return np.isin(passes, numbers) | np.isin(np.char.zfill(passes.astype(str), 3), texts)
+
+    def latest(self):
+        """Return the table without the granules that were processed again
+        with a higher product counter, keeping table order."""
+
+        order = np.lexsort((self.data["counter"], self.granule))
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = self.granule[order][1:] != self.granule[order][:-1]
+        return self.take(np.sort(order[last]))
+
+    def sorted(self):
+        """Return the table in natural sort order of the URIs."""
+
+        return self.take(np.argsort(self.rank, kind="stable"))
+
+    def tolist(self):
+        """Return the URIs as a list."""
+
+        return self.uri.tolist()
+
+    def unique(self):
+        """Return the table with the first of each repeated URI, keeping
+        table order."""
+
+        _, first = np.unique(self.uri, return_index=True)
+        return self.take(np.sort(first))
+
+def parse_name(name):
+    """Return the field values of a granule file name, -1, empty or NaT for
+    fields it does not have."""
+
+    fields = name.split("_")
+    if len(fields) < 12:
+        return (-1, -1, "", "", "NaT", "NaT", "", -1)
+    return (
+        to_int(fields[5]),
+        to_int(fields[6]),
+        fields[7],
+        fields[4],
+        to_datetime(fields[8]),
+        to_datetime(fields[9]),
+        fields[10],
+        to_int(fields[11])
+    )
+
+def to_int(text):
+    """Return the integer of a file name field, -1 if it is not a number."""
+
+    return int(text) if text.isdigit() else -1
+
+def to_datetime(text):
+    """Return a file name time, e.g. 20230610T193337, as ISO 8601 text."""
+
+    if len(text) != 15 or text[8] != "T" or not f"{text[:8]}{text[9:]}".isdigit():
+        return "NaT"
+    return f"{text[0:4]}-{text[4:6]}-{text[6:8]}T{text[9:11]}:{text[11:13]}:{text[13:15]}"
+
+def natural_key(text):
+    """Return the sort key of text that compares its numbers as numbers."""
+
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", text)]
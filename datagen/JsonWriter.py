@@ -0,0 +1,644 @@
+# Standard imports
+import bisect
+import contextlib
+from collections.abc import Iterator
+import gzip
+import hashlib
+import json
+from json.encoder import encode_basestring_ascii
+import os
+from pathlib import Path
+import struct
+import tempfile
+
+# Third-party imports
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressions write_json can write with the packages installed
+COMPRESSIONS = ["gzip"] + (["zstd"] if zstandard is not None else [])
+
+# Size of the write buffer
+BUFFER_SIZE = 1 << 20
+
+# Leading bytes of compressed files
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Uncompressed size from which a compressed file starts a new block
+BLOCK_SIZE = 1 << 20
+
+# Index header of a JSON file: magic bytes, length of the uncompressed text,
+# number of entries, number of compressed blocks, and the size, inode,
+# modification time and SHA-256 hash of the file the index was written with
+INDEX_HEADER = struct.Struct("<8sqqqqqq32s")
+INDEX_MAGIC = b"JSONIDX2"
+
+# Index entry of a JSON file: byte offset and length of a top-level entry
+INDEX_ENTRY = struct.Struct("<qq")
+
+# Index entry of a compressed block: its offset in the file and the offset
+# of its text in the uncompressed text
+BLOCK_ENTRY = struct.Struct("<qq")
+
+# Indentation of each nesting level, as json.dump(..., indent=2) writes it
+INDENT = "  "
+
+# Process umask, read once: setting it to read it would change the mode of
+# files other threads create meanwhile
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def write_json(json_object, filename, max_entries=None, max_bytes=None, compression=None):
+    """Write a JSON object to a file as json.dump(..., indent=2) would.
+
+    Lists, dictionaries and generators of list entries are encoded one
+    top-level entry at a time, so a generator's entries never all exist in
+    memory at once. The file is written atomically, along with an index of
+    the byte offset and length of each top-level entry that
+    read_json_entry seeks with. The file is replaced before its index, and
+    the index header identifies the file it was written with, so a reader
+    that finds a new file with an old index can tell.
+
+    A list is also written as shards when max_entries or max_bytes is set,
+    see write_shards. Otherwise shards and a manifest left by an earlier
+    write are removed, so read_shard_entry can't read their stale entries.
+
+    The file is compressed as it is written when compression is "gzip" or
+    "zstd", under the same name, and load_json and read_json_entry detect
+    it. Index offsets are offsets into the uncompressed text. A compressed
+    file is a series of gzip members or zstd frames of about BLOCK_SIZE
+    bytes of text each, which gzip and zstd read as one stream, and the
+    index gives the offset of each so read_json_entry only decompresses
+    the block of an entry.
+
+    Parameters
+    ----------
+    json_object: list, dict or generator
+        JSON data, a generator is written as a list
+    filename: Path
+        path to JSON file
+    max_entries: int
+        most entries per shard (optional)
+    max_bytes: int
+        most entry bytes per shard (optional)
+    compression: str
+        "gzip" or "zstd" to compress the file (optional)
+    """
+
+    position = num_entries = 0
+    with atomic_open(index_filename(filename), "wb") as ixf:
+        # The header is written once the file is
+        ixf.write(bytes(INDEX_HEADER.size))
+        with atomic_open(filename, "wb") as fh:
+            jf = BlockWriter(fh, compression)
+            for separator, entry in iter_entries(json_object):
+                # JSON text is ASCII so characters and bytes are the same
+                if entry is not None:
+                    ixf.write(INDEX_ENTRY.pack(position + len(separator), len(entry)))
+                    num_entries += 1
+                    chunk = f"{separator}{entry}"
+                else:
+                    chunk = separator
+                jf.write(chunk.encode("ascii"))
+                position += len(chunk)
+            jf.close()
+            header = index_header(fh, position, num_entries, jf.blocks, jf.digest)
+        for block in jf.blocks:
+            ixf.write(BLOCK_ENTRY.pack(*block))
+        ixf.seek(0)
+        ixf.write(header)
+
+    if (max_entries or max_bytes) and isinstance(json_object, (list, tuple, Iterator)):
+        write_shards(filename, max_entries, max_bytes, compression)
+    else:
+        remove_shards(filename)
+
+class BlockWriter:
+    """
+    A class that writes text to a binary file, compressed as independent
+    blocks when compression is set, and hashes the bytes written.
+
+    Text is compressed a block at a time once BLOCK_SIZE bytes of it are
+    pending, so blocks start where a write does. gzip blocks are members of
+    level 6 without a timestamp, so unchanged data gives an unchanged file,
+    and zstd blocks are frames.
+
+    Attributes
+    ----------
+    blocks: list
+        (offset in the file, offset in the text) of each block
+    compress: callable
+        compresses a block, None when the file is not compressed
+    digest: hashlib hash
+        SHA-256 hash of the bytes written to the file
+    fh: file object
+        binary file to write to
+    pending: list
+        text not compressed yet
+    pending_size: int
+        size of the pending text
+    position: int
+        size of the text compressed
+    size: int
+        number of bytes written to the file
+
+    Methods
+    -------
+    close()
+        compresses the pending text, leaving the file open
+    write(data)
+        writes text
+    """
+
+    def __init__(self, fh, compression):
+        """
+        Parameters
+        ----------
+        fh: file object
+            binary file to write to
+        compression: str
+            None, "gzip" or "zstd"
+        """
+
+        if compression is None:
+            self.compress = None
+        elif compression == "gzip":
+            self.compress = lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+        elif compression == "zstd":
+            if zstandard is None:
+                raise ValueError("zstd compression needs the zstandard package.")
+            self.compress = zstandard.ZstdCompressor().compress
+        else:
+            raise ValueError(f"Unknown compression: {compression}.")
+        self.fh = fh
+        self.digest = hashlib.sha256()
+        self.blocks = []
+        self.pending = []
+        self.pending_size = 0
+        self.position = 0
+        self.size = 0
+
+    def write(self, data):
+        """Write text encoded as bytes."""
+
+        if self.compress is None:
+            self.write_bytes(data)
+            return
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= BLOCK_SIZE:
+            self.write_block()
+
+    def close(self):
+        """Compress the pending text, leaving the file open."""
+
+        if self.pending:
+            self.write_block()
+
+    def write_block(self):
+        """Compress the pending text as a block."""
+
+        self.blocks.append((self.size, self.position))
+        self.position += self.pending_size
+        self.write_bytes(self.compress(b"".join(self.pending)))
+        self.pending = []
+        self.pending_size = 0
+
+    def write_bytes(self, data):
+        """Write bytes to the file."""
+
+        self.digest.update(data)
+        self.fh.write(data)
+        self.size += len(data)
+
+def open_json(filename):
+    """Open a JSON file for binary reading, decompressing it if it starts
+    with gzip or zstd magic bytes.
+
+    Parameters
+    ----------
+    filename: Path
+        path to JSON file
+    """
+
+    with open(filename, "rb") as fh:
+        magic = fh.read(len(ZSTD_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(filename, "rb")
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError(f"{filename} is zstd compressed, reading it needs the zstandard package.")
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), closefd=True, read_across_frames=True)
+    return open(filename, "rb")
+
+def decompressed_reader(fh, filename):
+    """Return a reader of the decompressed bytes of a binary file from its
+    current position, fh itself when the bytes there are not compressed.
+    Closing the reader leaves fh open, use it as a context manager.
+
+    Parameters
+    ----------
+    fh: file object
+        binary file, positioned at the start of a gzip member, a zstd frame
+        or text
+    filename: Path
+        path to the file, for errors
+    """
+
+    position = fh.tell()
+    magic = fh.read(len(ZSTD_MAGIC))
+    fh.seek(position)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=fh, mode="rb")
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError(f"{filename} is zstd compressed, reading it needs the zstandard package.")
+        return zstandard.ZstdDecompressor().stream_reader(fh, closefd=False, read_across_frames=True)
+    return contextlib.nullcontext(fh)
+
+def load_json(filename):
+    """Load a JSON file, compressed or not.
+
+    Parameters
+    ----------
+    filename: Path
+        path to JSON file
+    """
+
+    with open_json(filename) as jf:
+        return json.load(jf)
+
+def write_shards(filename, max_entries=None, max_bytes=None, compression=None):
+    """Split the list of a JSON file written by write_json into shards.
+
+    Shards hold consecutive entries, at most max_entries of them and at most
+    max_bytes of entry text, and at least one entry whatever its size, so
+    the same file always gives the same shards. Each shard is a JSON list
+    file with an index, e.g. reaches_na.00002.json, and a manifest,
+    e.g. reaches_na.manifest.json, gives the first entry of each shard.
+    read_shard_entry finds an entry's shard with it. Shards are compressed
+    in blocks as write_json compresses files, the manifest is not.
+
+    Parameters
+    ----------
+    filename: Path
+        path to JSON file
+    max_entries: int
+        most entries per shard (optional)
+    max_bytes: int
+        most entry bytes per shard (optional)
+    compression: str
+        "gzip" or "zstd" to compress the shards (optional)
+    """
+
+    filename = Path(filename)
+    with open(index_filename(filename), "rb") as ixf:
+        num_entries = INDEX_HEADER.unpack(ixf.read(INDEX_HEADER.size))[2]
+        index = list(INDEX_ENTRY.iter_unpack(ixf.read(num_entries * INDEX_ENTRY.size)))
+
+    starts = []
+    num_entries = num_bytes = 0
+    for i, (offset, length) in enumerate(index):
+        if not starts or (max_entries and num_entries == max_entries) \
+            or (max_bytes and num_bytes + length > max_bytes):
+            starts.append(i)
+            num_entries = num_bytes = 0
+        num_entries += 1
+        num_bytes += length
+
+    opening, separator, closing = f"[\n{INDENT}".encode(), f",\n{INDENT}".encode(), b"\n]"
+    shards = []
+    with open_json(filename) as jf:
+        for number, (start, stop) in enumerate(zip(starts, starts[1:] + [len(index)])):
+            # Entries of a shard are contiguous and separated as in the file,
+            # written one at a time so blocks start at entries
+            first = position = index[start][0]
+            jf.seek(first)
+            shard_file = shard_filename(filename, number)
+            with atomic_open(index_filename(shard_file), "wb") as sixf, atomic_open(shard_file, "wb") as sjf:
+                sixf.write(bytes(INDEX_HEADER.size))
+                sbf = BlockWriter(sjf, compression)
+                sbf.write(opening)
+                for offset, length in index[start:stop]:
+                    sbf.write(jf.read(offset + length - position))
+                    position = offset + length
+                    sixf.write(INDEX_ENTRY.pack(offset - first + len(opening), length))
+                sbf.write(closing)
+                sbf.close()
+                text_length = len(opening) + position - first + len(closing)
+                header = index_header(sjf, text_length, stop - start, sbf.blocks, sbf.digest)
+                for block in sbf.blocks:
+                    sixf.write(BLOCK_ENTRY.pack(*block))
+                sixf.seek(0)
+                sixf.write(header)
+            shards.append({"file": shard_file.name, "start": start, "num_entries": stop - start})
+
+    # Shards left from a run that wrote more of them
+    remove_shards(filename, len(shards))
+
+    manifest = {
+        "file": filename.name,
+        "num_entries": len(index),
+        "max_entries": max_entries,
+        "max_bytes": max_bytes,
+        "shards": shards
+    }
+    write_json(manifest, manifest_filename(filename))
+
+def remove_shards(filename, first=0):
+    """Remove the shards of a JSON file from shard number first on, and its
+    manifest when first is 0.
+
+    Parameters
+    ----------
+    filename: Path
+        path to JSON file
+    first: int
+        number of the first shard to remove
+    """
+
+    stale_files = [manifest_filename(filename), index_filename(manifest_filename(filename))] if first == 0 else []
+    number = first
+    while shard_filename(filename, number).exists():
+        stale_files.extend([shard_filename(filename, number), index_filename(shard_filename(filename, number))])
+        number += 1
+    for stale_file in stale_files:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(stale_file)
+
+def shard_filename(filename, number):
+    """Return the path to a shard of a JSON file."""
+
+    filename = Path(filename)
+    return filename.with_name(f"{filename.stem}.{number:05d}{filename.suffix}")
+
+def manifest_filename(filename):
+    """Return the path to the shard manifest of a JSON file."""
+
+    filename = Path(filename)
+    return filename.with_name(f"{filename.stem}.manifest{filename.suffix}")
+
+def read_shard_entry(manifest_file, index):
+    """Read one entry of a sharded JSON list, reading only the manifest and
+    the entry's shard.
+
+    Parameters
+    ----------
+    manifest_file: Path
+        path to shard manifest
+    index: int
+        position of the entry in the whole list, negative counts from the end
+    """
+
+    manifest_file = Path(manifest_file)
+    with open(manifest_file) as jf:
+        manifest = json.load(jf)
+    num_entries = manifest["num_entries"]
+    if index < 0:
+        index += num_entries
+    if not 0 <= index < num_entries:
+        raise IndexError(f"{manifest['file']} has no entry {index}, it has {num_entries} entries.")
+    shard = manifest["shards"][bisect.bisect_right([shard["start"] for shard in manifest["shards"]], index) - 1]
+    return read_json_entry(manifest_file.with_name(shard["file"]), index - shard["start"])
+
+def index_filename(filename):
+    """Return the path to the index of a JSON file."""
+
+    filename = Path(filename)
+    return filename.with_name(f"{filename.name}.idx")
+
+def index_header(fh, length, num_entries, blocks, digest):
+    """Return the index header of a JSON file written to a binary file.
+
+    Parameters
+    ----------
+    fh: file object
+        JSON file, fully written but not closed
+    length: int
+        length of the uncompressed JSON text
+    num_entries: int
+        number of top-level entries
+    blocks: list
+        compressed blocks of the file, empty if it is not compressed
+    digest: hashlib hash
+        SHA-256 hash of the bytes written to fh
+    """
+
+    fh.flush()
+    stat = os.fstat(fh.fileno())
+    return INDEX_HEADER.pack(INDEX_MAGIC, length, num_entries, len(blocks), stat.st_size, stat.st_ino,
+                             stat.st_mtime_ns, digest.digest())
+
+def index_matches(header, fh):
+    """Return True if an index header was written with the JSON file open in
+    fh.
+
+    The size, inode and modification time of the file are compared first;
+    when only the size matches, e.g. for a copy, the file is hashed.
+
+    Parameters
+    ----------
+    header: tuple
+        unpacked INDEX_HEADER
+    fh: file object
+        JSON file opened for binary reading
+    """
+
+    magic, _, _, _, size, inode, mtime, file_hash = header
+    stat = os.fstat(fh.fileno())
+    if magic != INDEX_MAGIC or stat.st_size != size:
+        return False
+    if (stat.st_ino, stat.st_mtime_ns) == (inode, mtime):
+        return True
+    digest = hashlib.sha256()
+    fh.seek(0)
+    for block in iter(lambda: fh.read(BUFFER_SIZE), b""):
+        digest.update(block)
+    return digest.digest() == file_hash
+
+def read_json_entry(filename, index):
+    """Read one top-level entry of a JSON file written by write_json without
+    parsing the rest of the file. Only the block of a compressed file that
+    holds the entry is decompressed.
+
+    When the index was not written with the file, e.g. a reader that opens
+    the file between the replacement of the file and of its index, the
+    whole file is parsed instead.
+
+    Parameters
+    ----------
+    filename: Path
+        path to JSON file
+    index: int
+        position of the entry, negative counts from the end
+
+    Returns
+    -------
+    the list entry, or a (key, value) tuple for a dictionary entry
+    """
+
+    with open(filename, "rb") as fh, open(index_filename(filename), "rb") as ixf:
+        header = ixf.read(INDEX_HEADER.size)
+        if len(header) < INDEX_HEADER.size or not index_matches(INDEX_HEADER.unpack(header), fh):
+            return parsed_entry(filename, index)
+        num_entries, num_blocks = INDEX_HEADER.unpack(header)[2:4]
+        if index < 0:
+            index += num_entries
+        if not 0 <= index < num_entries:
+            raise IndexError(f"{filename} has no entry {index}, it has {num_entries} entries.")
+        ixf.seek(INDEX_HEADER.size + index * INDEX_ENTRY.size)
+        offset, length = INDEX_ENTRY.unpack(ixf.read(INDEX_ENTRY.size))
+        ixf.seek(INDEX_HEADER.size + num_entries * INDEX_ENTRY.size)
+        blocks = list(BLOCK_ENTRY.iter_unpack(ixf.read(num_blocks * BLOCK_ENTRY.size))) or [(0, 0)]
+
+        fh.seek(0)
+        with decompressed_reader(fh, filename) as jf:
+            opening = jf.read(1)
+        block_offset, text_offset = blocks[bisect.bisect_right([block[1] for block in blocks], offset) - 1]
+        fh.seek(block_offset)
+        with decompressed_reader(fh, filename) as jf:
+            jf.seek(offset - text_offset)
+            entry = jf.read(length)
+    if opening == b"{":
+        return next(iter(json.loads(b"{" + entry + b"}").items()))
+    return json.loads(entry)
+
+def parsed_entry(filename, index):
+    """Return one top-level entry of a JSON file by parsing the whole file,
+    as read_json_entry does.
+
+    Parameters
+    ----------
+    filename: Path
+        path to JSON file
+    index: int
+        position of the entry, negative counts from the end
+    """
+
+    json_object = load_json(filename)
+    if isinstance(json_object, dict):
+        entries = list(json_object.items())
+    elif isinstance(json_object, list):
+        entries = json_object
+    else:
+        entries = [json_object]
+    if index < 0:
+        index += len(entries)
+    if not 0 <= index < len(entries):
+        raise IndexError(f"{filename} has no entry {index}, it has {len(entries)} entries.")
+    return entries[index]
+
+@contextlib.contextmanager
+def atomic_open(filename, mode="w"):
+    """Open a temporary file next to filename that replaces it on success.
+
+    Readers see either the previous file or the complete new one, never a
+    partially written file. The temporary file is removed on error.
+
+    Parameters
+    ----------
+    filename: Path
+        path to file
+    mode: str
+        "w" for text or "wb" for binary
+    """
+
+    filename = Path(filename)
+    fd, temp_name = tempfile.mkstemp(dir=filename.parent, prefix=f".{filename.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, buffering=BUFFER_SIZE) as fh:
+            yield fh
+        # mkstemp creates the file readable by its owner only
+        os.chmod(temp_name, 0o666 & ~UMASK)
+        os.replace(temp_name, filename)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_name)
+        raise
+
+def iter_json(json_object):
+    """Yield the JSON text of json_object one top-level entry at a time.
+
+    Parameters
+    ----------
+    json_object: list, dict or generator
+        JSON data, a generator is written as a list
+    """
+
+    for separator, entry in iter_entries(json_object):
+        yield separator if entry is None else f"{separator}{entry}"
+
+def iter_entries(json_object):
+    """Yield the JSON text of json_object as (separator, entry) pairs, the
+    text before each top-level entry and the entry, with a None entry for
+    the closing text.
+
+    Parameters
+    ----------
+    json_object: list, dict or generator
+        JSON data, a generator is written as a list
+    """
+
+    if isinstance(json_object, dict):
+        opening, closing = "{", "}"
+        entries = (f"{encode_key(key)}: {encode(value, 1)}" for key, value in json_object.items())
+    elif isinstance(json_object, (list, tuple, Iterator)):
+        opening, closing = "[", "]"
+        entries = (encode(value, 1) for value in json_object)
+    else:
+        yield "", encode(json_object, 0)
+        return
+
+    first = True
+    for entry in entries:
+        yield (f"{opening}\n{INDENT}" if first else f",\n{INDENT}"), entry
+        first = False
+    yield (f"{opening}{closing}" if first else f"\n{closing}"), None
+
+def encode(value, level):
+    """Return the JSON text of a value nested level deep."""
+
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, int):
+        return int.__repr__(value)
+    if isinstance(value, float):
+        return json.dumps(value)
+
+    newline = f"\n{INDENT * (level + 1)}"
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return "[]"
+        return f"[{newline}{f',{newline}'.join([encode(item, level + 1) for item in value])}\n{INDENT * level}]"
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        items = [f"{encode_key(key)}: {encode(item, level + 1)}" for key, item in value.items()]
+        return f"{{{newline}{f',{newline}'.join(items)}\n{INDENT * level}}}"
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+def encode_key(key):
+    """Return the JSON text of a dictionary key, converted the way json does."""
+
+    if isinstance(key, str):
+        return encode_basestring_ascii(key)
+    if isinstance(key, float):
+        return encode_basestring_ascii(json.dumps(key))
+    if key is True:
+        return '"true"'
+    if key is False:
+        return '"false"'
+    if key is None:
+        return '"null"'
+    if isinstance(key, int):
+        return f'"{int.__repr__(key)}"'
+    raise TypeError(f"keys must be str, int, float, bool or None, not {key.__class__.__name__}")
@@ -1,14 +1,14 @@
 # Standard imports
+from concurrent.futures import ThreadPoolExecutor
 import zipfile
 
 # Third-party imports
 import fsspec
-import requests
-import pandas as pd
-import shapefile
+import numpy as np
 
 # Local imports
-from conf_lake import conf
+from datagen.Columnar import list_column, string_column
+from datagen.Dbf import read_dbf_column
 
 class Lake:
     """
@@ -19,16 +19,38 @@ class Lake:
 
     Attributes
     ----------
+    creds: dictionary
+        Dictionary of S3 endpoint credentials
     lake_ids: list
         list of lake identifiers
+    lake_list: numpy.ndarray
+        lake identifiers to keep, None to keep every lake
+    lake_offsets: numpy.ndarray
+        the shapefiles of lake i are shapefiles[lake_files[lake_offsets[i]:lake_offsets[i+1]]]
+    lake_files: numpy.ndarray
+        shapefile indexes of each lake in lake_ids order
+    shapefiles: list
+        List of SWOT lake shapefiles
+    workers: int
+        number of threads to read shapefiles with
     
     Methods
     -------
-    extract_data()
-        extracts reach identifier and maps to file name 
+    extract_aws()
+        extracts lake identifiers from shapefiles in S3
+    extract_local()
+        extracts lake identifiers from local shapefiles
+    extract(open_shapefile)
+        extracts lake identifiers from shapefiles opened with open_shapefile
+    read_lake_ids(shpfile, open_shapefile)
+        reads the lake identifiers of a shapefile
+    get_lake_s3()
+        returns the shapefiles of each lake identifier
+    get_lake_s3_columns()
+        returns the shapefiles of each lake identifier as a table of columns
     """
 
-    def __init__(self, shapefiles, creds=None):
+    def __init__(self, shapefiles, creds=None, workers=None, lake_list=None):
         """
         Parameters
         ----------
@@ -36,11 +58,22 @@ class Lake:
             Dictionary of S3 endpoint credentials
         shapefiles: list
             List of SWOT lake shapefiles
+        workers: int
+            number of threads to read shapefiles with, None for the
+            ThreadPoolExecutor default
+        lake_list: list
+            lake identifiers to keep, None to keep every lake
         """
         
         self.creds = creds
         self.lake_ids = []
+        self.lake_offsets = np.zeros(1, dtype=np.int64)
+        self.lake_files = np.array([], dtype=np.int64)
         self.shapefiles = shapefiles
+        self.workers = workers
+        self.lake_list = None
+        if lake_list is not None:
+            self.lake_list = np.unique(np.asarray(lake_list, dtype=str))
 
     def extract_aws(self):
         """Extracts lake identifier from shapefiles stored in AWS S3 bucket.
@@ -48,26 +81,9 @@ class Lake:
         Populates lake_id attribute.
         """
 
-        for shpfile in self.shapefiles:
-            # Open S3 zip file
-            with fsspec.open(f"{shpfile}", mode="rb", anon=False, 
-                key=self.creds["accessKeyId"], secret=self.creds["secretAccessKey"], 
-                token=self.creds["sessionToken"]) as shpfh:
-
-                # Locate and open DBF file
-                dbf_file = f"{shpfile.split('/')[-1].split('.')[0]}.dbf"            
-                zip_file = zipfile.ZipFile(shpfh, 'r')
-                with zip_file.open(dbf_file) as dbf:
-                    sf = shapefile.Reader(dbf=dbf)
-                    fieldnames = [f[0] for f in sf.fields[1:]]
-                    records = sf.records()
-                    df = pd.DataFrame(columns=fieldnames, data=records)
-                    self.lake_ids.extend(df["lake_id"].tolist())        
-                
-        # Remove duplicates from multiple files
-        self.lake_ids = list(set(self.lake_ids))
-        self.lake_ids.sort()
-        return self.lake_ids
+        return self.extract(lambda shpfile: fsspec.open(f"{shpfile}", mode="rb", anon=False, 
+            key=self.creds["accessKeyId"], secret=self.creds["secretAccessKey"], 
+            token=self.creds["sessionToken"]))
     
     def extract_local(self):
         """Extracts lake identifier from shapefiles on local file system.
@@ -75,19 +91,68 @@ class Lake:
         Populates lake_id attribute.
         """
         
-        for shpfile in self.shapefiles:
+        return self.extract(lambda shpfile: open(shpfile, "rb"))
+
+    def extract(self, open_shapefile):
+        """Extracts lake identifiers from shapefiles, several at a time.
+        
+        Populates lake_id attribute and the shapefiles of each lake.
 
+        Parameters
+        ----------
+        open_shapefile: function
+            opens a shapefile zip for binary reading
+        """
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            lake_ids = list(executor.map(lambda shpfile: self.read_lake_ids(shpfile, open_shapefile), self.shapefiles))
+
+        if not lake_ids:
+            return self.lake_ids
+
+        # Remove duplicates from multiple files
+        unique_ids, lake_index = np.unique(np.concatenate(lake_ids), return_inverse=True)
+        self.lake_ids = unique_ids.tolist()
+
+        # Lake and shapefile pairs sorted by lake and then shapefile
+        num_files = len(lake_ids)
+        file_index = np.repeat(np.arange(num_files), [len(ids) for ids in lake_ids])
+        pairs = np.unique(lake_index.astype(np.int64) * num_files + file_index)
+        self.lake_files = pairs % num_files
+        self.lake_offsets = np.searchsorted(pairs // num_files, np.arange(len(unique_ids) + 1))
+        return self.lake_ids
+
+    def read_lake_ids(self, shpfile, open_shapefile):
+        """Return the lake identifiers of a shapefile as an array, only those
+        of lake_list when it is set.
+
+        Parameters
+        ----------
+        shpfile: str
+            path or URI of shapefile zip
+        open_shapefile: function
+            opens a shapefile zip for binary reading
+        """
+
+        with open_shapefile(shpfile) as shpfh:
             # Locate and open DBF file
             dbf_file = f"{shpfile.split('/')[-1].split('.')[0]}.dbf"            
-            zip_file = zipfile.ZipFile(shpfile, 'r')
-            with zip_file.open(dbf_file) as dbf:
-                sf = shapefile.Reader(dbf=dbf)
-                fieldnames = [f[0] for f in sf.fields[1:]]
-                records = sf.records()
-                df = pd.DataFrame(columns=fieldnames, data=records)
-                self.lake_ids.extend(df["lake_id"].tolist())        
-                
-        # Remove duplicates from multiple files
-        self.lake_ids = list(set(self.lake_ids))
-        self.lake_ids.sort()
-        return self.lake_ids
\ No newline at end of file
+            with zipfile.ZipFile(shpfh, 'r') as zip_file, zip_file.open(dbf_file) as dbf:
+                lake_ids = read_dbf_column(dbf, "lake_id")
+
+        if self.lake_list is None:
+            return lake_ids
+        return lake_ids[np.isin(lake_ids.astype(str), self.lake_list)]
+
+    def get_lake_s3(self):
+        """Return a dictionary of lake identifier keys and shapefile list values."""
+
+        shapefiles = np.asarray(self.shapefiles, dtype=str)[self.lake_files].tolist()
+        offsets = self.lake_offsets.tolist()
+        return {lake_id: shapefiles[offsets[i]:offsets[i + 1]] for i, lake_id in enumerate(self.lake_ids)}
+
+    def get_lake_s3_columns(self):
+        """Return the shapefiles of each lake identifier as a table of columns."""
+
+        return {**string_column("lake_id", self.lake_ids),
+                **list_column("s3", self.lake_offsets, np.asarray(self.shapefiles, dtype=str)[self.lake_files])}
@@ -1,3 +1,6 @@
+# Local imports
+from datagen.Columnar import int_column, string_column
+
 class Reach:
     """
     A class that maps reach identifiers to SWOT reach, SWOT node, and SoS data 
@@ -21,6 +24,10 @@ class Reach:
     -------
     extract_data()
         extracts reach identifier and maps to file name 
+    iter_data()
+        yields each reach identifier mapped to file names
+    get_columns()
+        returns reach identifiers and file names as a table of columns
     """
 
     def __init__(self, reach_ids, sword_filename, sos_filename):
@@ -43,11 +50,28 @@ class Reach:
         """
         
         # Extract reach data
+        self.reach_data.extend(self.iter_data())
+        return self.reach_data
+    
+    def iter_data(self):
+        """Yields the SWOT, SoS and SWORD files of each reach identifier."""
+        
         for reach_id in self.reach_ids:
-            self.reach_data.append({
+            yield {
                 "reach_id": int(reach_id), 
                 "sword": self.sword_filename,
                 "swot": f"{reach_id}_SWOT.nc",
                 "sos": self.sos_filename
-            })
-        return self.reach_data
\ No newline at end of file
+            }
+    
+    def get_columns(self):
+        """Returns the SWOT, SoS and SWORD files of each reach identifier as a
+        table of columns."""
+        
+        num_reaches = len(self.reach_ids)
+        return {
+            **int_column("reach_id", self.reach_ids),
+            **string_column("sword", [self.sword_filename] * num_reaches),
+            **string_column("swot", [f"{reach_id}_SWOT.nc" for reach_id in self.reach_ids]),
+            **string_column("sos", [self.sos_filename] * num_reaches)
+        }
@@ -1,5 +1,9 @@
-# Standard imports
-import re
+# Third-party imports
+import netCDF4
+import numpy as np
+
+# Local imports
+from datagen.Columnar import int_column, list_column
 
 class ReachNode:
     """
@@ -9,42 +13,119 @@ class ReachNode:
 
     Attributes
     ----------
-    node_ids: list
-        list of node identifiers
-    reach_ids: list
-        list of reach identifiers
+    grouped_nodes: tuple
+        node identifiers grouped by reach, set by group_nodes
+    node_ids: numpy.ndarray
+        array of integer node identifiers, None to take every SWORD node
+    reach_ids: numpy.ndarray
+        array of integer reach identifiers
     reach_node_data: dict
         dictionary of data to be written to json file
+    sword_file: Path
+        path to SWORD file to take nodes from, None to take them from node_ids
     
     Methods
     -------
     extract_data()
         extracts node identifiers and maps to reach identifiers
+    iter_data()
+        yields each reach identifier with its node identifiers
+    get_columns()
+        returns reach and node identifiers as a table of columns
+    group_nodes()
+        groups node identifiers by reach
     """
 
-    def __init__(self, reach_ids, node_ids):
+    def __init__(self, reach_ids, node_ids, sword_file=None):
         """
         Parameters
         ----------
-        json_file: Path
-            path to JSON file to write JSON data to
-        sword_dir: Path
-            path to SWORD directory containing NetCDF files
+        reach_ids: numpy.ndarray
+            array of integer reach identifiers
+        node_ids: numpy.ndarray
+            array of integer node identifiers
+        sword_file: Path
+            path to SWORD file to take nodes from (optional)
         """
 
+        self.grouped_nodes = None
         self.node_ids = node_ids
         self.reach_ids = reach_ids
         self.reach_node_data = []
+        self.sword_file = sword_file
 
     def extract_data(self):
-        """Extracts reach and node identifiers from SWORD.
+        """Extracts reach and node identifiers.
+        
+        Populates reach_node_data attribute.
+        """
+        
+        self.reach_node_data.extend(self.iter_data())
+        return self.reach_node_data
+    
+    def iter_data(self):
+        """Yields each reach identifier with its node identifiers."""
+        
+        node_ids, start, end = self.group_nodes()
+        nodes = node_ids.tolist()
+        for reach_id, i, j in zip(np.asarray(self.reach_ids).tolist(), start.tolist(), end.tolist()):
+            yield [str(reach_id), [str(node_id) for node_id in nodes[i:j]]]
+    
+    def get_columns(self):
+        """Returns reach identifiers and their node identifiers as a table of
+        columns, node identifiers stored as offsets and values."""
+        
+        node_ids, start, end = self.group_nodes()
+        lengths = end - start
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        items = np.repeat(start - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return {**int_column("reach_id", self.reach_ids),
+                **list_column("node_id", offsets, node_ids[items])}
+    
+    def group_nodes(self):
+        """Groups node identifiers by reach.
         
-        Populates json_data attribute.
+        The grouping is computed once and kept, so iter_data and get_columns
+        read the SWORD nodes group a single time.
+        
+        Nodes come from the SWORD nodes group when sword_file is set, limited
+        to node_ids, the nodes observed in Node shapefiles, when it is not
+        None. Otherwise they are node_ids, matched to reaches by the first 10
+        digits they share with them.
+        
+        Returns
+        -------
+        node_ids: numpy.ndarray
+            node identifiers sorted by reach and node
+        start: numpy.ndarray
+            index of the first node of each reach in reach_ids
+        end: numpy.ndarray
+            index after the last node of each reach in reach_ids
         """
         
-        for reach_id in self.reach_ids:
-            reach_r = re.compile(f"^{reach_id[:10]}.*")
-            nodes = list(filter(reach_r.match, self.node_ids))
-            self.reach_node_data.append([reach_id, nodes])
+        if self.grouped_nodes is not None:
+            return self.grouped_nodes
+        
+        reach_ids = np.asarray(self.reach_ids).astype(np.int64)
+        if self.sword_file:
+            with netCDF4.Dataset(self.sword_file) as sword:
+                node_id = np.ma.getdata(sword["nodes/node_id"][:]).astype(np.int64)
+                node_reach_id = np.ma.getdata(sword["nodes/reach_id"][:]).astype(np.int64)
+            
+            if self.node_ids is not None:
+                observed = np.isin(node_id, np.asarray(self.node_ids).astype(np.int64))
+                node_id = node_id[observed]
+                node_reach_id = node_reach_id[observed]
+            
+            # Sort nodes by reach and then node
+            order = np.lexsort((node_id, node_reach_id))
+            node_id, node_keys, reach_keys = node_id[order], node_reach_id[order], reach_ids
+        else:
+            node_id = np.sort(np.asarray(self.node_ids).astype(np.int64))
+            node_keys, reach_keys = node_id // 10**4, reach_ids // 10
         
-        return self.reach_node_data
\ No newline at end of file
+        start = np.searchsorted(node_keys, reach_keys, side="left")
+        end = np.searchsorted(node_keys, reach_keys, side="right")
+        self.grouped_nodes = (node_id, start, end)
+        return self.grouped_nodes
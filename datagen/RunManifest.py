@@ -0,0 +1,209 @@
+# Standard imports
+import hashlib
+import json
+from pathlib import Path
+
+# Local imports
+from datagen.JsonWriter import atomic_open
+
+# Size of the blocks files are hashed in
+HASH_BLOCK_SIZE = 1 << 20
+
+class RunManifest:
+    """
+    A class that records a content hash of the inputs and outputs of each
+    stage of a run, so that running again skips the stages whose inputs are
+    unchanged.
+
+    A stage's input hash covers the files and code it reads, the argument
+    values it uses and the output hashes of the stages it depends on. A
+    stage runs when its input hash differs from the recorded one or one of
+    its recorded outputs is missing. With from_stage that stage and every
+    later one run and earlier ones are skipped; with only the stages listed
+    run and the others are skipped. Skipped stages must have run before.
+
+    The manifest is written after every stage, so an interrupted run picks
+    up after the last stage that finished.
+
+    Attributes
+    ----------
+    filename: Path
+        path to JSON manifest file
+    force: set
+        stages to run whatever their input hash
+    hashes: dict
+        dictionary of (path, size, modification time) keys and file hash
+        values, so each file is read once
+    records: dict
+        dictionary of stage keys and recorded input hash, output hash and
+        output files values
+    skip: set
+        stages not to run
+    stages: dict
+        dictionary of stage keys, in run order, and (upstream stages, code
+        files) values
+
+    Methods
+    -------
+    file_hash(path)
+        returns the hash of a file's contents
+    inputs_hash(stage, files, values)
+        returns the input hash of a stage
+    record(stage, inputs, outputs)
+        records a stage that ran
+    run(stage, files, values, outputs, function)
+        runs a stage unless its inputs are unchanged
+    """
+
+    def __init__(self, filename, stages, from_stage=None, only=None):
+        """
+        Parameters
+        ----------
+        filename: Path
+            path to JSON manifest file, read if it exists
+        stages: dict
+            dictionary of stage keys, in run order, and (upstream stages,
+            code files) values
+        from_stage: str
+            stage to start running from (optional)
+        only: list
+            stages to run, skipping the others (optional)
+        """
+
+        for stage in ([from_stage] if from_stage else []) + list(only or []):
+            if stage not in stages:
+                raise ValueError(f"Unknown stage {stage}, choose from: {', '.join(stages)}.")
+
+        self.filename = Path(filename)
+        self.stages = stages
+        self.hashes = {}
+        self.records = {}
+        if self.filename.exists():
+            with open(self.filename) as jf:
+                self.records = json.load(jf)
+
+        self.force = forced_stages(stages, from_stage, only)
+        self.skip = set(stages) - self.force if (from_stage or only) else set()
+
+    def file_hash(self, path):
+        """Return the SHA-256 hash of a file's contents, None if it does not
+        exist."""
+
+        path = Path(path)
+        if not path.is_file():
+            return None
+        stat = path.stat()
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        if key not in self.hashes:
+            digest = hashlib.sha256()
+            with open(path, "rb") as fh:
+                for block in iter(lambda: fh.read(HASH_BLOCK_SIZE), b""):
+                    digest.update(block)
+            self.hashes[key] = digest.hexdigest()
+        return self.hashes[key]
+
+    def inputs_hash(self, stage, files, values):
+        """Return the hash of a stage's input files, code files, argument
+        values and upstream stage outputs.
+
+        Parameters
+        ----------
+        stage: str
+            stage name
+        files: list
+            paths of the files the stage reads
+        values: dict
+            JSON serializable values the stage's outputs depend on
+        """
+
+        upstream, code = self.stages[stage]
+        inputs = {
+            "files": {str(path): self.file_hash(path) for path in files},
+            "code": {str(path): self.file_hash(path) for path in code},
+            "values": values,
+            "upstream": {name: self.records.get(name, {}).get("outputs") for name in upstream}
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+    def record(self, stage, inputs, outputs):
+        """Record the input hash and output files of a stage that ran and
+        write the manifest.
+
+        Parameters
+        ----------
+        stage: str
+            stage name
+        inputs: str
+            input hash of the stage
+        outputs: list
+            paths of the files the stage wrote, those that do not exist are
+            left out
+        """
+
+        files = [str(path) for path in outputs if Path(path).is_file()]
+        output_hashes = {path: self.file_hash(path) for path in files}
+        self.records[stage] = {
+            "inputs": inputs,
+            "outputs": hashlib.sha256(json.dumps(output_hashes, sort_keys=True).encode()).hexdigest(),
+            "files": files
+        }
+        with atomic_open(self.filename, "w") as jf:
+            json.dump(self.records, jf, indent=2)
+
+    def run(self, stage, files, values, outputs, function):
+        """Run a stage unless it is skipped or its inputs are unchanged.
+
+        Returns True if the stage ran.
+
+        Parameters
+        ----------
+        stage: str
+            stage name
+        files: list
+            paths of the files the stage reads
+        values: dict
+            JSON serializable values the stage's outputs depend on
+        outputs: list
+            paths of the files the stage writes
+        function: callable
+            function that runs the stage
+        """
+
+        inputs = self.inputs_hash(stage, files, values)
+        recorded = self.records.get(stage)
+        if stage in self.skip:
+            if recorded is None:
+                raise ValueError(f"Stage {stage} has not run yet and can't be skipped.")
+            print(f"Skipping stage {stage}.")
+            return False
+        if stage not in self.force and recorded and recorded["inputs"] == inputs \
+                and all(Path(path).is_file() for path in recorded["files"]):
+            print(f"Skipping stage {stage}, its inputs are unchanged.")
+            return False
+
+        print(f"Running stage {stage}.")
+        function()
+        self.record(stage, inputs, outputs)
+        return True
+
+def forced_stages(stages, from_stage=None, only=None):
+    """Return the stages that run whatever their input hash: those listed in
+    only, or from_stage and every later stage. The other stages are skipped
+    when either is set.
+
+    Parameters
+    ----------
+    stages: dict
+        dictionary of stage keys in run order
+    from_stage: str
+        stage to start running from (optional)
+    only: list
+        stages to run (optional)
+    """
+
+    names = list(stages)
+    if only:
+        return set(only)
+    if from_stage:
+        return set(names[names.index(from_stage):])
+    return set()
@@ -10,10 +10,12 @@ import os
 import boto3
 import botocore
 import requests
-import fnmatch
 import datetime
 from datetime import datetime, timedelta
 
+# Local imports
+from datagen.GranuleTable import GranuleTable
+
 class S3List:
     """Class used to query and download from PO.DAAC's CMR API."""
 
@@ -262,27 +264,20 @@ class S3List:
         """
         In some cases, when shapefiles are processed more than once they leave both processings in the bucket, so we need to filter them.
 
+        Keeps the highest product counter of each granule.
         """
-        parsed = []
-
-        for i in s3_urls:
-            # print(i[:-6])
-            # mult_process_bool = False
-            all_processings = fnmatch.filter(s3_urls, i[:-6]+'*')
-            if len(all_processings) > 1:
-                all_processings_nums = [int(i[-6:].replace('.zip', '')) for i in all_processings]
-                padded_max = str("{:02d}".format(max(all_processings_nums)))
-                max_path = fnmatch.filter(all_processings, f'*{padded_max}.zip')
-                parsed.append(max_path[0])
-                print('found a double', i)
-            else:
-                parsed.append(i)
+        granules = GranuleTable(s3_urls).unique()
+        parsed = granules.latest()
+        if len(parsed) < len(granules):
+            print('found doubles', len(granules) - len(parsed))
 
-        parsed = list(set(parsed))
-        return parsed
+        return parsed.tolist()
 
     def login_and_run_query(self, short_name, provider, temporal_range, continent, s3_endpoint, key):
-        """Log into CMR and run query to retrieve a list of S3 URLs."""
+        """Log into CMR and run query to retrieve a list of S3 URLs.
+
+        URLs are filtered by continent unless it is None.
+        """
 
         try:
             # Login and retrieve token
@@ -301,7 +296,8 @@ class S3List:
             # print(s3_urls[get_index])
             
             # Filter by continent
-            s3_urls = [s3 for s3 in s3_urls if continent in s3]
+            if continent is not None:
+                s3_urls = [s3 for s3 in s3_urls if continent in s3]
 
         except Exception as error:
             raise error
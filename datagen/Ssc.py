@@ -1,187 +1,435 @@
-from multiprocessing import Pool
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
 from pystac_client import Client  
 # from collections import defaultdict    
 # import json
 # import geopandas
 # from cartopy import crs
-import geopandas as gpd
 # import glob
 # import netCDF4
-import os
 import numpy as np
-import pandas as pd
-from shapely.geometry import Point, LineString, shape
-from itertools import repeat
+import shapely
+from shapely import STRtree
+from shapely.geometry import shape
 import netCDF4 as ncf
 from itertools import chain
 
 # Local importse
+from datagen.Columnar import list_offsets
 from datagen.S3List import S3List
-
-
-
-
-
-# find hls tiles given a point
-
-def find_hls_tiles(line_geo=False, band=False, limit=False, collections = ['HLSL30.v2.0', 'HLSS30.v2.0'], date_range = False):
-
-    STAC_URL = 'https://cmr.earthdata.nasa.gov/stac'
-
-
+from datagen.StacCache import StacCache
+
+# HLS collections searched for scenes
+HLS_COLLECTIONS = ['HLSL30.v2.0', 'HLSS30.v2.0']
+
+# LPCLOUD STAC catalog
+STAC_URL = 'https://cmr.earthdata.nasa.gov/stac'
+
+# Size in degrees of the grid cells that reaches are grouped into for STAC
+# searches, about that of an HLS (MGRS) tile
+FOOTPRINT_SIZE = 1.0
+
+# Items per page of asyncio searches
+STAC_PAGE_SIZE = 100
+
+# Requests in flight of asyncio searches
+STAC_CONCURRENCY = 32
+
+# Seconds an asyncio search request may take
+STAC_TIMEOUT = 300
+
+def get_reach_lines(sword_path, reach_ids):
+    """Return an array of the LineString of the first five SWORD nodes of
+    each reach, None for a reach with fewer than two nodes.
+
+    Every line is built in one call from the nodes grouped by reach.
+
+    Parameters
+    ----------
+    sword_path: str
+        path to SWORD file
+    reach_ids: numpy.ndarray
+        reach identifiers
+    """
+
+    with ncf.Dataset(sword_path, "r") as rootgrp:
+        node_reach_id = rootgrp['nodes/reach_id'][:].data.astype(np.int64)
+        node_x = rootgrp['nodes/x'][:].data
+        node_y = rootgrp['nodes/y'][:].data
+
+    # Nodes of each reach in file order
+    order = np.argsort(node_reach_id, kind='stable')
+    reach_ids = np.asarray(reach_ids).astype(np.int64)
+    start = np.searchsorted(node_reach_id[order], reach_ids, side='left')
+    end = np.searchsorted(node_reach_id[order], reach_ids, side='right')
+
+    # Up to five nodes of each reach with at least two
+    counts = np.minimum(end - start, 5)
+    valid = counts >= 2
+    counts = counts[valid]
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    nodes = order[np.repeat(start[valid] - offsets[:-1], counts) + np.arange(offsets[-1])]
+
+    lines = np.full(len(reach_ids), None, dtype=object)
+    if len(counts):
+        lines[valid] = shapely.linestrings(node_x[nodes], node_y[nodes],
+                                           indices=np.repeat(np.arange(len(counts)), counts))
+    return lines
+
+def plan_footprints(lines, footprint_size=FOOTPRINT_SIZE):
+    """Group reach lines by the grid cell of their first node.
+
+    Returns a dictionary of cell keys and (reach indexes, bounding box)
+    values, the bounding box covering every line of the cell.
+
+    Parameters
+    ----------
+    lines: numpy.ndarray
+        LineString of each reach, None for reaches without one
+    footprint_size: float
+        size of the grid cells in degrees
+    """
+
+    valid = np.flatnonzero(~shapely.is_missing(lines))
+    if len(valid) == 0:
+        return {}
+    first = shapely.get_coordinates(shapely.get_point(lines[valid], 0))
+    cells, inverse = np.unique(np.floor(first / footprint_size).astype(np.int64), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    bounds = shapely.bounds(lines[valid])
+
+    # Reaches of each cell, in reach order
+    order = np.argsort(inverse, kind='stable')
+    splits = np.flatnonzero(np.diff(inverse[order])) + 1
+    footprints = {}
+    for cell, members in zip(cells.tolist(), np.split(order, splits)):
+        cell_bounds = bounds[members]
+        bbox = [cell_bounds[:, 0].min(), cell_bounds[:, 1].min(), cell_bounds[:, 2].max(), cell_bounds[:, 3].max()]
+        footprints[tuple(cell)] = (valid[members].tolist(), [float(value) for value in bbox])
+    return footprints
+
+def search_footprint(catalog, bbox, window, collections=HLS_COLLECTIONS):
+    """Return the HLS items of a bounding box and time window as
+    dictionaries.
+
+    Parameters
+    ----------
+    catalog: pystac_client.Client
+        STAC catalog to search
+    bbox: list
+        min x, min y, max x and max y
+    window: str
+        start and end times separated by a comma
+    collections: list
+        STAC collections to search
+    """
+
+    search = catalog.search(collections=collections, bbox=bbox, datetime=window.replace(',', '/'))
+    return [item.to_dict() for item in search.item_collection()]
+
+def get_band_links(item):
+    """Return the links of the band assets of an HLS item."""
+
+    return [asset['href'] for key, asset in item['assets'].items() if key.startswith('B')]
+
+def match_items(items, members, lines):
+    """Return the index of each reach of a footprint with the band links of
+    the items that intersect its line.
+
+    Parameters
+    ----------
+    items: list
+        HLS items of a footprint
+    members: list
+        indexes of the reaches of the footprint
+    lines: list
+        LineString of each reach
+    """
+
+    if not items:
+        return []
+    tree = STRtree([shape(item['geometry']) for item in items])
+    band_links = [get_band_links(item) for item in items]
+    return [(i, [link for j in tree.query(lines[i], predicate='intersects').tolist() for link in band_links[j]])
+            for i in members]
+
+def line_errors(lines):
+    """Return a list of errors per reach, with an error for each reach
+    without a line."""
+
+    return [['reach has fewer than two SWORD nodes'] if missing else [] for missing in shapely.is_missing(lines)]
+
+def search_error(window, error):
+    """Return the error of a reach whose footprint search failed."""
+
+    return f'search of {window} failed: {error}'
+
+def report_errors(reach_ids, errors):
+    """Print each reach whose links could not all be found."""
+
+    for reach_id, reach_errors in zip(np.asarray(reach_ids).tolist(), errors):
+        if reach_errors:
+            print('error on ', reach_id)
+
+def build_scene_index(reach_ids, reach_links, errors):
+    """Return the index of the HLS scenes of each reach and of the reaches
+    of each scene, each scene a band link without its band suffix.
+
+    Scenes and reaches are stored once, in the scenes and reach_ids lists,
+    and referred to by their position: reach_scenes holds the scene indexes
+    of each reach and scene_reaches the reach indexes of each scene. errors
+    holds the errors of each reach whose links could not all be found, by
+    reach identifier.
+
+    Parameters
+    ----------
+    reach_ids: numpy.ndarray
+        reach identifiers
+    reach_links: list
+        set of links of each reach
+    errors: list
+        list of errors of each reach
+    """
+
+    reach_scenes = [sorted(set(link[:-10] for link in links)) for links in reach_links]
+    offsets, items = list_offsets(reach_scenes)
+    scenes, codes = np.unique(np.asarray(items, dtype=str), return_inverse=True)
+    reach_index = np.repeat(np.arange(len(reach_scenes)), np.diff(offsets))
+
+    # Reaches of each scene from the pairs sorted by scene and then reach
+    order = np.lexsort((reach_index, codes))
+    scene_offsets = np.searchsorted(codes[order], np.arange(len(scenes) + 1))
+    scene_reaches = reach_index[order].tolist()
+    codes = codes.tolist()
+
+    reach_ids = [str(reach_id) for reach_id in np.asarray(reach_ids).tolist()]
+    return {
+        "scenes": scenes.tolist(),
+        "reach_ids": reach_ids,
+        "reach_scenes": [codes[i:j] for i, j in zip(offsets[:-1].tolist(), offsets[1:].tolist())],
+        "scene_reaches": [scene_reaches[i:j] for i, j in zip(scene_offsets[:-1].tolist(), scene_offsets[1:].tolist())],
+        "errors": {reach_id: reach_errors for reach_id, reach_errors in zip(reach_ids, errors) if reach_errors}
+    }
+
+def find_reach_links(reach_ids, sword_path, temporal_range, footprint_size=FOOTPRINT_SIZE, workers=7, cache=None):
+    """Find the HLS band links of each reach with one STAC search per
+    footprint and 30 day window.
+
+    Reaches are grouped into footprints of neighbouring reaches, the items
+    of each footprint's bounding box are searched for once, and each reach
+    gets the items that intersect the LineString of its first five nodes,
+    the items a search on that LineString would return.
+
+    Returns the set of links of each reach and a list per reach of the
+    errors that kept its links from being found, empty when they were.
+
+    Parameters
+    ----------
+    reach_ids: numpy.ndarray
+        reach identifiers
+    sword_path: str
+        path to SWORD file
+    temporal_range: str
+        start and end times separated by a comma
+    footprint_size: float
+        size of the footprint grid cells in degrees
+    workers: int
+        number of searches to run at the same time
+    cache: StacCache
+        cache of search results to read and add to (optional)
+    """
+
+    lines = get_reach_lines(sword_path, reach_ids)
+    footprints = plan_footprints(lines, footprint_size)
+    windows = S3List().generate_time_search(temporal_range)
     catalog = Client.open(f'{STAC_URL}/LPCLOUD/')
-
-
-
-    # try:
-    #     x, y = point[0], point[1]
-    #     # print(x,y)
-    # except TypeError:
-    #     print("Point must be in the form of [lat,lon]")
-    #     raise
-
-    # point = geopandas.points_from_xy([x],[y])
-    # point = point[0]
-
-    # date_range = '2017-01-01T00:00:00Z/2018-12-31T23:59:59Z'
-    if date_range == False:
-# ['2020-01-01:00:00:00Z', '..']
-        # search = catalog.search(
-        #     collections=collections, intersects = line_geo, datetime=date_range.replace(',', '/'))
-        raise ValueError('Please supply a date for ssc...')
-    else:
-        all_temporal_ranges = S3List.generate_time_search(date_range)
-        links = []
-        for i in all_temporal_ranges:
-            search = catalog.search(
-                collections=collections, intersects = line_geo, datetime=i.replace(',', '/'))
-
-
-            # print(f'{search.matched()} Tiles Found...')
-
-
-            item_collection = search.get_all_items()
-
-            if limit:
-                item_collection = item_collection[:limit]
-
-            if band:
-                if type(band) == list:
-                    for i in item_collection:
-                        for b in band:
-                            link = i.assets[b].href
-                            # print(link)
-                            links.append(link)
-                
-                else:
-                    for i in item_collection:
-                        link = i.assets[band].href
-                        links.append(link)
-            
+    print(f'Searching {len(footprints)} footprints of {len(lines)} reaches over {len(windows)} windows...')
+
+    def search_task(task):
+        cell, window = task
+        bbox = footprints[cell][1]
+        try:
+            items = cache.get(bbox, HLS_COLLECTIONS, window) if cache else None
+            if items is None:
+                items = search_footprint(catalog, bbox, window)
+                if cache:
+                    cache.put(bbox, HLS_COLLECTIONS, window, items)
+            return items, None
+        except Exception as e:
+            print('error on footprint', bbox, window)
+            print(e)
+            return None, search_error(window, e)
+
+    reach_links = [set() for _ in lines]
+    errors = line_errors(lines)
+    tasks = [(cell, window) for cell in footprints for window in windows]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (cell, window), (items, error) in zip(tasks, executor.map(search_task, tasks)):
+            members = footprints[cell][0]
+            if error:
+                for i in members:
+                    errors[i].append(error)
             else:
-                for i in item_collection:
-                    # print(i.assets)
-                    for key in i.assets:
-                        if key.startswith('B'):
-                            # link = i.assets[key].href.replace('https://data.lpdaac.earthdatacloud.nasa.gov/', 's3://')
-                            link = i.assets[key].href
-
-                            # print(link)
-                            links.append(link)
-
-        return links
-
-def find_download_links_for_reach_tiles(data_dir, reach_id, cont, temporal_range):
+                for i, links in match_items(items, members, lines):
+                    reach_links[i].update(links)
+
+    report_errors(reach_ids, errors)
+    return reach_links, errors
+
+async def search_footprint_async(session, semaphore, bbox, window, collections=HLS_COLLECTIONS):
+    """Return the HLS items of a bounding box and time window as
+    dictionaries, following the catalog's next page links.
+
+    Each page request holds the semaphore, which bounds the requests in
+    flight across every search.
+
+    Parameters
+    ----------
+    session: aiohttp.ClientSession
+        session shared by the searches
+    semaphore: asyncio.Semaphore
+        semaphore shared by the searches
+    bbox: list
+        min x, min y, max x and max y
+    window: str
+        start and end times separated by a comma
+    collections: list
+        STAC collections to search
+    """
+
+    body = {'collections': collections, 'bbox': bbox, 'datetime': window.replace(',', '/'), 'limit': STAC_PAGE_SIZE}
+    request = {'method': 'POST', 'url': f'{STAC_URL}/LPCLOUD/search', 'json': body}
+    items = []
+    while request:
+        async with semaphore:
+            async with session.request(**request) as response:
+                response.raise_for_status()
+                page = await response.json(content_type=None)
+        items.extend(page.get('features', []))
+
+        request = None
+        for link in page.get('links', []):
+            if link.get('rel') == 'next':
+                if link.get('method', 'GET') == 'POST':
+                    next_body = {**body, **link['body']} if link.get('merge') else link.get('body', body)
+                    request = {'method': 'POST', 'url': link['href'], 'json': next_body}
+                else:
+                    request = {'method': 'GET', 'url': link['href']}
+    return items
+
+async def find_reach_links_async(reach_ids, sword_path, temporal_range, footprint_size=FOOTPRINT_SIZE,
+                                 concurrency=STAC_CONCURRENCY, cache=None):
+    """Find the HLS band links of each reach like find_reach_links, with
+    the searches run as asyncio tasks on one session.
+
+    At most concurrency requests are in flight. A new search only starts
+    when one finishes, so pending searches are not all held in memory at
+    once. Reading SWORD, grouping footprints, matching items to reaches and
+    the cache run in a small thread pool so they do not block the requests.
+
+    Returns the set of links of each reach and a list of errors per reach.
+
+    Parameters
+    ----------
+    reach_ids: numpy.ndarray
+        reach identifiers
+    sword_path: str
+        path to SWORD file
+    temporal_range: str
+        start and end times separated by a comma
+    footprint_size: float
+        size of the footprint grid cells in degrees
+    concurrency: int
+        number of requests in flight at the same time
+    cache: StacCache
+        cache of search results to read and add to (optional)
+    """
+
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        lines = await loop.run_in_executor(executor, get_reach_lines, sword_path, reach_ids)
+        footprints = await loop.run_in_executor(executor, plan_footprints, lines, footprint_size)
+        windows = S3List().generate_time_search(temporal_range)
+        print(f'Searching {len(footprints)} footprints of {len(lines)} reaches over {len(windows)} windows...')
+
+        reach_links = [set() for _ in lines]
+        errors = line_errors(lines)
+        requests = asyncio.Semaphore(concurrency)
+        searches = asyncio.Semaphore(concurrency)
+
+        async def search_task(cell, window):
+            members, bbox = footprints[cell]
+            try:
+                items = await loop.run_in_executor(executor, cache.get, bbox, HLS_COLLECTIONS, window) if cache else None
+                if items is None:
+                    items = await search_footprint_async(session, requests, bbox, window)
+                    if cache:
+                        await loop.run_in_executor(executor, cache.put, bbox, HLS_COLLECTIONS, window, items)
+                for i, links in await loop.run_in_executor(executor, match_items, items, members, lines):
+                    reach_links[i].update(links)
+            except Exception as e:
+                print('error on footprint', bbox, window)
+                print(e)
+                for i in members:
+                    errors[i].append(search_error(window, e))
+            finally:
+                searches.release()
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=STAC_TIMEOUT)) as session:
+            tasks = set()
+            for cell in footprints:
+                for window in windows:
+                    await searches.acquire()
+                    task = asyncio.create_task(search_task(cell, window))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+
+    report_errors(reach_ids, errors)
+    return reach_links, errors
+
+def ssc_process_continent(reach_ids, cont, data_dir, temporal_range, cache_file=None, concurrency=None):
+    """Return the HLS scenes of a continent's reaches, each scene a band link
+    without its band suffix, and the index of the scenes of each reach and
+    reaches of each scene from build_scene_index.
+
+    A reach whose links can not be found adds the placeholder 'foo', an
+    empty scene, to the list of scenes; its errors are in the index.
+
+    Parameters
+    ----------
+    reach_ids: numpy.ndarray
+        reach identifiers
+    cont: str
+        continent abbreviation
+    data_dir: str
+        path to SWORD file
+    temporal_range: str
+        start and end times separated by a comma
+    cache_file: Path
+        path to SQLite file to cache search results in (optional)
+    concurrency: int
+        search with asyncio with this many requests in flight, None to
+        search with a thread pool (optional)
+    """
+
+    cache = StacCache(cache_file) if cache_file else None
     try:
-        lat_list, lon_list = get_reach_node_cords(data_dir,reach_id, cont)
-        
-
-        df = pd.DataFrame(columns=['x', 'y'])
-        df['x'] = lat_list[:5]
-        df['y'] = lon_list[:5]
-        df['ID'] = reach_id
-        geometry = [Point(xy) for xy in zip(df.x, df.y)]
-
-        geo_df = gpd.GeoDataFrame(df, geometry=geometry)
-
-        geo_df2 = geo_df.groupby(['ID'])['geometry'].apply(lambda x: LineString(x.tolist()))
-        geo_df2 = gpd.GeoDataFrame(geo_df2, geometry='geometry')
-        line_geo = list(geo_df2.geometry.unique())[0]
-        links = find_hls_tiles(line_geo=line_geo, date_range=temporal_range)
-
-    except Exception as e:
-        links = ['foo']
-        print('error on ', reach_id)
-        print(e)
-
-    return list(set(links))
-
-
-
-
-
-def get_reach_node_cords(sword_path, reach_id, cont):
-
-    lat_list, lon_list = [], []
-
-    # sword_fp = os.path.join(data_dir, f'{cont.lower()}_sword_v15.nc')
-    # print(f'Searching across {len(files)} continents for nodes...')
-
-
-    rootgrp = ncf.Dataset(sword_path, "r", format="NETCDF4")
-
-    node_ids_indexes = np.where(rootgrp.groups['nodes'].variables['reach_id'][:].data.astype('U') == str(reach_id))
-
-    if len(node_ids_indexes[0])!=0:
-        for y in node_ids_indexes[0]:
-
-            lat = float(rootgrp.groups['nodes'].variables['x'][y].data.astype('U'))
-            lon = float(rootgrp.groups['nodes'].variables['y'][y].data.astype('U'))
-            # all_nodes.append([lat,lon])
-            lat_list.append(lat)
-            lon_list.append(lon)
-
-
-        rootgrp.close()
-
-    # print(f'Found {len(all_nodes)} nodes...')
-    return lat_list, lon_list
-
-
-
-
-
-
-
-
-
-
-
-
-# all_links = find_download_links_for_reach_tiles('/home/confluence/data/mnt/input/sword',23216000521)
-# print(len(all_links))
-
-
-
-def ssc_process_continent(reach_ids, cont, data_dir, temporal_range):
-
-
-    pool = Pool(processes=7)              # start 4 worker processes
-    result = pool.starmap(find_download_links_for_reach_tiles, zip(repeat(data_dir), reach_ids, repeat(cont), repeat(temporal_range)))
-    # cnt = 0
-    # for i in result:
-    #     for x in i:
-    #         cnt += 1
-
-    pool.close()
-
-    flatten_list = list(chain.from_iterable(result))
-    flatten_list = list(set(flatten_list))
+        if concurrency:
+            reach_links, errors = asyncio.run(find_reach_links_async(reach_ids, data_dir, temporal_range,
+                                                                     concurrency=concurrency, cache=cache))
+        else:
+            reach_links, errors = find_reach_links(reach_ids, data_dir, temporal_range, cache=cache)
+    finally:
+        if cache:
+            cache.log_stats()
+            cache.close()
+    flatten_list = set(chain.from_iterable(reach_links))
+    if any(errors):
+        flatten_list.add('foo')
     no_bands = list(set([i[:-10] for i in flatten_list]))
     print(f'Found {len(no_bands)} scenes for {cont}...')
-    return no_bands
-
-
-
-
- 
\ No newline at end of file
+    return no_bands, build_scene_index(reach_ids, reach_links, errors)
@@ -0,0 +1,175 @@
+# Standard imports
+from datetime import datetime, timedelta, timezone
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+# Windows that end less than this long ago may still gain scenes
+RECENT_WINDOW = timedelta(days=60)
+
+# How long the results of a recent window are kept
+RECENT_TTL = timedelta(days=1)
+
+# Default size limit of the cached results in bytes
+MAX_CACHE_BYTES = 2 * 1024**3
+
+class StacCache:
+    """
+    A class that keeps STAC search results in an SQLite file between runs.
+
+    Results are keyed by a hash of the search footprint rounded to a
+    millionth of a degree, the sorted collections and the datetime window.
+    Windows in the past never change and are kept until evicted; windows
+    that end within RECENT_WINDOW of now expire after RECENT_TTL. When the
+    results take more than max_bytes the least recently used are evicted.
+
+    Attributes
+    ----------
+    connection: sqlite3.Connection
+        connection to the cache file
+    evicted: int
+        number of results evicted
+    expired: int
+        number of results found expired
+    hits: int
+        number of searches answered from the cache
+    lock: threading.Lock
+        lock shared by the threads that use the connection
+    max_bytes: int
+        size limit of the cached results
+    misses: int
+        number of searches not in the cache
+
+    Methods
+    -------
+    close()
+        closes the cache file
+    get(bbox, collections, window)
+        returns the cached items of a search, None if they are not cached
+    log_stats()
+        prints hit and miss counts
+    put(bbox, collections, window, items)
+        stores the items of a search
+    """
+
+    def __init__(self, filename, max_bytes=MAX_CACHE_BYTES):
+        """
+        Parameters
+        ----------
+        filename: Path
+            path to SQLite cache file, created if it does not exist
+        max_bytes: int
+            size limit of the cached results
+        """
+
+        self.connection = sqlite3.connect(str(filename), check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results ("
+                                "key TEXT PRIMARY KEY, items BLOB NOT NULL, size INTEGER NOT NULL, "
+                                "accessed REAL NOT NULL, expires REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self.connection.commit()
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def close(self):
+        """Close the cache file."""
+
+        self.connection.close()
+
+    def get(self, bbox, collections, window):
+        """Return the cached items of a search, None if they are not cached
+        or have expired.
+
+        Parameters
+        ----------
+        bbox: list
+            min x, min y, max x and max y
+        collections: list
+            STAC collections searched
+        window: str
+            start and end times separated by a comma
+        """
+
+        key = cache_key(bbox, collections, window)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT items, expires FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                self.connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.connection.commit()
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, bbox, collections, window, items):
+        """Store the items of a search and evict the least recently used
+        results over the size limit.
+
+        Parameters
+        ----------
+        bbox: list
+            min x, min y, max x and max y
+        collections: list
+            STAC collections searched
+        window: str
+            start and end times separated by a comma
+        items: list
+            STAC items as dictionaries
+        """
+
+        key = cache_key(bbox, collections, window)
+        blob = zlib.compress(json.dumps(items, separators=(",", ":")).encode())
+        now = time.time()
+        expires = now + RECENT_TTL.total_seconds() if is_recent(window) else None
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                                    (key, blob, len(blob), now, expires))
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self.connection.execute("SELECT key, size FROM results ORDER BY accessed").fetchall()
+                for old_key, size in rows:
+                    if total <= self.max_bytes or old_key == key:
+                        break
+                    self.connection.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                    total -= size
+                    self.evicted += 1
+            self.connection.commit()
+
+    def log_stats(self):
+        """Print the hit, miss, expired and evicted counts."""
+
+        print(f"STAC cache: {self.hits} hits, {self.misses} misses, "
+              f"{self.expired} expired, {self.evicted} evicted.")
+
+def cache_key(bbox, collections, window):
+    """Return the cache key of a search: a hash of its footprint rounded to
+    a millionth of a degree, sorted collections and window."""
+
+    search = {
+        "bbox": [round(float(value), 6) + 0.0 for value in bbox],
+        "collections": sorted(collections),
+        "datetime": window.replace("/", ",")
+    }
+    return hashlib.sha256(json.dumps(search, sort_keys=True).encode()).hexdigest()
+
+def is_recent(window):
+    """Return True if a window ends within RECENT_WINDOW of now, or later."""
+
+    end = window.replace("/", ",").split(",")[-1]
+    end = datetime.fromisoformat(end.replace("Z", "+00:00"))
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    return end > datetime.now(timezone.utc) - RECENT_WINDOW
@@ -28,7 +28,9 @@ import argparse
 import datetime
 
 # Local imports
-from generate_data import run_river
+from datagen.Columnar import SERIALIZERS
+from datagen.JsonWriter import COMPRESSIONS
+from generate_data import RIVER_STAGES, run_river, run_rivers
 from generate_data_lake import run_lake
 
 def create_args():
@@ -84,7 +86,7 @@ def create_args():
                             help="Directory of local shapefiles")
     arg_parser.add_argument("-u",
                             "--subsetfile",
-                            help="Path to JSON file with list of reaches to subset",
+                            help="Path to JSON file with list of reaches, or lakes in the lake context, to subset; lake subsets only read the shapefiles s3_lake.json from a previous run lists for them, or every Prior shapefile without it",
                             type=str)
     arg_parser.add_argument("-a",
                             "--passlist",
@@ -98,6 +100,57 @@ def create_args():
                             "--hls",
                             help="indicate the generation of hls target files for ssc prediction",
                             action="store_true")
+    arg_parser.add_argument("--setworkers",
+                            help="Number of processes to find sets with, 1 finds them one algorithm at a time",
+                            type=int)
+    arg_parser.add_argument("--setpartitions",
+                            help="Find sets one SWORD basin partition at a time",
+                            action="store_true")
+    arg_parser.add_argument("--nodesource",
+                            help="Map reaches to nodes from the Node shapefiles ('granule') or the SWORD nodes group ('sword')",
+                            choices=["granule", "sword"],
+                            default="granule",
+                            type=str)
+    arg_parser.add_argument("--observednodes",
+                            help="With --nodesource sword, keep only the nodes observed in Node shapefiles",
+                            action="store_true")
+    arg_parser.add_argument("--binaryformat",
+                            help="Also write reach, reach_node and s3_reach data in a binary columnar format",
+                            choices=list(SERIALIZERS),
+                            type=str)
+    arg_parser.add_argument("--shardentries",
+                            help="Also write list outputs as shards of at most this many entries",
+                            type=int)
+    arg_parser.add_argument("--shardbytes",
+                            help="Also write list outputs as shards of at most this many bytes of entries",
+                            type=int)
+    arg_parser.add_argument("--compression",
+                            help="Compress JSON outputs as they are written, zstd needs the zstandard package",
+                            choices=COMPRESSIONS,
+                            type=str)
+    arg_parser.add_argument("--fetchworkers",
+                            help="Number of threads to read lake shapefiles with",
+                            type=int)
+    arg_parser.add_argument("--hlscache",
+                            help="Path to SQLite file that caches HLS STAC search results between runs",
+                            type=str)
+    arg_parser.add_argument("--hlsconcurrency",
+                            help="Search HLS scenes with asyncio, with at most this many requests in flight",
+                            type=int)
+    arg_parser.add_argument("--continents",
+                            help="Run on these comma-separated continents of the continent JSON file, or 'all', instead of -i",
+                            type=str)
+    arg_parser.add_argument("--continentworkers",
+                            help="With --continents, number of continents to run at the same time",
+                            type=int)
+    arg_parser.add_argument("--fromstage",
+                            "--from-stage",
+                            help="Run river stages from this one on, whatever their inputs, and skip earlier ones",
+                            choices=list(RIVER_STAGES),
+                            type=str)
+    arg_parser.add_argument("--only",
+                            help="Run only these comma-separated river stages, whatever their inputs",
+                            type=str)
     arg_parser.add_argument("--swordversion",
                             help="SWORD verion to run on",
                             default='16', 
@@ -114,7 +167,10 @@ def main():
     args = arg_parser.parse_args()
     
     if args.context == "river":
-        run_river(args)
+        if args.continents:
+            run_rivers(args)
+        else:
+            run_river(args)
     if args.context == "lake":
         run_lake(args)
         
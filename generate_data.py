@@ -5,10 +5,12 @@ generate a list.
 """
 
 # Standard imports
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import json
 import os
 from pathlib import Path
-import re
 import traceback
 import zipfile
 
@@ -24,13 +26,35 @@ import shutil
 # Local imports
 from conf import conf
 from datagen.Basin import Basin
+from datagen.Columnar import int_column, list_column, list_offsets, write_columns, write_npz
 from datagen.CyclePass import CyclePass
+from datagen.GranuleTable import GranuleTable
+from datagen.JsonWriter import write_json
 from datagen.Reach import Reach
 from datagen.ReachNode import ReachNode
+from datagen.RunManifest import RunManifest, forced_stages
 from datagen.S3List import S3List
 from sets.getAllSets import main as set_main
 import datagen.Ssc as ssc
 
+# Stages of a river run in run order, with the stages whose outputs each
+# one reads and the code that writes its outputs, the extract and patch
+# stages are written in this file
+RIVER_STAGES = {
+    "extract": ([], ["generate_data.py", "datagen/GranuleTable.py", "datagen/S3List.py", "datagen/Columnar.py",
+                     "datagen/JsonWriter.py"]),
+    "cycle_pass": (["extract"], ["datagen/CyclePass.py", "datagen/JsonWriter.py"]),
+    "patch": ([], ["generate_data.py"]),
+    "basin": (["extract", "patch"], ["datagen/Basin.py", "datagen/JsonWriter.py"]),
+    "reach": (["extract", "patch"], ["datagen/Reach.py", "datagen/Columnar.py", "datagen/JsonWriter.py"]),
+    "reach_node": (["extract", "patch"], ["datagen/ReachNode.py", "datagen/Columnar.py", "datagen/JsonWriter.py"]),
+    "sets": (["reach", "patch"], ["sets/getAllSets.py", "sets/partition.py", "sets/sets.py", "sets/topology.py",
+              "datagen/JsonWriter.py"]),
+    "hls": (["extract", "patch"], ["datagen/Ssc.py", "datagen/StacCache.py", "datagen/JsonWriter.py"])
+}
+RIVER_STAGES = {stage: (upstream, [Path(__file__).parent.joinpath(path) for path in code])
+                for stage, (upstream, code) in RIVER_STAGES.items()}
+
 def apply_reach_patch(sword_dataset, swordpatch):
     """Apply reach level changes two the new copy of SWORD with the suffix _patch.nc
     
@@ -71,9 +95,9 @@ def patch_sword(args, INPUT_DIR, sword_filename, conf):
     """
 
     # create filepaths
-    new_suffix = conf['sword_suffix'].replace('.nc', '_patch.nc')
+    new_suffix = patched_filename(conf['sword_suffix'])
 
-    new_sword_filename = sword_filename.replace('.nc', '_patch.nc')
+    new_sword_filename = patched_filename(sword_filename)
 
     swordfilepath=INPUT_DIR.joinpath("sword")
 
@@ -98,11 +122,17 @@ def patch_sword(args, INPUT_DIR, sword_filename, conf):
 
     # apply reach patch
     apply_reach_patch(sword_dataset=sd, swordpatch=swordpatch)
+    sd.close()
 
 
 
     return new_suffix, new_sword_filename
 
+def patched_filename(sword_filename):
+    """Return the name of the patched copy of a SWORD file."""
+    
+    return sword_filename.replace('.nc', '_patch.nc')
+
 def extract_ids(shpfiles, creds,sword_target_version:str, pass_list_data = False):
     """Extract reach identifiers from shapefile names and return a list.
     
@@ -174,7 +204,7 @@ def extract_ids(shpfiles, creds,sword_target_version:str, pass_list_data = False
     node_ids.sort()
     return shp_list, reach_ids, node_ids
 
-def extract_ids_local(shapefiledir, cont, outdir):
+def extract_ids_local(shapefiledir, cont, outdir, skip_nodes=False):
     """Extract reach identifiers from shapefile names and return a list.
     
     Parameters
@@ -185,6 +215,8 @@ def extract_ids_local(shapefiledir, cont, outdir):
         continent abreviation
     outdir: path
         path to the directory contianing the s3 list json
+    skip_nodes: bool
+        do not read node identifiers from Node shapefiles
     """
     
     # Extract reach identifiers from local files
@@ -197,6 +229,8 @@ def extract_ids_local(shapefiledir, cont, outdir):
         for shpfile in shpfiles:
             if cont in shpfile.name:    # Filter by continent
                 shp_files.append(shpfile.name)
+                if skip_nodes and "Node" in shpfile.name:
+                    continue
                 # Locate and open DBF file
                 dbf_file = f"{shpfile.name.split('/')[-1].split('.')[0]}.dbf"            
                 zip_file = zipfile.ZipFile(shpfile, 'r')
@@ -204,40 +238,52 @@ def extract_ids_local(shapefiledir, cont, outdir):
                     sf = shapefile.Reader(dbf=dbf)
                     records = sf.records()
                     if "Reach" in shpfile.name:
-                        reach_id = {rec["reach_id"] for rec in records}
-                        reach_ids.extend(list(reach_id))
-                        for rid in reach_id:
+                        reach_id = record_ids(records, "reach_id")
+                        reach_ids.append(reach_id)
+                        for rid in reach_id.tolist():
                             if rid in reach_id_s3.keys():
                                 reach_id_s3[rid].append(shpfile)
                             else:
                                 reach_id_s3[rid] = shpfile
                     if "Node" in shpfile.name:
-                        node_id = {rec["node_id"] for rec in records}
-                        node_ids.extend(list(node_id))
+                        node_id = record_ids(records, "node_id")
+                        node_ids.append(node_id)
           
     # Remove duplicates from multiple files and sort
-    reach_ids = list(set(reach_ids))
-    reach_ids.sort()
-    node_ids = list(set(node_ids))
-    node_ids.sort()
+    reach_ids = unique_ids(reach_ids)
+    node_ids = unique_ids(node_ids)
     rids_shp = {reach_id: sorted(reach_id_s3[reach_id]) for reach_id in sorted(reach_id_s3)}
-    shp_files.sort(key=sort_shapefiles)
-    shp_json = [ str(Path(shapefiledir).joinpath(shp)) for shp in shp_files ]
+    granules = GranuleTable(shp_files).sorted()
+    shp_json = [ str(Path(shapefiledir).joinpath(shp)) for shp in granules.tolist() ]
     json_file = Path(outdir).joinpath(update_json_filename(conf["s3_list_local"], cont))
     write_json(shp_json, json_file)
-    return shp_files, reach_ids, node_ids, rids_shp
+    return granules, reach_ids, node_ids, rids_shp
 
-def extract_s3_uris(s3_uris, s3_creds, s3_endpoint, args, cont, sword_target_version, reach_list=False, 
-                    pass_list_data=False):
+def extract_s3_uris(granules, s3_creds, s3_endpoint, args, cont, sword_target_version, reach_list=False, 
+                    pass_list_data=False, skip_nodes=False):
     """Extract S3 URIs from reach file subset.
     
-    Open shapefiles and locate reach and node identifiers.
+    Open shapefiles and locate reach and node identifiers. Shapefiles of
+    passes that are not in pass_list_data are not downloaded. With
+    skip_nodes Node shapefiles are not downloaded, each one is kept when the
+    Reach shapefile of the same granule is.
+    
+    Returns the GranuleTable of the shapefiles kept in natural sort order.
     """
     
     reach_ids = []
     node_ids = []
     shp_files = []
     reach_id_s3 = {}
+    reach_list = np.unique(np.array(reach_list or [], dtype=np.int64))
+    if pass_list_data:
+        print('passlist provided', pass_list_data)
+        granules = granules.filter(granules.in_passes(pass_list_data))
+    is_node = np.char.find(granules.uri, "Node") >= 0
+    node_uris = set()
+    if skip_nodes:
+        node_uris = set(granules.uri[is_node].tolist())
+    s3_uris = granules.uri[~is_node].tolist() if skip_nodes else granules.tolist()
     # print('just before filtering')
     # print(s3_uris)
     cnt = 0
@@ -264,65 +310,54 @@ def extract_s3_uris(s3_uris, s3_creds, s3_endpoint, args, cont, sword_target_ver
                     bs_data = BeautifulSoup(data, "xml")
                     b_unique = bs_data.find_all('xref_prior_river_db_files')
                     sword_version = str(b_unique[0]).split('>')[1].split(',')[0].split('_')[-1].split('.')[0][2:]
-                    pass_number = str(os.path.basename(shpfile)).split('_')[6]
                     
-                    # If processing correct sword version and pass is in pass data then proceed with extracting reach and node IDs
+                    # If processing correct sword version then proceed with extracting reach and node IDs
                     if sword_version == sword_target_version:
-                        correct_pass = False
-                        if pass_list_data:
-                            print('passlist provided')
-                            print(pass_number, pass_list_data)
-                            if str(pass_number) in pass_list_data:
-                                correct_pass = True
-                            if int(pass_number) in pass_list_data:
-                                correct_pass = True
-                            else:
-                                print('no match')
-                        else:
-                            correct_pass = True
-                        if correct_pass:
-                            with zip_file.open(dbf_file) as dbf:
-                                sf = shapefile.Reader(dbf=dbf)
-                                records = sf.records()
+                        with zip_file.open(dbf_file) as dbf:
+                            sf = shapefile.Reader(dbf=dbf)
+                            records = sf.records()
                                 
-                                # Extract REACH data
-                                if "Reach" in shpfile:
-                                    shp_reaches = {rec["reach_id"] for rec in records}
-                                    rids = shp_reaches
-                                    if reach_list:
-                                        reach_intersection = [ value for value in shp_reaches if value in reach_list ]
-                                        if len(reach_intersection) > 0:
-                                            shp_files.append(shpfile)
-                                            reach_ids.extend(reach_intersection)
-                                            rids = reach_intersection
-                                            for reach_id in rids:
-                                                track_s3_uris(reach_id_s3, reach_id, shpfile)
-                                    else:
+                            # Extract REACH data
+                            if "Reach" in shpfile:
+                                shp_reaches = record_ids(records, "reach_id")
+                                rids = shp_reaches.tolist()
+                                node_uri = pair_node_uri(shpfile, node_uris)
+                                if len(reach_list):
+                                    reach_intersection = shp_reaches[np.isin(shp_reaches, reach_list)]
+                                    if len(reach_intersection) > 0:
                                         shp_files.append(shpfile)
-                                        reach_ids.extend(shp_reaches)
+                                        reach_ids.append(reach_intersection)
+                                        rids = reach_intersection.tolist()
                                         for reach_id in rids:
                                             track_s3_uris(reach_id_s3, reach_id, shpfile)
-
-                                # Extract NODE data    
-                                if "Node" in shpfile:
-                                    if cnt == 0:
-                                        cnt = 999
-                                    node_id = {rec["node_id"] for rec in records}
-                                    if reach_list:
-                                        for reach_id in reach_list:
-                                            reach_r = re.compile(f"^{reach_id[:10]}.*")
-                                            node_m = list(filter(reach_r.match, node_id))
-                                            if node_m:
-                                                node_ids.extend(node_m)
-                                                shp_files.append(shpfile)
-                                                track_s3_uris(reach_id_s3, reach_id, shpfile)
-                                    else:
-                                        node_id = {rec["node_id"] for rec in records}
-                                        node_ids.extend(list(node_id)) 
+                                            if node_uri: track_s3_uris(reach_id_s3, reach_id, node_uri)
+                                        if node_uri: shp_files.append(node_uri)
+                                else:
+                                    shp_files.append(shpfile)
+                                    reach_ids.append(shp_reaches)
+                                    for reach_id in rids:
+                                        track_s3_uris(reach_id_s3, reach_id, shpfile)
+                                        if node_uri: track_s3_uris(reach_id_s3, reach_id, node_uri)
+                                    if node_uri: shp_files.append(node_uri)
+
+                            # Extract NODE data    
+                            if "Node" in shpfile:
+                                if cnt == 0:
+                                    cnt = 999
+                                node_id = record_ids(records, "node_id")
+                                # The first 10 digits of a node identifier are those of its reach
+                                if len(reach_list):
+                                    node_m = node_id[np.isin(node_id // 10**4, reach_list // 10)]
+                                    if len(node_m):
+                                        node_ids.append(node_m)
                                         shp_files.append(shpfile)
-                                        for n in node_id:
-                                            rid = f"{n[:10]}{n[-1]}"
-                                            track_s3_uris(reach_id_s3, rid, shpfile)
+                                        for reach_id in reach_list[np.isin(reach_list // 10, node_m // 10**4)].tolist():
+                                            track_s3_uris(reach_id_s3, reach_id, shpfile)
+                                else:
+                                    node_ids.append(node_id)
+                                    shp_files.append(shpfile)
+                                    for rid in np.unique(node_id // 10**4 * 10 + node_id % 10).tolist():
+                                        track_s3_uris(reach_id_s3, rid, shpfile)
                 retry_num = 0
             except Exception as e:
                 print(e)
@@ -332,15 +367,39 @@ def extract_s3_uris(s3_uris, s3_creds, s3_endpoint, args, cont, sword_target_ver
                 retry_num -= 1
 
     # Sort and remove duplicates from reaches, nodes, and shapefiles
-    reach_ids = list(set(reach_ids))
-    reach_ids.sort()
-    node_ids = list(set(node_ids))
-    node_ids.sort()
-    shp_files = list(set(shp_files))
-    print('here are some example shapefiles from extract s3 uri...', shp_files[:1])
-    shp_files.sort(key=sort_shapefiles)
+    reach_ids = unique_ids(reach_ids)
+    node_ids = unique_ids(node_ids)
+    granules = granules.filter(np.isin(granules.uri, shp_files)).unique().sorted()
+    print('here are some example shapefiles from extract s3 uri...', granules.tolist()[:1])
     rid_s3 = {reach_id: sorted(reach_id_s3[reach_id]) for reach_id in sorted(reach_id_s3)}
-    return shp_files, reach_ids, node_ids, rid_s3
+    return granules, reach_ids, node_ids, rid_s3
+
+def record_ids(records, field):
+    """Return the unique identifiers of a shapefile field as a sorted int64 array."""
+    
+    return np.unique(np.array([rec[field] for rec in records], dtype=np.int64))
+
+def unique_ids(id_arrays):
+    """Return the sorted unique identifiers of a list of int64 arrays."""
+    
+    if not id_arrays:
+        return np.array([], dtype=np.int64)
+    return np.unique(np.concatenate(id_arrays))
+
+def pair_node_uri(shpfile, node_uris):
+    """Return the Node shapefile URI of the same granule as a Reach shapefile,
+    None when it is not in node_uris."""
+    
+    prefix, sep, filename = shpfile.rpartition('/')
+    node_uri = f"{prefix}{sep}{filename.replace('_Reach_', '_Node_')}"
+    return node_uri if node_uri in node_uris else None
+
+def s3_reach_columns(rid_s3):
+    """Return the shapefile URIs of each reach identifier as a table of columns."""
+    
+    offsets, s3_uris = list_offsets(list(rid_s3.values()))
+    return {**int_column("reach_id", list(rid_s3.keys())),
+            **list_column("s3", offsets, np.array(s3_uris, dtype=str))}
 
 def track_s3_uris(reach_id_s3, rid, shpfile):
     """Update reach_id_s3 dictionary with shapefile URI."""
@@ -350,7 +409,7 @@ def track_s3_uris(reach_id_s3, rid, shpfile):
     else:
         reach_id_s3[rid] = [shpfile]
 
-def extract_s3_uris_local(shapefiledir, cont, outdir, reach_list):
+def extract_s3_uris_local(shapefiledir, cont, outdir, reach_list, skip_nodes=False):
     """Extract S3 URIs from reach file subset."""
     
     print("Extracting shapefiles and node identifiers from subset.")
@@ -359,9 +418,12 @@ def extract_s3_uris_local(shapefiledir, cont, outdir, reach_list):
     node_ids = []
     shp_files = []
     reach_id_s3 = {}
+    reach_list = np.unique(np.array(reach_list, dtype=np.int64))
     with os.scandir(Path(shapefiledir)) as shpfiles:
         for shpfile in shpfiles:
             if cont in shpfile.name:    # Filter by continent
+                if skip_nodes and "Node" in shpfile.name:
+                    continue
                 # Locate and open DBF file
                 dbf_file = f"{shpfile.name.split('/')[-1].split('.')[0]}.dbf"            
                 zip_file = zipfile.ZipFile(shpfile, 'r')
@@ -369,36 +431,32 @@ def extract_s3_uris_local(shapefiledir, cont, outdir, reach_list):
                     sf = shapefile.Reader(dbf=dbf)
                     records = sf.records()
                     if "Reach" in shpfile.name:
-                        shp_reaches = {rec["reach_id"] for rec in records}
-                        reach_intersection = [ value for value in shp_reaches if value in reach_list ]
+                        shp_reaches = record_ids(records, "reach_id")
+                        reach_intersection = shp_reaches[np.isin(shp_reaches, reach_list)]
                         if len(reach_intersection) > 0:
                             shp_files.append(shpfile.name)
-                            reach_ids.extend(reach_intersection)
+                            reach_ids.append(reach_intersection)
                             for rid in reach_id:
                                 if rid in reach_id_s3.keys():
                                     reach_id_s3[rid].append(shpfile)
                                 else:
                                     reach_id_s3[rid] = shpfile
                     if "Node" in shpfile.name:
-                        node_id = {rec["node_id"] for rec in records}
-                        for reach_id in reach_list:
-                            reach_r = re.compile(f"^{reach_id[:10]}.*")
-                            node_ids.extend(list(filter(reach_r.match, node_id)))
+                        node_id = record_ids(records, "node_id")
+                        node_ids.append(node_id[np.isin(node_id // 10**4, reach_list // 10)])
     
     # Sort and remove duplicates
-    reach_ids = list(set(reach_ids))
-    reach_ids.sort()
-    node_ids = list(set(node_ids))
-    node_ids.sort()
-    shp_files.sort(key=sort_shapefiles)
+    reach_ids = unique_ids(reach_ids)
+    node_ids = unique_ids(node_ids)
+    granules = GranuleTable(shp_files).sorted()
     rid_s3 = {reach_id: sorted(reach_id_s3[reach_id]) for reach_id in sorted(reach_id_s3)}
     
     # Write JSON file
-    shp_json = [ str(Path(shapefiledir).joinpath(shp)) for shp in shp_files ]
+    shp_json = [ str(Path(shapefiledir).joinpath(shp)) for shp in granules.tolist() ]
     json_file = Path(outdir).joinpath(update_json_filename(conf["s3_list_local"], cont))
     write_json(shp_json, json_file)
     
-    return shp_files, reach_ids, node_ids, []
+    return granules, reach_ids, node_ids, []
 
 def get_continent(index, json_file):
     """Retrieve continent to run datagen operations for."""
@@ -408,6 +466,22 @@ def get_continent(index, json_file):
         data = json.load(jf)
     return list(data[i].keys())[0].upper()
 
+def get_continent_indexes(continents, json_file):
+    """Return the indexes in the continent JSON file of a comma-separated
+    list of continent abbreviations, every index for 'all'."""
+    
+    with open(json_file) as jf:
+        data = json.load(jf)
+    available = [list(entry.keys())[0].upper() for entry in data]
+    if continents.lower() == "all":
+        return list(range(len(available)))
+    indexes = []
+    for cont in continents.upper().split(","):
+        if cont.strip() not in available:
+            raise ValueError(f"Continent {cont.strip()} is not in {json_file}.")
+        indexes.append(available.index(cont.strip()))
+    return indexes
+
 def get_subset(json_file):
     """Retrieve subset data to run datagen operations for."""
     
@@ -415,70 +489,51 @@ def get_subset(json_file):
         data = json.load(jf)
     return data
    
-def strtoi(text):
-    """Convert string digits to integers"""
-    return int(text) if text.isdigit() else text
-
-def sort_shapefiles(shapefile):
-    """Sort shapefiles so that they are in ascending order."""
-    
-    return [ strtoi(shp) for shp in re.split(r'(\d+)', shapefile) ]
-
-def write_json(json_object, filename):
-    """Write JSON object as a JSON file to the specified filename."""
-
-    with open(filename, 'w') as jf:
-        json.dump(json_object, jf, indent=2)
-
-def run_aws(args, cont, sword_target_version,reach_list=False, pass_list_data=False):
+def run_aws(args, cont, sword_target_version,reach_list=False, pass_list_data=False, skip_nodes=False, listing=None):
     """Executes operations to retrieve reach identifiers from shapefiles hosted
-    in AWS S3 bucket."""
-
-    # Retrieve a list of S3 files
-    print(f"Retrieving and storing list of S3 URIs for {cont}.")
-    s3_list = S3List()
-    try:
-        if args.simulated:
-            s3_uris, s3_creds = s3_list.get_s3_uris_sim()
-        else:
-            s3_endpoint = conf["s3_cred_endpoints"][args.provider]
-            s3_uris, s3_creds = s3_list.login_and_run_query(args.shortname, args.provider, args.temporalrange, cont, s3_endpoint, args.ssmkey)
-            s3_uris.sort(key=sort_shapefiles)
-            print('here are some sample urls that are sorted...', s3_uris[:1])
-    except Exception as e:
-        print(e)
-        print(traceback.format_exc())
-        print("Error encountered. Exiting program.")
-        exit(1)
-    print('here are s3 uris', s3_uris)
-    if s3_uris:
-        s3_uris, reach_ids, node_ids, rid_s3 = extract_s3_uris(s3_uris=s3_uris, 
+    in AWS S3 bucket.
+    
+    listing is the GranuleTable of the continent's shapefiles and the S3
+    credentials from list_granules or list_continent, None to log in and
+    list them here."""
+
+    s3_endpoint = None if args.simulated else conf["s3_cred_endpoints"][args.provider]
+    granules, s3_creds = listing or list_continent(args, cont)
+    print('here are s3 uris', granules.tolist())
+    if len(granules):
+        granules, reach_ids, node_ids, rid_s3 = extract_s3_uris(granules=granules, 
                                                                s3_creds=s3_creds, 
                                                                s3_endpoint=s3_endpoint,
                                                                args=args,
                                                                reach_list=reach_list,
                                                                sword_target_version = sword_target_version,
                                                                pass_list_data=pass_list_data,
-                                                               cont = cont)
+                                                               cont = cont,
+                                                               skip_nodes=skip_nodes)
         print('Here are some extracted s3_uris')
-        print(s3_uris[:1])
-        if reach_ids:    
+        print(granules.tolist()[:1])
+        if len(reach_ids):    
             # Write shapefile json
             json_file = Path(args.directory).joinpath(update_json_filename(conf["s3_list"], cont))
-            write_json(s3_uris, json_file)
+            write_json(granules.tolist(), json_file, **output_options(args))
             
             # Write reach id S3 json
             json_file = Path(args.directory).joinpath(f"s3_reach_{cont.lower()}.json")
-            write_json(rid_s3, json_file)
+            write_json(rid_s3, json_file, **output_options(args))
+            if args.binaryformat:
+                write_columns(s3_reach_columns(rid_s3), json_file, args.binaryformat)
             
-            # Creat a list of only shapfile names
-            shp_files = [shp.split('/')[-1].split('.')[0] for shp in s3_uris]
-            return shp_files, reach_ids, node_ids
+            return granules, reach_ids, node_ids
         else:
             print('No reach ids found...')
-            return [], [], []
+            return GranuleTable([]), [], []
     else:
-        return [], [] ,[]
+        return GranuleTable([]), [] ,[]
+
+def output_options(args):
+    """Return the shard size and compression keyword arguments of write_json."""
+    
+    return {"max_entries": args.shardentries, "max_bytes": args.shardbytes, "compression": args.compression}
 
 def update_json_filename(json_file, continent):
     """Update JSON file name to include continent."""
@@ -487,25 +542,118 @@ def update_json_filename(json_file, continent):
     cont_name = f"{filename_pieces[0]}_{continent.lower()}.{filename_pieces[1]}"
     return cont_name
 
-def run_local(args, cont, subset, reach_list=None):
+def run_local(args, cont, subset, reach_list=None, skip_nodes=False):
     """Load shapefiles in from local file system and return reach identifiers."""
     
     # Extract reach identifiers
     if subset == False:
-        shp_files, reach_ids, node_ids, rids_shp = extract_ids_local(args.shapefiledir, cont, args.directory)
+        granules, reach_ids, node_ids, rids_shp = extract_ids_local(args.shapefiledir, cont, args.directory, skip_nodes)
     
     # Extract shapefiles and node identifiers for reach identifier subset
     else:
-        shp_files, reach_ids, node_ids, rids_shp = extract_s3_uris_local(args.shapefiledir, cont, args.directory, reach_list)
+        granules, reach_ids, node_ids, rids_shp = extract_s3_uris_local(args.shapefiledir, cont, args.directory, reach_list, skip_nodes)
         
     if rids_shp:
         json_file = Path(args.directory).joinpath(f"s3_reach_{cont.lower()}.json")
-        write_json(rids_shp, json_file)
+        write_json(rids_shp, json_file, **output_options(args))
+    
+    return granules, reach_ids, node_ids
+
+def list_continent(args, cont):
+    """Log in and list the shapefiles of a continent.
+    
+    Returns the GranuleTable of the shapefiles in natural sort order and the
+    S3 credentials.
+    """
+    
+    print(f"Retrieving and storing list of S3 URIs for {cont}.")
+    s3_list = S3List()
+    try:
+        if args.simulated:
+            s3_uris, s3_creds = s3_list.get_s3_uris_sim()
+        else:
+            s3_endpoint = conf["s3_cred_endpoints"][args.provider]
+            s3_uris, s3_creds = s3_list.login_and_run_query(args.shortname, args.provider, args.temporalrange, cont, s3_endpoint, args.ssmkey)
+        granules = GranuleTable(s3_uris).sorted()
+        print('here are some sample urls that are sorted...', granules.tolist()[:1])
+    except Exception as e:
+        print(e)
+        print(traceback.format_exc())
+        print("Error encountered. Exiting program.")
+        exit(1)
+    return granules, s3_creds
+
+def listing_hash(granules):
+    """Return a hash of the URIs of a GranuleTable, which change when a
+    shapefile is added, removed or reprocessed."""
     
-    return shp_files, reach_ids, node_ids
+    return hashlib.sha256("\n".join(sorted(granules.tolist())).encode()).hexdigest()
 
-def run_river(args):
-    """Execute the operations needed to generate JSON data."""
+def skips_extract(args):
+    """Return True if --fromstage or --only skip the extract stage, which
+    then needs no shapefile listing."""
+    
+    only = args.only.split(",") if args.only else None
+    return bool(args.fromstage or only) and "extract" not in forced_stages(RIVER_STAGES, args.fromstage, only)
+
+def list_granules(args, continents):
+    """Log in and list the shapefiles of every continent once.
+    
+    Returns a dictionary of continent keys and (GranuleTable, S3
+    credentials) values, the shapefiles of each continent matched the same
+    way login_and_run_query matches them.
+    """
+    
+    s3_list = S3List()
+    if args.simulated:
+        s3_uris, s3_creds = s3_list.get_s3_uris_sim()
+    else:
+        s3_endpoint = conf["s3_cred_endpoints"][args.provider]
+        s3_uris, s3_creds = s3_list.login_and_run_query(args.shortname, args.provider, args.temporalrange, None, s3_endpoint, args.ssmkey)
+    granules = GranuleTable(s3_uris)
+    print(f"Listed {len(granules)} shapefiles for {len(continents)} continents.")
+    
+    # Simulated data is not filtered by continent
+    listings = {}
+    for cont in continents:
+        in_continent = np.ones(len(granules), dtype=bool) if args.simulated else np.char.find(granules.uri, cont) >= 0
+        listings[cont] = (granules.filter(in_continent), s3_creds)
+    return listings
+
+def run_rivers(args):
+    """Execute run_river for several continents of the continent JSON file
+    in one process pool, sharing one login and shapefile listing."""
+    
+    json_file = Path(args.directory).joinpath(args.jsonfile)
+    indexes = get_continent_indexes(args.continents, json_file)
+    continents = [get_continent(index, json_file) for index in indexes]
+    listings = {} if args.local or skips_extract(args) else list_granules(args, continents)
+    
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.continentworkers or 1) as executor:
+        futures = {}
+        for index, cont in zip(indexes, continents):
+            cont_args = argparse.Namespace(**{**vars(args), "index": index})
+            futures[cont] = executor.submit(run_river, cont_args, listings.get(cont))
+        for cont, future in futures.items():
+            try:
+                future.result()
+            except BaseException as e:
+                print(f"Error encountered for {cont}: {e!r}")
+                failed.append(cont)
+    if failed:
+        print(f"Continents that failed: {', '.join(failed)}. Exiting program.")
+        exit(1)
+
+def run_river(args, listing=None):
+    """Execute the operations needed to generate JSON data.
+    
+    Each stage of RIVER_STAGES is recorded in the continent's run manifest
+    and skipped when its inputs are unchanged, see RunManifest.
+    
+    listing is the GranuleTable of the continent's shapefiles and the S3
+    credentials from list_granules, None to log in and list them here.
+    """
 
     INPUT_DIR = Path(args.directory)
     
@@ -528,73 +676,171 @@ def run_river(args):
     else:
         pass_list_data = False
     
-    # Determine where run is taking place (local or aws)
+    # Node shapefiles are only needed for their node identifiers
+    skip_nodes = args.nodesource == "sword" and not args.observednodes
+    
+    def output_file(key):
+        return INPUT_DIR.joinpath(update_json_filename(conf[key], cont))
+    
+    def binary_files(json_file):
+        return [json_file.with_suffix(f".{args.binaryformat}")] if args.binaryformat else []
+    
+    only = args.only.split(",") if args.only else None
+    manifest = RunManifest(output_file("run_manifest"), RIVER_STAGES, args.fromstage, only)
+    options = output_options(args)
+    
+    # Determine where run is taking place (local or aws), the shapefiles are
+    # listed first so a changed listing runs the extract stage again, and
+    # not at all, nor logged in for, when the stage is skipped
     if args.local:
-        shp_files, reach_ids, node_ids = run_local(args, cont, subset, reach_list)
+        shapefiles = list_shapefiles(args.shapefiledir)
+    elif "extract" in manifest.skip:
+        shapefiles = None
     else:
-        shp_files, reach_ids, node_ids = run_aws(args=args, cont=cont, reach_list=reach_list, sword_target_version = SWORD_version,pass_list_data=pass_list_data)
+        listing = listing or list_continent(args, cont)
+        shapefiles = listing_hash(listing[0])
+    state_file = output_file("extract_state")
+    def extract():
+        if args.local:
+            granules, reach_ids, node_ids = run_local(args, cont, subset, reach_list, skip_nodes)
+        else:
+            granules, reach_ids, node_ids = run_aws(args=args, cont=cont, reach_list=reach_list, sword_target_version = SWORD_version,pass_list_data=pass_list_data, skip_nodes=skip_nodes, listing=listing)
+        write_extract_state(state_file, granules, reach_ids, node_ids)
+    
+    s3_list_file = output_file("s3_list_local" if args.local else "s3_list")
+    s3_reach_file = INPUT_DIR.joinpath(f"s3_reach_{cont.lower()}.json")
+    manifest.run("extract",
+                 [path for path in (args.subsetfile, args.passlist) if path],
+                 {"continent": cont, "local": args.local, "shapefiles": shapefiles,
+                  "shortname": args.shortname, "provider": args.provider, "temporalrange": args.temporalrange,
+                  "simulated": args.simulated, "swordversion": SWORD_version, "skip_nodes": skip_nodes,
+                  "binaryformat": args.binaryformat, **options},
+                 [state_file, s3_list_file, s3_reach_file, *binary_files(s3_reach_file)],
+                 extract)
+    granules, reach_ids, node_ids = read_extract_state(state_file)
     
-    if shp_files:
+    if len(granules):
         # Create cycle pass data
-        # print('post filter shp', shp_files[:10])
-        cycle_pass = CyclePass(shp_files)
-        cycle_pass_data, pass_num = cycle_pass.get_cycle_pass_data()
-        json_file = Path(args.directory).joinpath(update_json_filename(conf["cycle_passes"], cont))
-        print(f"Writing cycle pass data to: {json_file}")
-        write_json(cycle_pass_data, json_file)
-        json_file = Path(args.directory).joinpath(update_json_filename(conf["passes"], cont))
-        print(f"Writing pass number data to: {json_file}")
-        write_json(pass_num, json_file)
+        cycle_passes_file = output_file("cycle_passes")
+        passes_file = output_file("passes")
+        def cycle_pass():
+            cycle_pass = CyclePass(granules)
+            cycle_pass_data, pass_num = cycle_pass.get_cycle_pass_data()
+            print(f"Writing cycle pass data to: {cycle_passes_file}")
+            write_json(cycle_pass_data, cycle_passes_file, **options)
+            print(f"Writing pass number data to: {passes_file}")
+            write_json(pass_num, passes_file, **options)
+        manifest.run("cycle_pass", [], options, [cycle_passes_file, passes_file], cycle_pass)
         
         # Filenames
         sword_filename = f"{cont.lower()}_{conf['sword_suffix']}"
         sos_filename = f"{cont.lower()}_{conf['sos_suffix']}"
 
-        # Patch SWORD Issues
+        # Patch SWORD Issues, conf is left as it is for the next continent of a process
         if args.swordpatch:
-            print('Patching SWORD')
-            conf['sword_suffix'], sword_filename = patch_sword(args, INPUT_DIR, sword_filename, conf)
-            print('Finished patching, new suffix and filename:', conf['sword_suffix'], sword_filename)
+            sword_file = INPUT_DIR.joinpath("sword", sword_filename)
+            def patch():
+                print('Patching SWORD')
+                sword_suffix, patch_filename = patch_sword(args, INPUT_DIR, sword_file.name, conf)
+                print('Finished patching, new suffix and filename:', sword_suffix, patch_filename)
+            sword_filename = patched_filename(sword_filename)
+            manifest.run("patch", [sword_file, args.swordpatch], {}, [INPUT_DIR.joinpath("sword", sword_filename)], patch)
+        swordfile = INPUT_DIR.joinpath("sword", sword_filename)
 
         # Create basin data
-        print("Retrieving basin data.")
-        basin = Basin(reach_ids, sword_filename, sos_filename)
-        basin_data = basin.extract_data()
-        json_file = Path(args.directory).joinpath(update_json_filename(conf["basin"], cont))
-        print(f"Writing basin data to: {json_file}")
-        write_json(basin_data, json_file)
+        basin_file = output_file("basin")
+        def basin():
+            print("Retrieving basin data.")
+            basin = Basin(reach_ids, sword_filename, sos_filename)
+            basin_data = basin.extract_data()
+            print(f"Writing basin data to: {basin_file}")
+            write_json(basin_data, basin_file, **options)
+        manifest.run("basin", [], {"sword": sword_filename, "sos": sos_filename, **options}, [basin_file], basin)
         
         # Create reach data
-        print("Retrieving reach data.")
-        reach = Reach(reach_ids, sword_filename, sos_filename)
-        reach_data = reach.extract_data()
-        json_file = Path(args.directory).joinpath(update_json_filename(conf["reach"], cont))
-        print(f"Writing reach data to: {json_file}")
-        write_json(reach_data, json_file)
+        reach_file = output_file("reach")
+        def reach():
+            print("Retrieving reach data.")
+            reach = Reach(reach_ids, sword_filename, sos_filename)
+            print(f"Writing reach data to: {reach_file}")
+            write_json(reach.iter_data(), reach_file, **options)
+            if args.binaryformat:
+                write_columns(reach.get_columns(), reach_file, args.binaryformat)
+        manifest.run("reach", [], {"sword": sword_filename, "sos": sos_filename, "binaryformat": args.binaryformat, **options},
+                     [reach_file, *binary_files(reach_file)], reach)
         
         # Create reach node data
-        print("Retrieving reach node data.")
-        reach_node = ReachNode(reach_ids, node_ids)
-        reach_node_data = reach_node.extract_data()
-        json_file = Path(args.directory).joinpath(update_json_filename(conf["reach_node"], cont))
-        print(f"Writing reach node data to: {json_file}")
-        write_json(reach_node_data, json_file)   
+        reach_node_file = output_file("reach_node")
+        def reach_node():
+            print("Retrieving reach node data.")
+            if args.nodesource == "sword":
+                reach_node = ReachNode(reach_ids, node_ids if args.observednodes else None, swordfile)
+            else:
+                reach_node = ReachNode(reach_ids, node_ids)
+            print(f"Writing reach node data to: {reach_node_file}")
+            write_json(reach_node.iter_data(), reach_node_file, **options)
+            if args.binaryformat:
+                write_columns(reach_node.get_columns(), reach_node_file, args.binaryformat)
+        manifest.run("reach_node", [swordfile] if args.nodesource == "sword" else [],
+                     {"nodesource": args.nodesource, "observednodes": args.observednodes,
+                      "binaryformat": args.binaryformat, **options},
+                     [reach_node_file, *binary_files(reach_node_file)], reach_node)
         
         # Create sets 
-        print("Retrieving set data.")
-        set_main(args, cont, INPUT_DIR, INPUT_DIR)
+        def sets():
+            print("Retrieving set data.")
+            set_main(args, cont, INPUT_DIR, INPUT_DIR)
+        manifest.run("sets", [swordfile], options,
+                     [INPUT_DIR.joinpath(f"{name}sets_{cont.lower()}.json") for name in ("metro", "hivdi", "sic")], sets)
 
         # Create ssc mapping
         if args.hls:
-            print("Retrieving HLS tiles.")
-            swordfilepath = os.path.join(INPUT_DIR,'sword', sword_filename)
-            json_file = Path(args.directory).joinpath(update_json_filename(conf["hls_links"], cont))
-            hls_link_data = ssc.ssc_process_continent(reach_ids, cont, swordfilepath, args.temporalrange)
-            write_json(hls_link_data, json_file)
+            hls_links_file = output_file("hls_links")
+            hls_index_file = output_file("hls_index")
+            def hls():
+                print("Retrieving HLS tiles.")
+                hls_link_data, hls_index = ssc.ssc_process_continent(reach_ids, cont, str(swordfile), args.temporalrange,
+                                                                     args.hlscache, args.hlsconcurrency)
+                write_json(hls_link_data, hls_links_file, **options)
+                print(f"Writing HLS scene index to: {hls_index_file}")
+                write_json(hls_index, hls_index_file, **options)
+            manifest.run("hls", [swordfile], {"temporalrange": args.temporalrange, **options},
+                         [hls_links_file, hls_index_file], hls)
     
     else:
         print("No shapefiles were located and therefore no JSON files will be written.")
 
+def list_shapefiles(shapefiledir):
+    """Return the name and size of each file of a local shapefile
+    directory."""
+    
+    with os.scandir(Path(shapefiledir)) as entries:
+        return sorted((entry.name, entry.stat().st_size) for entry in entries if entry.is_file())
+
+def write_extract_state(state_file, granules, reach_ids, node_ids):
+    """Write the shapefiles, reach identifiers and node identifiers of the
+    extract stage for later stages to read.
+    
+    An unchanged state is not written again: npz files hold the time they
+    were written, which would change the hash of identical outputs.
+    """
+    
+    state = {"uri": granules.uri,
+             "reach_ids": np.asarray(reach_ids, dtype=np.int64),
+             "node_ids": np.asarray(node_ids, dtype=np.int64)}
+    if Path(state_file).exists():
+        with np.load(state_file) as previous:
+            if set(previous.files) == set(state) and all(np.array_equal(previous[key], value) for key, value in state.items()):
+                return
+    write_npz(state, state_file)
+
+def read_extract_state(state_file):
+    """Return the GranuleTable, reach identifiers and node identifiers
+    written by write_extract_state."""
+    
+    with np.load(state_file) as state:
+        return GranuleTable(state["uri"].tolist()), state["reach_ids"], state["node_ids"]
+
 if __name__ == "__main__":
     import datetime
     start = datetime.datetime.now()
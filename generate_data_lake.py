@@ -1,14 +1,19 @@
-"""Script to generate: lake, cycle_pass, s3_list_lake JSON files."""
+"""Script to generate: lake, s3_lake, cycle_pass, s3_list_lake JSON files."""
 
 # Standard imports
 import json
 import os
 from pathlib import Path
-import re
+
+# Third-party imports
+import numpy as np
 
 # Local imports
 from conf_lake import conf
+from datagen.Columnar import write_columns
 from datagen.CyclePass import CyclePass
+from datagen.GranuleTable import GranuleTable
+from datagen.JsonWriter import load_json, write_json
 from datagen.Lake import Lake
 from datagen.S3List import S3List
 
@@ -20,19 +25,40 @@ def get_continent(index, json_file):
         data = json.load(jf)
     return list(data[i].keys())[0].upper()
 
-def strtoi(text):
-    return int(text) if text.isdigit() else text
-
-def sort_shapefiles(shapefile):
-    """Sort shapefiles so that they are in ascending order."""
+def get_subset(json_file):
+    """Retrieve subset data, a list of lake identifiers or passes, to run
+    datagen operations for."""
     
-    return [ strtoi(shp) for shp in re.split(r'(\d+)', shapefile) ]
-
-def write_json(json_object, filename):
-    """Write JSON object as a JSON file to the specified filename."""
+    with open(json_file) as jf:
+        data = json.load(jf)
+    return data
 
-    with open(filename, 'w') as jf:
-        json.dump(json_object, jf, indent=2)
+def indexed_shapefiles(granules, lake_list, json_file):
+    """Return a mask of the shapefiles that may hold lakes of the lake subset
+    according to the lake identifier shapefile index of a previous run, or
+    None when there is no index or it does not list every lake of the subset.
+    
+    The shapefiles the index lists for a lake are every shapefile of that run
+    that held it, so a shapefile the index lists only for other lakes is left
+    out; shapefiles the index does not list at all, such as those of passes
+    published since, are kept and read.
+    """
+    
+    if not Path(json_file).exists():
+        return None
+    lake_s3 = load_json(json_file)
+    lake_ids = np.unique(np.asarray(lake_list, dtype=str))
+    if not np.isin(lake_ids, np.asarray(list(lake_s3.keys()), dtype=str)).all():
+        return None
+    
+    subset = set(lake_ids.tolist())
+    subset_files, indexed_files = set(), set()
+    for lake_id, shapefiles in lake_s3.items():
+        indexed_files.update(shapefiles)
+        if lake_id in subset:
+            subset_files.update(shapefiles)
+    return np.array([shpfile in subset_files or shpfile not in indexed_files for shpfile in granules.tolist()],
+                    dtype=bool)
 
 def run_aws(args, cont):
     """Executes operations to retrieve reach identifiers from shapefiles hosted
@@ -43,34 +69,39 @@ def run_aws(args, cont):
     s3_list = S3List()
     try:
         if args.simulated:
-            s3_uris = s3_list.get_s3_uris_sim()
+            s3_uris, s3_creds = s3_list.get_s3_uris_sim()
         else:
             s3_endpoint = conf["s3_cred_endpoints"][args.provider.lower()]
-            s3_uris, s3_creds = s3_list.login_and_run_query(args.shortname, args.provider, args.temporalrange, s3_endpoint, args.ssmkey)
+            s3_uris, s3_creds = s3_list.login_and_run_query(args.shortname, args.provider, args.temporalrange, cont, s3_endpoint, args.ssmkey)
             s3_uris = list(filter(lambda uri, cont=cont: cont in uri and 'Prior' in uri, s3_uris))    # Filter for continent
-        s3_uris.sort(key=sort_shapefiles)
-        s3_json = Path(args.directory).joinpath(conf["s3_list"])
-        print(f"Writing lake shapefiles to: {s3_json}.")
-        write_json(s3_uris, s3_json)
+        granules = GranuleTable(s3_uris).sorted()
     except Exception as e:
         print(e)
         print("Error encountered. Exiting program.")
         exit(1)
         
-    return s3_uris, s3_creds
+    return granules, s3_creds
 
 def run_local(args, cont):
     """Load shapefiles in from local file system and return reach identifiers."""
     
     # Extract reach identifiers from local files
-    s3_json = Path(args.directory).joinpath(conf["s3_list_local"])
-    print(f"Writing lake shapefiles to: {s3_json}.")
     with os.scandir(Path(args.shapefiledir)) as shpfiles:
         shp_files = [ str(Path(shpfile)) for shpfile in shpfiles if cont in shpfile.name and 'Prior' in shpfile.name ]
-    shp_files.sort(key=sort_shapefiles)
-    shp_json = [ str(Path(args.shapefiledir).joinpath(shp)) for shp in shp_files ]
-    write_json(shp_json, s3_json)
-    return shp_files
+    return GranuleTable(shp_files).sorted()
+
+def write_s3_list(args, granules):
+    """Write the list of lake shapefiles."""
+    
+    if args.local:
+        s3_json = Path(args.directory).joinpath(conf["s3_list_local"])
+        shp_json = [ str(Path(args.shapefiledir).joinpath(shp)) for shp in granules.tolist() ]
+        print(f"Writing lake shapefiles to: {s3_json}.")
+        write_json(shp_json, s3_json)
+    else:
+        s3_json = Path(args.directory).joinpath(conf["s3_list"])
+        print(f"Writing lake shapefiles to: {s3_json}.")
+        write_json(granules.tolist(), s3_json, compression=args.compression)
 
 def run_lake(args):
     """Execute the operations needed to generate JSON data."""
@@ -80,30 +111,60 @@ def run_lake(args):
     
     # Determine where run is taking place (local or aws)
     if args.local:
-        shp_files = run_local(args, cont)
+        granules = run_local(args, cont)
+    else:
+        granules, s3_creds = run_aws(args, cont)
+    
+    # Keep shapefiles of the pass subset, before any is read
+    if args.passlist:
+        pass_list = get_subset(args.passlist)
+        granules = granules.filter(granules.in_passes(pass_list))
+        print(f"Kept {len(granules)} shapefiles of {len(pass_list)} passes.")
+    
+    # Keep shapefiles with lakes of the lake subset in a previous run's index
+    lake_list = get_subset(args.subsetfile) if args.subsetfile else None
+    if lake_list is not None:
+        keep = indexed_shapefiles(granules, lake_list, Path(args.directory).joinpath(conf["lake_s3"]))
+        if keep is not None:
+            granules = granules.filter(keep)
+            print(f"Kept {len(granules)} shapefiles the lake shapefile index lists for the subset.")
+    
+    # Lake identifiers
+    if args.local:
+        lake = Lake(granules.tolist(), workers=args.fetchworkers, lake_list=lake_list)
+        lake_ids = lake.extract_local()
     else:
-        shp_files, s3_creds = run_aws(args, cont)
+        lake = Lake(granules.tolist(), s3_creds, args.fetchworkers, lake_list)
+        lake_ids = lake.extract_aws()
+    
+    # Keep shapefiles with lakes of the lake subset
+    if lake_list is not None:
+        keep = np.zeros(len(granules), dtype=bool)
+        keep[lake.lake_files] = True
+        granules = granules.filter(keep)
+        print(f"Kept {len(granules)} shapefiles with {len(lake_ids)} lakes of the subset.")
+    write_s3_list(args, granules)
     
     # Create cycle pass data
-    cycle_pass = CyclePass(shp_files)
+    cycle_pass = CyclePass(granules)
     cycle_pass_data, pass_num = cycle_pass.get_cycle_pass_data()
     json_file = Path(args.directory).joinpath(conf["cycle_passes"])
     print(f"Writing cycle pass data to: {json_file}")
-    write_json(cycle_pass_data, json_file)
+    write_json(cycle_pass_data, json_file, compression=args.compression)
     json_file = Path(args.directory).joinpath(conf["passes"])
     print(f"Writing pass number data to: {json_file}")
-    write_json(pass_num, json_file)
+    write_json(pass_num, json_file, compression=args.compression)
     
-    # Lake identifiers
-    if args.local:
-        lake = Lake(shp_files)
-        lake_ids = lake.extract_local()
-    else:
-        lake = Lake(shp_files, s3_creds)
-        lake_ids = lake.extract_aws()
     json_file = Path(args.directory).joinpath(conf["lake"])
     print(f"Writing lake identifiers to: {json_file}")
-    write_json(lake_ids, json_file)
+    write_json(lake_ids, json_file, max_entries=args.shardentries, max_bytes=args.shardbytes, compression=args.compression)
+    
+    # Lake identifier S3 shapefiles
+    json_file = Path(args.directory).joinpath(conf["lake_s3"])
+    print(f"Writing lake identifier shapefiles to: {json_file}")
+    write_json(lake.get_lake_s3(), json_file, compression=args.compression)
+    if args.binaryformat:
+        write_columns(lake.get_lake_s3_columns(), json_file, args.binaryformat)
 
 if __name__ == "__main__":
     import datetime
@@ -2,20 +2,28 @@
 """
 
 # Standard imports
+import contextlib
+import io
+import multiprocessing
 import os
 import sys
 from pathlib import Path
-import json
 
 # Third-party imports
 from netCDF4 import Dataset
 import numpy as np
 
 # Local imports
+from datagen.JsonWriter import load_json
 try:
     from sets import Sets
+    from partition import basin_partitions, slice_sword_data
 except ImportError:
     from sets.sets import Sets
+    from sets.partition import basin_partitions, slice_sword_data
+
+# SWORD data and reaches shared read-only with the set workers, filled in before they fork
+SET_INPUTS={}
 
 def main(args=None, continent=None, input_dir=None, output_dir=None):
     """Main function for finding sets"""
@@ -55,34 +63,173 @@ def main(args=None, continent=None, input_dir=None, output_dir=None):
 
     # read in file with all reaches to run
     reach_json=INPUT_DIR.joinpath(f"reaches_{continent.lower()}.json")
-    with open(reach_json) as json_file:
-        reaches = json.load(json_file)
+    reaches = load_json(reach_json)
         
     # figure out which sword file to read
     swordfile=swordfilepath.joinpath(reaches[0]['sword'])
 
-    # read in sword file
+    # read in sword file once, every algorithm works from the same arrays
     sword_dataset=Dataset(swordfile)
+    SET_INPUTS['sword_data']=load_sword_data(sword_dataset,reaches)
+    SET_INPUTS['reaches']=reaches
+    SET_INPUTS['write_options']={'max_entries':getattr(args,'shardentries',None),'max_bytes':getattr(args,'shardbytes',None),
+                                 'compression':getattr(args,'compression',None)}
+    sword_dataset.close()
 
     #get set
     Algorithms=['MetroMan','HiVDI','SIC']
     #Algorithms=['HiVDI']
     #Algorithms=['MetroMan']
     #Algorithms=['SIC']
-    
-    for Algorithm in Algorithms:
+
+    workers=getattr(args,'setworkers',None) or min(len(Algorithms),os.cpu_count() or 1)
+    if getattr(args,'setpartitions',False):
+        results=find_sets_by_partition(Algorithms,continent,OUTPUT_DIR,workers)
+    elif workers > 1:
+        with multiprocessing.get_context('fork').Pool(processes=min(workers,len(Algorithms))) as pool:
+            results=pool.starmap(find_sets_for_algorithm,[(Algorithm,continent,OUTPUT_DIR) for Algorithm in Algorithms])
+    else:
+        results=[find_sets_for_algorithm(Algorithm,continent,OUTPUT_DIR) for Algorithm in Algorithms]
+
+    # logs and stats come back in algorithm order whichever worker finishes first
+    for Algorithm,log,stats in results:
+        print(log,end='')
+    for Algorithm,log,stats in results:
+        print(f"{Algorithm}: {stats['sets']} sets with {stats['reaches_in_sets']} of {stats['reaches']} reaches")
+
+    SET_INPUTS.clear()
+
+def load_sword_data(sword_dataset,reaches):
+    """Extract the SWORD reach data used to find sets as read-only arrays
+
+    Parameters
+    ----------
+    sword_dataset: netCDF4.Dataset
+        SWORD dataset
+    reaches: list
+        list of reach dictionaries
+    """
+
+    swordreachids,sword_data_continent=Sets(None,reaches,sword_dataset).extract_data_sword_continent_file()
+    for data in [swordreachids] + list(sword_data_continent.values()):
+        if isinstance(data,np.ndarray):
+            data.flags.writeable=False
+    return swordreachids,sword_data_continent
+
+def find_sets_for_algorithm(Algorithm,continent,output_dir):
+    """Find and write sets for one algorithm, returning its log and stats
+
+    Parameters
+    ----------
+    Algorithm: string
+        Algorithm name
+    continent: string
+        Continent abrevation
+    output_dir: Path
+        directory to write the sets JSON file to
+    """
+
+    log=io.StringIO()
+    with contextlib.redirect_stdout(log):
         print('Getting set for',Algorithm)
         params = SetParameters(Algorithm, continent)
         print(params)
 
-        algoset = Sets(params,reaches,sword_dataset)
+        algoset = Sets(params,SET_INPUTS['reaches'],None,sword_data=SET_INPUTS['sword_data'])
         InversionSets=algoset.getsets()
 
         # output to json file
-        algoset.write_inversion_set_data(InversionSets,OUTPUT_DIR)
+        algoset.write_inversion_set_data(InversionSets,output_dir,**SET_INPUTS['write_options'])
+
+    return Algorithm,log.getvalue(),algoset.stats
+
+def find_sets_by_partition(Algorithms,continent,output_dir,workers):
+    """Find sets one basin partition at a time and stitch each algorithm's sets back together
+
+    Parameters
+    ----------
+    Algorithms: list
+        Algorithm names
+    continent: string
+        Continent abrevation
+    output_dir: Path
+        directory to write the sets JSON files to
+    workers: int
+        number of processes to search partitions with
+    """
+
+    swordreachids,sword_data_continent=SET_INPUTS['sword_data']
+    reaches=SET_INPUTS['reaches']
+
+    tasks=[]
+    for Algorithm in Algorithms:
+        algoset=Sets(SetParameters(Algorithm, continent),reaches,None,sword_data=SET_INPUTS['sword_data'])
+        topology=algoset.build_topology(sword_data_continent,swordreachids)
+        chains=algoset.find_valid_chains(topology,sword_data_continent)
+        partitions=basin_partitions(topology,sword_data_continent,chains['StepUp'],chains['StepDown'])
+
+        # group the reaches by the partition of their SWORD row
+        partition_of_row=np.empty(len(topology.reach_id),dtype=np.int64)
+        for ipartition,rows in enumerate(partitions):
+            partition_of_row[rows]=ipartition
+        reach_rows=topology.rows_for_ids([reach['reach_id'] for reach in reaches])
+        reach_partition=np.where(reach_rows >= 0,partition_of_row[reach_rows],-1)
+        order=np.argsort(reach_partition,kind='stable')
+        ipartitions,starts=np.unique(reach_partition[order],return_index=True)
+        for ipartition,reach_indices in zip(ipartitions,np.split(order,starts[1:])):
+            if ipartition >= 0:
+                tasks.append((Algorithm,continent,partitions[ipartition],reach_indices))
+
+    if workers > 1:
+        with multiprocessing.get_context('fork').Pool(processes=workers) as pool:
+            PartitionSets=pool.starmap(find_sets_for_partition,tasks,chunksize=max(1,len(tasks)//(workers*8)))
+    else:
+        PartitionSets=[find_sets_for_partition(*task) for task in tasks]
+
+    results=[]
+    for Algorithm in Algorithms:
+        log=io.StringIO()
+        with contextlib.redirect_stdout(log):
+            print('Getting set for',Algorithm)
+            params = SetParameters(Algorithm, continent)
+            print(params)
+
+            algoset = Sets(params,reaches,None,sword_data=SET_INPUTS['sword_data'])
+            InversionSets=algoset.stitch_sets([sets for task,sets in zip(tasks,PartitionSets) if task[0] == Algorithm])
+            InversionSets=algoset.complete_sets(InversionSets)
+
+            # output to json file
+            algoset.write_inversion_set_data(InversionSets,output_dir,**SET_INPUTS['write_options'])
+        results.append((Algorithm,log.getvalue(),algoset.stats))
+
+    return results
+
+def find_sets_for_partition(Algorithm,continent,rows,reach_indices):
+    """Find the multi-reach sets of one basin partition
+
+    Parameters
+    ----------
+    Algorithm: string
+        Algorithm name
+    continent: string
+        Continent abrevation
+    rows: numpy.ndarray
+        SWORD rows of the partition
+    reach_indices: numpy.ndarray
+        indices of the partition's reaches in the reaches list
+    """
+
+    reaches=[SET_INPUTS['reaches'][i] for i in reach_indices.tolist()]
+    algoset=Sets(SetParameters(Algorithm, continent),reaches,None,
+                 sword_data=slice_sword_data(SET_INPUTS['sword_data'],rows))
+    with contextlib.redirect_stdout(io.StringIO()):
+        InversionSets=algoset.find_sets()
+
+    # sets refer to rows of the partition, stitching needs the continent rows
+    for InversionSet in InversionSets.values():
+        InversionSet['Rows']=rows[InversionSet['Rows']]
 
-    #close sword dataset
-    sword_dataset.close()  
+    return list(InversionSets.values())
 
 def SetParameters(algo, cont):
     """Seting parameters for setfinder
@@ -104,6 +251,7 @@ def SetParameters(algo, cont):
         params['MaximumReachesEachDirection']=2
         params['MinimumReaches']=3
         params['AllowedReachOverlap']=-1 # specify -1 to just remove duplicates
+        params['RemoveHighOverlapSets']=False
         # params['']
     elif algo == 'HiVDI':
         params['RequireIdenticalOrbits']=False
@@ -119,6 +267,7 @@ def SetParameters(algo, cont):
         params['MaximumReachesEachDirection']=1000
         params['MinimumReaches']=1
         params['AllowedReachOverlap']=.5
+        params['RemoveHighOverlapSets']=True
     elif algo == 'SIC':
         params['RequireIdenticalOrbits']=False
         params['DrainageAreaPctCutoff']=30.
@@ -133,6 +282,7 @@ def SetParameters(algo, cont):
         params['MaximumReachesEachDirection']=1000
         params['MinimumReaches']=1
         params['AllowedReachOverlap']=.67
+        params['RemoveHighOverlapSets']=True
  
     return params
 
@@ -0,0 +1,98 @@
+""" Split a continent into SWORD basin partitions that can be searched for sets independently
+"""
+
+# Third-party imports
+import numpy as np
+
+def basin_partitions(topology,sword_data_continent,StepUp,StepDown):
+    """Group SWORD rows into partitions of basins that no set can cross
+
+    Sets rarely cross basins, but a set walk can step from a reach to its
+    neighbour in another basin. The basins joined by such a step are merged
+    into one partition, so every set is found whole inside a single partition.
+
+    Where SWORD is topologically inconsistent get_reach_list can also end a
+    set with the first downstream reach of a member the walk reached stepping
+    upstream, when that reach isn't the one it stepped from. The basins joined
+    by such a downstream tail are merged too, so sets of different partitions
+    share no reaches and the small set and overlap removal of each partition
+    sees every set it would see in a continent-wide search.
+
+    Parameters
+    ----------
+    topology: ReachTopology
+        reach topology of the continent
+    sword_data_continent: dict
+        SWORD reach table of the continent
+    StepUp: numpy.ndarray
+        True for rows a set walk can step upstream from
+    StepDown: numpy.ndarray
+        True for rows a set walk can step downstream from
+
+    Returns
+    -------
+    list of numpy.ndarray
+        ascending SWORD rows of each partition, ordered by their first basin
+    """
+
+    # SWORD reach ids are 11 digits and the first 4 are the basin
+    basins,basin_of_row=np.unique(topology.reach_id // 10**7,return_inverse=True)
+
+    rows=np.arange(len(topology.reach_id))
+    cross=[]
+    for steps,neighbour in [(StepUp,topology.single_up),(StepDown,topology.single_dn)]:
+        pairs=np.stack([basin_of_row[rows[steps]],basin_of_row[neighbour[steps]]],axis=1)
+        cross.append(pairs[pairs[:,0] != pairs[:,1]])
+
+    # downstream tails of the reaches a walk can step upstream to
+    stepped_from=rows[StepUp]
+    members=topology.single_up[stepped_from]
+    tails=np.full(len(members),-1,dtype=np.int64)
+    with_downstream=sword_data_continent['n_rch_down'][members] >= 1
+    tails[with_downstream]=topology.rows_for_ids(sword_data_continent['rch_id_dn'][0,members[with_downstream]])
+    tailed=(tails >= 0) & (tails != stepped_from)
+    pairs=np.stack([basin_of_row[members[tailed]],basin_of_row[tails[tailed]]],axis=1)
+    cross.append(pairs[pairs[:,0] != pairs[:,1]])
+    cross=np.unique(np.concatenate(cross),axis=0)
+
+    # union-find over the few cross-basin links
+    parent=list(range(len(basins)))
+    def find(basin):
+        while parent[basin] != basin:
+            parent[basin]=parent[parent[basin]]
+            basin=parent[basin]
+        return basin
+    for a,b in cross.tolist():
+        a,b=find(a),find(b)
+        if a != b:
+            parent[max(a,b)]=min(a,b)
+
+    partition_of_basin=np.array([find(basin) for basin in range(len(basins))],dtype=np.int64)
+    partition_of_row=partition_of_basin[basin_of_row]
+    order=np.argsort(partition_of_row,kind='stable')
+    partitions,starts=np.unique(partition_of_row[order],return_index=True)
+    return np.split(order,starts[1:])
+
+def slice_sword_data(sword_data,rows):
+    """Return the SWORD reach data of the given rows
+
+    Parameters
+    ----------
+    sword_data: tuple
+        SWORD reach ids and continent data as extracted by Sets
+    rows: numpy.ndarray
+        ascending SWORD rows to keep
+    """
+
+    swordreachids,sword_data_continent=sword_data
+    partition_data={}
+    for key,data in sword_data_continent.items():
+        if key == 'num_reaches':
+            partition_data[key]=len(rows)
+        elif np.ndim(data) == 1:
+            partition_data[key]=data[rows]
+        elif np.ndim(data) == 2:
+            partition_data[key]=data[:,rows]
+        else:
+            partition_data[key]=data
+    return swordreachids[rows],partition_data
@@ -1,6 +1,7 @@
 # Standard imports
+from collections import defaultdict
+import heapq
 import itertools
-import json
 
 # Third-party imports
 import numpy as np
@@ -13,6 +14,13 @@ import pandas as pd
 import random
 import webbrowser
 
+# Local imports
+from datagen.JsonWriter import write_json
+try:
+    from topology import ReachTopology, first_rows
+except ImportError:
+    from sets.topology import ReachTopology, first_rows
+
 class Sets:
     """ Divide a list of reaches into inversion sets.
 
@@ -20,23 +28,34 @@ class Sets:
     ----------
     params: dict
         dictionary of parameters to control how sets get defined   
+    sword_data: tuple
+        SWORD reach ids and continent reach table, extracted from sword_dataset when not given.
+        Each inversion set keeps the table rows of its reaches in 'Rows'
+    stats: dict
+        set statistics of the last getsets call
 
     
     Methods
     -------
 
     """
-    def __init__(self,params,reaches,sword_dataset):
+    def __init__(self,params,reaches,sword_dataset,sword_data=None):
 
         self.params=params
         self.reaches=reaches
         self.sword_dataset=sword_dataset
+        self.sword_data=sword_data
+        self.reach_ids={reach['reach_id'] for reach in reaches}
+        self.stats={}
 
     def extract_data_sword_continent_file(self):
         """
         Extracting data that is used to defind sets from SWORD
+
+        The data is kept as a table of plain arrays with one column per field,
+        2-D fields padded over num_domains or orbits, and sets refer to its rows.
         """
-        swordreachids=self.sword_dataset["reaches/reach_id"][:]
+        swordreachids=np.ma.getdata(self.sword_dataset["reaches/reach_id"][:])
         sword_data_continent={}
 
         # grab sizes of the data
@@ -47,70 +66,172 @@ class Sets:
         # grab data    
         reachfields=['reach_id','facc','n_rch_up','n_rch_down','rch_id_up','rch_id_dn','swot_obs','swot_orbits']
         for field in reachfields:
-            sword_data_continent[field]=self.sword_dataset['reaches/' + field][:]
+            sword_data_continent[field]=np.ma.getdata(self.sword_dataset['reaches/' + field][:])
+        sword_data_continent['reach_type']=sword_data_continent['reach_id'] % 10
 
         return swordreachids,sword_data_continent
 
     def extract_inversion_sets_by_reach(self,sword_data_continent,swordreachids):
         """
         loop over all reaches and create a set for each
+
+        Sets are cut out of the maximal chains of valid reaches in the SWORD
+        topology. Reaches whose walk would run into a topological inconsistency
+        or a loop, which chains can't represent, fall back to find_set_for_reach.
         """
 
+        topology=self.build_topology(sword_data_continent,swordreachids)
+        chains=self.find_valid_chains(topology,sword_data_continent)
+
+        n_rch_up=sword_data_continent['n_rch_up']
+        rows=topology.rows_for_ids([reach['reach_id'] for reach in self.reaches])
+
         InversionSets={}
-        nreach=len(self.reaches)
-        count=0
-        for reach in self.reaches:
-            count+=1  
-            #print('finding set for reach',reach['reach_id'])
-            #if count % 100 == 0:
-            #    print('Processing reach ',count,'/',nreach)
-            k=np.argwhere(swordreachids == reach['reach_id'])
-            try:
-                k=k[0,0] # not sure why argwhere is returning this as a 2-d array. this seems inelegant
-                # print(k)
-            except:
+        for reach,k in zip(self.reaches,rows.tolist()):
+            if k == -1 or n_rch_up[k] != 1:
                 continue
-        
-            sword_data_reach=self.pull_sword_attributes_for_reach(sword_data_continent,k)
 
-            if sword_data_reach['n_rch_up']==1:
-                InversionSet=self.find_set_for_reach(sword_data_reach,swordreachids,sword_data_continent)
-                InversionSet['ReachList'],InversionSet['numReaches']=self.get_reach_list(InversionSet)
-                InversionSets[reach['reach_id']]=InversionSet
+            InversionSet=self.cut_set_from_chain(chains,k,sword_data_continent)
+            if InversionSet is None:
+                InversionSet=self.find_set_for_reach(k,topology,sword_data_continent)
+                InversionSet['Rows'],InversionSet['numReaches']=self.get_reach_list(InversionSet,topology,sword_data_continent)
+            InversionSets[reach['reach_id']]=InversionSet
 
         return InversionSets
 
-    def pull_sword_attributes_for_reach(self,sword_data_continent,k):
+    def build_topology(self,sword_data_continent,swordreachids):
+        """
+        Build the reach topology graph of the SWORD data
+        """
+
+        return ReachTopology(swordreachids,
+                             sword_data_continent['n_rch_up'],
+                             sword_data_continent['n_rch_down'],
+                             sword_data_continent['rch_id_up'],
+                             sword_data_continent['rch_id_dn'])
+
+    def find_valid_chains(self,topology,sword_data_continent):
         """
-        Pull out needed SWORD data from the continent dataset arrays for a particular reach    
+        Mark the topology links that pass the CheckReaches criteria and split them into chains
+
+        CheckReaches compares each added reach with the origin reach, but along a
+        walk the orbit test is the same as comparing neighbours, so only the
+        drainage area test depends on the origin and is left to cut_set_from_chain.
         """
 
-        sword_data_reach={}
-        # extract all single-dimension variables, including number of orbits and reach ids needed for multi-dim vars
-        for key in sword_data_continent:
-            if np.shape(sword_data_continent[key]) == (sword_data_continent['num_reaches'],):
-                sword_data_reach[key]=sword_data_continent[key][k]
+        n_rch_up=sword_data_continent['n_rch_up']
+        n_rch_down=sword_data_continent['n_rch_down']
+
+        # reaches that can be added to a set
+        CanBeAdded=np.isin(topology.reach_id,list(self.reach_ids))
+        if not self.params['AllowRiverJunction']:
+            CanBeAdded &= (n_rch_up <= 1) & (n_rch_down <= 1)
+
+        # steps the walk in find_set_for_reach would take, drainage area aside
+        up=topology.single_up
+        dn=topology.single_dn
+        StepUp=(up >= 0) & CanBeAdded[up] & self.orbits_match(sword_data_continent,np.arange(len(up)),up)
+        StepDown=(dn >= 0) & CanBeAdded[dn] & self.orbits_match(sword_data_continent,np.arange(len(dn)),dn)
+
+        chain_rows,chain_indptr,chain_of_row,position_of_row=topology.find_chains(CanBeAdded & StepUp)
+
+        # chain ends where the walk would carry on through a one-way or looping link
+        heads=chain_rows[chain_indptr[:-1]]
+        bottoms=chain_rows[chain_indptr[1:]-1]
+        DirtyHead=StepUp[heads]
+        DirtyBottom=StepDown[bottoms] & (up[np.maximum(dn[bottoms],0)] != bottoms)
+
+        return {'rows':chain_rows,'indptr':chain_indptr,'chain':chain_of_row,'position':position_of_row,
+                'CanBeAdded':CanBeAdded,'DirtyHead':DirtyHead,'DirtyBottom':DirtyBottom,
+                'StepUp':StepUp,'StepDown':StepDown}
+
+    def orbits_match(self,sword_data_continent,rows,other_rows):
+        """
+        Check whether pairs of reaches have identical swot orbits, True when orbits are not required to match
+        """
+
+        if not self.params['RequireIdenticalOrbits']:
+            return np.ones(len(rows),dtype=bool)
+
+        swot_obs=sword_data_continent['swot_obs']
+        swot_orbits=sword_data_continent['swot_orbits']
+        other_rows=np.maximum(other_rows,0)
+
+        SameOrbits=swot_obs[rows]==swot_obs[other_rows]
+        orbit_slots=np.arange(swot_orbits.shape[0])[:,np.newaxis]
+        SlotMatches=(swot_orbits[:,rows]==swot_orbits[:,other_rows]) | (orbit_slots >= swot_obs[rows])
+        return SameOrbits & SlotMatches.all(axis=0)
+
+    def cut_set_from_chain(self,chains,k,sword_data_continent):
+        """
+        Cut the set for origin reach k out of its chain, None when the set has to be walked instead
+        """
+
+        if not self.params['AllowRiverJunction'] and sword_data_continent['n_rch_down'][k] > 1:
+            # a junction at the origin reach stops the set before it starts
+            return self.make_inversion_set(np.array([k]),0)
+
+        ichain=chains['chain'][k]
+        if ichain == -1 or not chains['CanBeAdded'][k]:
+            return None
 
-        # extract multi-dim vars
-        for key in sword_data_continent:
-            if key == 'rch_id_up':
-                sword_data_reach[key]=sword_data_continent[key][0:sword_data_reach['n_rch_up'],k]
-            elif key == 'rch_id_dn':
-                sword_data_reach[key]=sword_data_continent[key][0:sword_data_reach['n_rch_down'],k]
-            elif key == 'swot_orbits':
-                sword_data_reach[key]=sword_data_continent[key][0:sword_data_reach['swot_obs'],k]
+        chain_rows=chains['rows'][chains['indptr'][ichain]:chains['indptr'][ichain+1]]
+        p=chains['position'][k]
 
-        return sword_data_reach
+        # the walk adds one more reach than MaximumReachesEachDirection before it stops
+        nmax=self.params['MaximumReachesEachDirection']+1
+        window=chain_rows[max(p-nmax,0):p+nmax+1]
+        k_in_window=p-max(p-nmax,0)
 
-    def find_set_for_reach(self,sword_data_reach,swordreachids,sword_data_continent):    
-        """Seting parameters for setfinder
+        facc=sword_data_continent['facc']
+        with np.errstate(divide='ignore',invalid='ignore'):
+            AccumulationAreaDifferencePct=(facc[window]-facc[k])/facc[k]*100
+        TooDifferent=AccumulationAreaDifferencePct > self.params['DrainageAreaPctCutoff']
+
+        # upstream, stop before the first reach with too different a drainage area
+        upstream=np.flatnonzero(TooDifferent[:k_in_window])
+        first=upstream[-1]+1 if len(upstream) else 0
+        ReachedHead=len(upstream) == 0 and p == k_in_window and p < nmax
+        if ReachedHead and chains['DirtyHead'][ichain]:
+            return None
+
+        # downstream
+        downstream=np.flatnonzero(TooDifferent[k_in_window+1:])
+        last=k_in_window+downstream[0] if len(downstream) else len(window)-1
+        ReachedBottom=len(downstream) == 0 and p+nmax >= len(chain_rows)-1 and last-k_in_window < nmax
+        if ReachedBottom and chains['DirtyBottom'][ichain]:
+            return None
+
+        return self.make_inversion_set(window[first:last+1],k_in_window-first)
+
+    def make_inversion_set(self,rows,origin):
+        """
+        Build an inversion set from the SWORD rows of its reaches, ordered from upstream to downstream
+
+        Along a chain the rows are already in the order get_reach_list would put them in.
+        """
+
+        InversionSet={}
+        InversionSet['OriginRow']=rows[origin]
+        InversionSet['Members']=rows
+        InversionSet['UpstreamRow']=rows[0]
+        InversionSet['DownstreamRow']=rows[-1]
+        InversionSet['Rows']=rows
+        InversionSet['numReaches']=len(rows)
+
+        return InversionSet
+
+    def find_set_for_reach(self,k,topology,sword_data_continent):    
+        """Walk up and downstream from a reach to find its set
 
         Parameters
         ----------
-        sword_data_reach: dict
-            Dictionary of relevant data from SWORD
-        swordreachids: list
-            List of sword reach ids
+        k: int
+            SWORD row of the origin reach
+        topology: ReachTopology
+            reach topology of the SWORD data
+        sword_data_continent: dict
+            SWORD reach table
         """
         
         # ok so lets define a set:
@@ -121,31 +242,27 @@ class Sets:
 
         # 1. initialize
         InversionSet={}
-        InversionSet['OriginReach']=sword_data_reach
-        InversionSet['Reaches']={}
-        InversionSet['Reaches'][sword_data_reach['reach_id']]=sword_data_reach
+        InversionSet['OriginRow']=k
+        Members={k}
         # initially, the upstream and downstream reaches are both set to the origin reach
-        InversionSet['UpstreamReach']=sword_data_reach
-        InversionSet['DownstreamReach']=sword_data_reach
+        InversionSet['UpstreamRow']=k
+        InversionSet['DownstreamRow']=k
         # 2. check whether we can expand upstream. keep going upstream until we hit an invalid reach
         UpstreamReachIsValid=True
         n_up_add=0
         while UpstreamReachIsValid:
-            upstream_reaches = InversionSet['UpstreamReach']['rch_id_up']
-            upstream_reaches = upstream_reaches.data
-            kup=np.argwhere(swordreachids == upstream_reaches)
+            # the upstream reach has to be the only one and appear once in SWORD
+            kup=topology.single_up[InversionSet['UpstreamRow']]
 
-            if len(kup)!=1:
+            if kup == -1:
                   UpstreamReachIsValid=False
             else:
-                  kup=kup[0,0]
-                  sword_data_reach_up=self.pull_sword_attributes_for_reach(sword_data_continent,kup)
-                  UpstreamReachIsValid=self.CheckReaches(sword_data_reach,sword_data_reach_up,'up',CheckVerbosity)
+                  UpstreamReachIsValid=self.CheckReaches(sword_data_continent,k,kup,'up',CheckVerbosity)
 
             if UpstreamReachIsValid:
                 #its valid, add a new reach to the set
-                InversionSet['Reaches'][sword_data_reach_up['reach_id']]=sword_data_reach_up
-                InversionSet['UpstreamReach']=sword_data_reach_up
+                Members.add(kup)
+                InversionSet['UpstreamRow']=kup
                 n_up_add+=1
                 if n_up_add > self.params['MaximumReachesEachDirection']:
                     UpstreamReachIsValid=False
@@ -154,39 +271,42 @@ class Sets:
         DownstreamReachIsValid=True
         n_dn_add=0
         while DownstreamReachIsValid:
-            kdn=np.argwhere(swordreachids == InversionSet['DownstreamReach']['rch_id_dn'])
+            kdn=topology.single_dn[InversionSet['DownstreamRow']]
 
-            if len(kdn)!=1:
+            if kdn == -1:
                 DownstreamReachIsValid=False
             else:
-                kdn=kdn[0,0]
-                sword_data_reach_dn=self.pull_sword_attributes_for_reach(sword_data_continent,kdn)
-                DownstreamReachIsValid=self.CheckReaches(sword_data_reach,sword_data_reach_dn,'down',CheckVerbosity)
+                DownstreamReachIsValid=self.CheckReaches(sword_data_continent,k,kdn,'down',CheckVerbosity)
                 if DownstreamReachIsValid:
-                    InversionSet['Reaches'][sword_data_reach_dn['reach_id']]=sword_data_reach_dn
-                    InversionSet['DownstreamReach']=sword_data_reach_dn
+                    Members.add(kdn)
+                    InversionSet['DownstreamRow']=kdn
                     n_dn_add+=1
                     if n_dn_add > self.params['MaximumReachesEachDirection']:
                         DownstreamReachIsValid=False
 
-        return InversionSet
+        InversionSet['Members']=np.array(sorted(Members),dtype=np.int64)
 
-    def CheckReaches(self,sword_data_reach,sword_data_reach_adjacent,direction,verbose):
+        return InversionSet
 
-        reach_ids=[]
-        for reach in self.reaches:
-             reach_ids.append(reach['reach_id'])
+    def CheckReaches(self,sword_data_continent,k,kadj,direction,verbose):
 
-        AdjacentReachInReaches=sword_data_reach_adjacent['reach_id'] in reach_ids
+        AdjacentReachInReaches=int(sword_data_continent['reach_id'][kadj]) in self.reach_ids
 
+        swot_obs=sword_data_continent['swot_obs']
+        swot_orbits=sword_data_continent['swot_orbits']
         OrbitsAreIdentical=False
-        if sword_data_reach['swot_obs']==sword_data_reach_adjacent['swot_obs']:
-            OrbitsAreIdentical=list(sword_data_reach['swot_orbits'])==list(sword_data_reach_adjacent['swot_orbits'])
-        AccumulationAreaDifferencePct=(sword_data_reach_adjacent['facc']-sword_data_reach['facc'])/sword_data_reach['facc']*100
+        if swot_obs[k]==swot_obs[kadj]:
+            OrbitsAreIdentical=np.array_equal(swot_orbits[0:swot_obs[k],k],swot_orbits[0:swot_obs[kadj],kadj])
+
+        facc=sword_data_continent['facc']
+        with np.errstate(divide='ignore',invalid='ignore'):
+            AccumulationAreaDifferencePct=(facc[kadj]-facc[k])/facc[k]*100
 
+        n_rch_up=sword_data_continent['n_rch_up']
+        n_rch_down=sword_data_continent['n_rch_down']
         RiverJunctionPresent=False
-        if sword_data_reach['n_rch_up'] > 1 or sword_data_reach['n_rch_down']>1  \
-             or sword_data_reach_adjacent['n_rch_up'] > 1 or sword_data_reach_adjacent['n_rch_down']>1:
+        if n_rch_up[k] > 1 or n_rch_down[k]>1  \
+             or n_rch_up[kadj] > 1 or n_rch_down[kadj]>1:
             RiverJunctionPresent=True
 
         ReachesMakeAValidSet=True
@@ -200,8 +320,8 @@ class Sets:
             ReachesMakeAValidSet=False
      
         if verbose:
-            print('reach:',sword_data_reach)
-            print('adjacent reach:',sword_data_reach_adjacent)
+            print('reach:',sword_data_continent['reach_id'][k])
+            print('adjacent reach:',sword_data_continent['reach_id'][kadj])
             print('drainage area pct diff:',AccumulationAreaDifferencePct)
             print('same swot coverage as adjacent reach',OrbitsAreIdentical)
             print('there is a river junction present:',RiverJunctionPresent)
@@ -209,82 +329,95 @@ class Sets:
 
         return ReachesMakeAValidSet
 
-    def get_reach_list(self,InversionSet):
+    def get_reach_list(self,InversionSet,topology,sword_data_continent):
+        """
+        Order the rows of a walked set from upstream to downstream
+
+        The list follows the first downstream reach of each member, so where SWORD is
+        topologically inconsistent it can end with a SWORD reach that isn't itself a
+        member. The walk stops without adding a reach when the last member has no
+        downstream reach or its first downstream id is not a SWORD reach, where the
+        old walk added that id before stopping. It also stops before a reach already in
+        the list that isn't the downstream reach of the set, where the first downstream
+        reaches of the members run in a loop that the old walk never left.
+        """
 
-        if len(InversionSet['Reaches'].keys()) == 1:
+        reach_id=topology.reach_id
+        if len(InversionSet['Members']) == 1:
              #then the reach list is just one reach
-             ReachList=[InversionSet['OriginReach']['reach_id']]
-             numReaches=1
+             Rows=[InversionSet['OriginRow']]
         else:
              # make a list of the reaches in the set, in order from upstream to downstream
-             ReachList=[]
-             ReachList.append(InversionSet['UpstreamReach']['reach_id'])
-             EndOfSetReached=ReachList[-1]==InversionSet['DownstreamReach']
+             MemberRows={reach_id[row]:row for row in InversionSet['Members'].tolist()}
+             DownstreamReachId=reach_id[InversionSet['DownstreamRow']]
+             Rows=[InversionSet['UpstreamRow']]
+             RowsInList={InversionSet['UpstreamRow']}
+             EndOfSetReached=False
 
-             # sort the list of reach ids
              while not EndOfSetReached:
-                 CurrentEndOfSet=ReachList[-1]
-                 try: 
-                     #can reach here when there are SWORD topological inconsistencies
-                     next_reach_id_downstream=InversionSet['Reaches'][CurrentEndOfSet]['rch_id_dn'][0]
-                 except:
-                     EndOfSetReached=True                     
-
-                 if not EndOfSetReached:
-                     ReachList.append(next_reach_id_downstream)
-                     EndOfSetReached=ReachList[-1]==InversionSet['DownstreamReach']['reach_id']
-
-             numReaches=len(ReachList)
-        return ReachList,numReaches
+                 #can reach the end early when there are SWORD topological inconsistencies
+                 CurrentEndOfSet=MemberRows.get(reach_id[Rows[-1]])
+                 if CurrentEndOfSet is None or sword_data_continent['n_rch_down'][CurrentEndOfSet] < 1:
+                     break
+
+                 next_reach_id_downstream=sword_data_continent['rch_id_dn'][0,CurrentEndOfSet]
+                 next_row=MemberRows.get(next_reach_id_downstream)
+                 if next_row is None:
+                     next_row=topology.rows_for_ids([next_reach_id_downstream])[0]
+                     if next_row == -1:
+                         break
+                 if next_row in RowsInList and next_reach_id_downstream != DownstreamReachId:
+                     break
+
+                 Rows.append(next_row)
+                 RowsInList.add(next_row)
+                 EndOfSetReached=next_reach_id_downstream==DownstreamReachId
+
+        Rows=np.array(Rows,dtype=np.int64)
+        return Rows,len(Rows)
 
     def remove_duplicate_or_high_overlap_sets(self,InversionSets,swordreachids,sword_data_continent):
        print('removing dupes...')
-       InversionSetsList=self.get_IS_list(InversionSets,'','')
-
-       InversionSetsListNoDupes=[]
-       for InversionSet in InversionSetsList:
+       SortedRows=[]
+       ReachLists=[]
+       for InversionSet in InversionSets.values():
+           Rows,ReachList=self.MakeReachList(InversionSet['Rows'],swordreachids)
+           SortedRows.append(Rows)
+           ReachLists.append(ReachList)
+
+       ReachListsNoDupes=[]
+       SetsNoDupes=[]
+       for OriginReachId,Rows,ReachList in zip(InversionSets,SortedRows,ReachLists):
            SetAlreadyIncluded_or_HighOverlap=False
-           for ISnew in InversionSetsListNoDupes:
-               if self.CheckSetsAreSame_or_HighOverlap(InversionSet,ISnew):
+           for ReachListNew in ReachListsNoDupes:
+               if self.CheckSetsAreSame_or_HighOverlap(ReachList,ReachListNew):
                    SetAlreadyIncluded_or_HighOverlap=True
+                   break
            if not SetAlreadyIncluded_or_HighOverlap:
-               InversionSetsListNoDupes.append(InversionSet)
+               ReachListsNoDupes.append(ReachList)
+               SetsNoDupes.append((OriginReachId,Rows))
 
                
        
-       print('before removing dupes, n=',len(InversionSetsList))
-       print('after removing dupes, n=',len(InversionSetsListNoDupes))
+       print('before removing dupes, n=',len(ReachLists))
+       print('after removing dupes, n=',len(ReachListsNoDupes))
 
        InversionSetsNoDupes={}
        setkey=0
-       for InversionSet in InversionSetsListNoDupes:
+       for OriginReachId,Rows in SetsNoDupes:
            setkey+=1
-           ReachList=self.MakeReachList(InversionSet)
 
-           #setkey=InversionSet[0]['reach_id']
            InversionSetsNoDupes[setkey]={}
-           InversionSetsNoDupes[setkey]['ReachList']=ReachList
-           InversionSetsNoDupes[setkey]['numReaches']=len(InversionSet)
-           InversionSetsNoDupes[setkey]['Reaches']={}
-
-           for reachid in InversionSetsNoDupes[setkey]['ReachList']:
-               k=np.argwhere(swordreachids == np.int64(reachid))
-               try:
-                k=k[0,0] # not sure why argwhere is returning this as a 2-d array. this seems inelegant
-               except:
-                continue
-               sword_data_reach=self.pull_sword_attributes_for_reach(sword_data_continent,k)
-               InversionSetsNoDupes[setkey]['Reaches'][reachid]=sword_data_reach
+           InversionSetsNoDupes[setkey]['OriginReachId']=OriginReachId
+           InversionSetsNoDupes[setkey]['Rows']=Rows
+           InversionSetsNoDupes[setkey]['numReaches']=len(Rows)
 
        return InversionSetsNoDupes
 
     #function to check for duplicates
-    def CheckSetsAreSame_or_HighOverlap(self,Set1,Set2):
+    def CheckSetsAreSame_or_HighOverlap(self,Set1List,Set2List):
         SetsAreSame=False
-        if len(Set1)==len(Set2):
-            Set1List=self.MakeReachList(Set1)
-            Set2List=self.MakeReachList(Set2)               
-        
+        if len(Set1List)==len(Set2List):
             if Set1List==Set2List:
                 SetsAreSame=True
 
@@ -302,56 +435,59 @@ class Sets:
         return SetsAreSame
 
     # function to make a reach list
-    def MakeReachList(self,Set):
-        ReachList=[]
-        for Reach in Set:
-            ReachList.append(Reach['reach_id'])
-        
-        #sort does ascending by default. reverse goes descending, from upstream to downstream in SWORD
-        ReachList.sort(reverse=True) 
+    def MakeReachList(self,Rows,swordreachids):
+        ReachIds=swordreachids[Rows]
 
-        
-        return ReachList
+        #descending order of reach id, from upstream to downstream in SWORD. equal ids keep their order
+        order=np.argsort(-ReachIds,kind='stable')
+
+        return Rows[order],ReachIds[order].tolist()
  
     def remove_high_overlap_sets(self,InversionSets):
-        HighOverlap=True
-        itercount=0
+        """
+        Remove sets that overlap an earlier set by more than AllowedReachOverlap
 
-        #maxiter of 10 or 100 to debug. 10 takes 45 sec. 100 takes 3.5 minutes. 1e4 needed to generate good sets
-        #maxiter=10
-        maxiter=1e4
+        Walking the sets in key order, every set that survives removes all later
+        sets it overlaps too much with, which is what the old pairwise restart loop
+        converged to. Sets are indexed by reach so overlaps are only counted for
+        pairs that share a reach, and the high overlap pairs are popped from a heap
+        in (earlier set, later set) order so everything is removed in one sweep.
+        """
 
         print('... remove_high_overlap_sets, starting with ',len(InversionSets),' sets')
 
-        while HighOverlap:
-            itercount+=1
-            if itercount % 10 == 0:
-                print('.... iteration #',itercount, '; maximum is ', maxiter, ' iterations.')
-
-            reaches=list(InversionSets.keys())
-            reach_combos=list(itertools.combinations(reaches,2))
-
-            ncombos=len(reach_combos)
-            #print('there are ',ncombos,'combinations')
- 
-            nremoved=0
-            for combo in reach_combos:
-                is0=InversionSets[combo[0]]['ReachList']
-                is1=InversionSets[combo[1]]['ReachList']
-                overlap = list( set(is0) & set(is1))
-                pctoverlap= len(overlap) / ( (len(is0) + len(is1))/2 )
- 
-                #if pctoverlap > 0.67:
-                if pctoverlap > self.params['AllowedReachOverlap']:
-                    #print('removing set with overlap=',pctoverlap,'for',combo[1])
-                    nremoved+=1
-                    del InversionSets[combo[1]]
-                    break
-                if combo==reach_combos[-1]:
-                    HighOverlap=False
+        setkeys=list(InversionSets.keys())
+        ReachLists=[InversionSets[setkey]['Rows'].tolist() for setkey in setkeys]
+
+        # index sets by reach
+        SetsByReach=defaultdict(list)
+        for iset,ReachList in enumerate(ReachLists):
+            for reach in set(ReachList):
+                SetsByReach[reach].append(iset)
+
+        # count shared reaches for each pair of sets, pairs come out as (earlier, later)
+        SharedReaches=defaultdict(int)
+        for SetsWithReach in SetsByReach.values():
+            for pair in itertools.combinations(SetsWithReach,2):
+                SharedReaches[pair]+=1
+
+        HighOverlapPairs=[]
+        for pair,noverlap in SharedReaches.items():
+            pctoverlap= noverlap / ( (len(ReachLists[pair[0]]) + len(ReachLists[pair[1]]))/2 )
+            if pctoverlap > self.params['AllowedReachOverlap']:
+                HighOverlapPairs.append(pair)
+        heapq.heapify(HighOverlapPairs)
+
+        # a set removed by an earlier set can no longer remove anything itself
+        removed=set()
+        while HighOverlapPairs:
+            iset,jset=heapq.heappop(HighOverlapPairs)
+            if iset in removed or jset in removed:
+                continue
+            removed.add(jset)
+            del InversionSets[setkeys[jset]]
 
-            if itercount>maxiter or nremoved == 0:
-                HighOverlap=False
+        print('... removed ',len(removed),' high overlap sets')
 
         return InversionSets
  
@@ -359,69 +495,46 @@ class Sets:
         #only add reaches that are type 
 
         #get all reaches currently in sets
-        reaches_in_sets=[]
+        reaches_in_sets=set()
         for IS in InversionSets:
-            reach_list=InversionSets[IS]['ReachList']
-            for reach in reach_list:
-                reaches_in_sets.append(int(reach))
+            reaches_in_sets.update(swordreachids[InversionSets[IS]['Rows']].tolist())
  
         # get all reaches 
-        all_reaches=[]
-        for reach in self.reaches:
-             all_reaches.append(int(reach['reach_id']))
-             #reachid=reach['reach_id']
-             #reachidstr=str(reachid)
-             #if reachidstr[:-1]=='1':
-                 #all_reaches.append(int(reachid))
-                 #all_reaches.append(int(reach['reach_id']))
+        all_reaches=[int(reach['reach_id']) for reach in self.reaches]
 
         #get a list of reaches that are in all_reaches, but NOT in reaches_in_sets
-        excluded_reaches = list(set(all_reaches) - set(reaches_in_sets))
-
-
-        #add all "excluded" reaches to InversionSets
-        iadd=0
-        for excluded_reach in excluded_reaches:
-            #print('adding ',excluded_reach)
-            excluded_reach_str=str(excluded_reach)
-            if excluded_reach_str[-1]=='1':
-                iadd+=1
-                InversionSet={}
-                InversionSet['ReachList']=[excluded_reach]
-                InversionSet['numReaches']=1
-                InversionSet['Reaches']={}
-
-                k=np.argwhere(swordreachids == np.int64(excluded_reach))
-                try:
-                    k=k[0,0] # not sure why argwhere is returning this as a 2-d array. this seems inelegant
-                except:
-                    continue
-                sword_data_reach=self.pull_sword_attributes_for_reach(sword_data_continent,k)
-
-                InversionSet['Reaches'][excluded_reach]=sword_data_reach
+        #this stays a set difference, its iteration order is the order single-reach sets have always been written in
+        excluded_reaches=np.array(list(set(all_reaches) - reaches_in_sets),dtype=np.int64)
+
+        #add all "excluded" river reaches to InversionSets, looking up their SWORD rows all at once
+        river_reaches=excluded_reaches[excluded_reaches % 10 == 1]
+        rows=first_rows(swordreachids,river_reaches)
+        iadd=len(river_reaches)
+        for excluded_reach,k in zip(river_reaches.tolist(),rows.tolist()):
+            if k == -1:
+                continue
 
-                #print(InversionSet)
-                InversionSets[excluded_reach]=InversionSet
+            InversionSet={}
+            InversionSet['Rows']=np.array([k],dtype=np.int64)
+            InversionSet['numReaches']=1
+            InversionSets[excluded_reach]=InversionSet
 
         print('added in ', iadd, ' single-set reaches')
 
         return InversionSets
 
 
-    def remove_sets_with_non_river_reaches(self,InversionSets):
+    def remove_sets_with_non_river_reaches(self,InversionSets,sword_data_continent):
 
        nsets=len(InversionSets)
        SetIsBad={}
 
        iscount=0
 
+       # the last digit of a reach id is its type, 1 for rivers
+       reach_type=sword_data_continent['reach_type']
        for IS in InversionSets:
-            ContainsNonRiverReach=False
-            for reach in InversionSets[IS]['Reaches']:
-                reachstr=str(reach)
-                reachtype=reachstr[-1]
-                if reachtype != '1':
-                    ContainsNonRiverReach=True
+            ContainsNonRiverReach=bool((reach_type[InversionSets[IS]['Members']] != 1).any())
             if ContainsNonRiverReach:
                 SetIsBad[IS]=True
             else:
@@ -443,16 +556,15 @@ class Sets:
                del InversionSets[reach]
 
        # second, if it's a one-reach-set, remove if the reach exists in another set
-       reaches=list(InversionSets.keys())
-       SetsToRemove=[]
-       for reach in reaches:
-          if InversionSets[reach]['numReaches'] == 1:
-              for otherreach in reaches:
-                  if otherreach != reach and reach in InversionSets[otherreach]['ReachList']: 
-                      SetsToRemove.append(reach)
+       SetsWithRow=defaultdict(set)
+       for setkey in InversionSets:
+           for row in InversionSets[setkey]['Rows'].tolist():
+               SetsWithRow[row].add(setkey)
 
-       # remove duplicates
-       SetsToRemove=list(set(SetsToRemove))
+       SetsToRemove=[]
+       for reach in InversionSets:
+          if InversionSets[reach]['numReaches'] == 1 and SetsWithRow[InversionSets[reach]['Rows'][0]] - {reach}:
+              SetsToRemove.append(reach)
 
        for reach in SetsToRemove:
           del InversionSets[reach] 
@@ -468,7 +580,7 @@ class Sets:
         df=pd.DataFrame(columns=["ID", "x",'y'])
         for key in IS:
             TS=IS[key]
-            RIDS=TS['ReachList']
+            RIDS=self.sword_data[0][TS['Rows']]
             IS[key]['x']=[]
             IS[key]['y']=[]
 
@@ -507,35 +619,35 @@ class Sets:
         mm.save(fname)
         webbrowser.open(fname)
 
-    def write_inversion_set_data(self,InversionSets,OutputDir):
+    def write_inversion_set_data(self,InversionSets,OutputDir,max_entries=None,max_bytes=None,compression=None):
         out_json = OutputDir / self.params['Filename']
 
         # these should be the same for each reach in the reaches file
         swordfile=self.reaches[0]['sword']
         sosfile=self.reaches[0]['sos']
 
-        InversionSetsWrite=self.get_IS_list(InversionSets,swordfile,sosfile)
-
-        with open(out_json, 'w') as json_file:
-            json.dump(InversionSetsWrite, json_file, indent=2)
+        write_json(self.iter_IS_list(InversionSets,swordfile,sosfile),out_json,max_entries,max_bytes,compression)
 
     def get_IS_list(self,InversionSets,swordfile,sosfile):
         #makes a list of inversion sets, where each list item is a another list of inversion set data
         #each inversion set list item is a dict of the data for each reach
 
-        InversionSetsList=[]
+        return list(self.iter_IS_list(InversionSets,swordfile,sosfile))
+
+    def iter_IS_list(self,InversionSets,swordfile,sosfile):
+        #yields the inversion sets of get_IS_list one at a time
+
+        swordreachids=self.sword_data[0]
         for IS in InversionSets:
              InversionSetWrite=[]
-             for reach in InversionSets[IS]['ReachList']:
+             for reach in swordreachids[InversionSets[IS]['Rows']].tolist():
                  reachdict={}
                  reachdict['reach_id']=int(reach)
                  reachdict['sword']=swordfile
                  reachdict['swot']=str(reach) + '_SWOT.nc'
                  reachdict['sos']=sosfile
                  InversionSetWrite.append(reachdict)
-             InversionSetsList.append(InversionSetWrite)
-        
-        return InversionSetsList
+             yield InversionSetWrite
 
     def print_stats(self,InversionSets):
         # output some stats
@@ -550,12 +662,31 @@ class Sets:
         print('total number of reaches:',len(self.reaches))
         print('A total of', len(InversionSets.keys()),'sets were identified.')
         print('Total reaches included in sets:',sum(numReaches))
-        
+
+        return {'reaches':len(self.reaches),'sets':len(InversionSets.keys()),'reaches_in_sets':sum(numReaches)}
 
     def getsets(self):
         # extract continent data into dict
-        print('extracting data...')
-        swordreachids,sword_data_continent=self.extract_data_sword_continent_file()
+        if self.sword_data is None:
+            print('extracting data...')
+            self.sword_data=self.extract_data_sword_continent_file()
+
+        InversionSets=self.find_sets()
+        InversionSets=self.complete_sets(InversionSets)
+
+        # map
+        #self.MKmap(InversionSets)
+    
+        return InversionSets
+
+    def find_sets(self):
+        """
+        Find the multi-reach sets, everything getsets does before single-reach sets are added
+
+        This only looks at the reaches and SWORD data it is given, so it can run on one basin partition
+        """
+
+        swordreachids,sword_data_continent=self.sword_data
 
         # get an inversion set for each reach
         print('getting inversion set for each reach...')
@@ -564,7 +695,7 @@ class Sets:
 
         # remove sets with non-river reaches
         print('removing sets with non-river reaches...')
-        InversionSets=self.remove_sets_with_non_river_reaches(InversionSets)
+        InversionSets=self.remove_sets_with_non_river_reaches(InversionSets,sword_data_continent)
 
         # remove sets with too few reaches
         print('removing sets with too few reaches...')
@@ -574,9 +705,19 @@ class Sets:
         print('removing overlapping or high overlap sets...')
         InversionSets=self.remove_duplicate_or_high_overlap_sets(InversionSets,swordreachids,sword_data_continent)
 
-        # # Removing high overlap sets
-        # if self.params['AllowedReachOverlap'] > 0.:
-        #     InversionSets=self.remove_high_overlap_sets(InversionSets)
+        # remove high overlap sets
+        if self.params['RemoveHighOverlapSets'] and self.params['AllowedReachOverlap'] > 0.:
+            print('removing high overlap sets...')
+            InversionSets=self.remove_high_overlap_sets(InversionSets)
+
+        return InversionSets
+
+    def complete_sets(self,InversionSets):
+        """
+        Add single-reach sets and print stats for the whole continent
+        """
+
+        swordreachids,sword_data_continent=self.sword_data
 
         # add single-reach sets to ensure all reaches are in a set (if specified in option)
         if self.params['MinimumReaches']==1:
@@ -585,11 +726,34 @@ class Sets:
 
         # stats
         print('print stats...')
-        self.print_stats(InversionSets)
+        self.stats=self.print_stats(InversionSets)
+
+        return InversionSets
+
+    def stitch_sets(self,PartitionSets):
+        """
+        Merge the sets found in each basin partition in the order a continent-wide search finds them
+
+        basin_partitions merges the basins a set or its downstream tail can cross, so
+        sets of different partitions share no reaches and the only ones that
+        remove_duplicate_or_high_overlap_sets would still drop are sets of equal length
+        when AllowedReachOverlap is negative. Keys are renumbered the way that method does.
+        """
+
+        position={reach['reach_id']:i for i,reach in enumerate(self.reaches)}
+        SetsInOrder=sorted(itertools.chain.from_iterable(PartitionSets),key=lambda IS: position[IS['OriginReachId']])
+
+        InversionSets={}
+        SetLengths=set()
+        for InversionSet in SetsInOrder:
+            if self.params['AllowedReachOverlap'] < 0:
+                if InversionSet['numReaches'] in SetLengths:
+                    continue
+                SetLengths.add(InversionSet['numReaches'])
+            InversionSets[len(InversionSets)+1]=InversionSet
+
+        print('stitched',len(InversionSets),'sets from',len(PartitionSets),'basin partitions')
 
-        # map
-        #self.MKmap(InversionSets)
-    
         return InversionSets
 
 
@@ -0,0 +1,186 @@
+""" SWORD reach topology used by the set finder
+"""
+
+# Third-party imports
+import numpy as np
+
+def first_rows(reach_id,ids):
+    """Return the first row of each reach identifier, -1 when it is not in SWORD.
+
+    Parameters
+    ----------
+    reach_id: numpy.ndarray
+        SWORD reach identifiers
+    ids: numpy.ndarray
+        reach identifiers to look up
+    """
+
+    reach_id=np.asarray(reach_id)
+    order=np.argsort(reach_id,kind='stable')
+    return _first_rows(order,reach_id[order],ids)
+
+def _first_rows(order,sorted_ids,ids):
+    """Return the first row of each identifier given a stable sort of the SWORD identifiers."""
+
+    ids=np.asarray(ids,dtype=sorted_ids.dtype)
+    lo=np.searchsorted(sorted_ids,ids,side='left')
+    found=lo < len(sorted_ids)
+    found[found]=sorted_ids[lo[found]]==ids[found]
+    rows=np.full(len(ids),-1,dtype=np.int64)
+    rows[found]=order[lo[found]]
+    return rows
+
+class ReachTopology:
+    """ Adjacency graph of the SWORD reaches of a continent.
+
+    Upstream and downstream neighbours are stored in CSR form: the neighbours
+    of row i are indices[indptr[i]:indptr[i+1]], given as rows into the SWORD
+    reach arrays (-1 when the neighbour identifier is missing from SWORD or
+    appears more than once).
+
+    Attributes
+    ----------
+    reach_id: numpy.ndarray
+        SWORD reach identifiers
+    up_indptr: numpy.ndarray
+        CSR row pointer of the upstream neighbours
+    up_indices: numpy.ndarray
+        CSR rows of the upstream neighbours
+    dn_indptr: numpy.ndarray
+        CSR row pointer of the downstream neighbours
+    dn_indices: numpy.ndarray
+        CSR rows of the downstream neighbours
+    single_up: numpy.ndarray
+        row of the only upstream neighbour, -1 unless there is exactly one
+    single_dn: numpy.ndarray
+        row of the only downstream neighbour, -1 unless there is exactly one
+
+    Methods
+    -------
+    rows_for_ids(ids)
+        first row of each reach identifier
+    find_chains(link_up)
+        decompose the linked reaches into chains
+    """
+
+    def __init__(self,reach_id,n_rch_up,n_rch_down,rch_id_up,rch_id_dn):
+        """
+        Parameters
+        ----------
+        reach_id: numpy.ndarray
+            SWORD reach identifiers
+        n_rch_up: numpy.ndarray
+            number of upstream reaches
+        n_rch_down: numpy.ndarray
+            number of downstream reaches
+        rch_id_up: numpy.ndarray
+            upstream reach identifiers, shaped (num_domains, num_reaches)
+        rch_id_dn: numpy.ndarray
+            downstream reach identifiers, shaped (num_domains, num_reaches)
+        """
+
+        self.reach_id=np.asarray(reach_id)
+        self._order=np.argsort(self.reach_id,kind='stable')
+        self._sorted_ids=self.reach_id[self._order]
+
+        self.up_indptr,self.up_indices=self._build_csr(n_rch_up,rch_id_up)
+        self.dn_indptr,self.dn_indices=self._build_csr(n_rch_down,rch_id_dn)
+        self.single_up=self._single_neighbour(self.up_indptr,self.up_indices)
+        self.single_dn=self._single_neighbour(self.dn_indptr,self.dn_indices)
+
+    def _build_csr(self,n_neighbours,neighbour_ids):
+        """Return CSR row pointer and neighbour rows for one direction."""
+
+        neighbour_ids=np.asarray(neighbour_ids)
+        n_neighbours=np.clip(np.asarray(n_neighbours,dtype=np.int64),0,neighbour_ids.shape[0])
+        indptr=np.zeros(len(self.reach_id)+1,dtype=np.int64)
+        np.cumsum(n_neighbours,out=indptr[1:])
+
+        # neighbour slots in use, taken row by row
+        in_use=np.arange(neighbour_ids.shape[0])[:,np.newaxis] < n_neighbours[np.newaxis,:]
+        indices=self._unique_rows(neighbour_ids.T[in_use.T])
+        return indptr,indices
+
+    def _unique_rows(self,ids):
+        """Return the row of each identifier, -1 unless it matches exactly one row."""
+
+        lo=np.searchsorted(self._sorted_ids,ids,side='left')
+        hi=np.searchsorted(self._sorted_ids,ids,side='right')
+        rows=np.full(len(ids),-1,dtype=np.int64)
+        unique=(hi-lo)==1
+        rows[unique]=self._order[lo[unique]]
+        return rows
+
+    def _single_neighbour(self,indptr,indices):
+        """Return the only neighbour row of each reach, -1 unless there is exactly one."""
+
+        single=np.full(len(self.reach_id),-1,dtype=np.int64)
+        one=np.diff(indptr)==1
+        single[one]=indices[indptr[:-1][one]]
+        return single
+
+    def rows_for_ids(self,ids):
+        """Return the first row of each reach identifier, -1 when it is not in SWORD.
+
+        Parameters
+        ----------
+        ids: numpy.ndarray
+            reach identifiers
+        """
+
+        return _first_rows(self._order,self._sorted_ids,ids)
+
+    def find_chains(self,link_up):
+        """Decompose the linked reaches into chains in one pass.
+
+        A link joins a reach to its single upstream reach and must be mutual,
+        i.e. that upstream reach has the reach as its single downstream reach,
+        so links form disjoint paths and, where SWORD loops, cycles.
+
+        Parameters
+        ----------
+        link_up: numpy.ndarray
+            boolean per row, True when the row is linked to single_up
+
+        Returns
+        -------
+        chain_rows: numpy.ndarray
+            rows of every chain, each ordered from upstream to downstream
+        chain_indptr: numpy.ndarray
+            chain k is chain_rows[chain_indptr[k]:chain_indptr[k+1]]
+        chain_of_row: numpy.ndarray
+            chain of each row, -1 for rows on a loop
+        position_of_row: numpy.ndarray
+            position of each row in its chain
+        """
+
+        nrows=len(self.reach_id)
+        link_up=np.asarray(link_up,dtype=bool) & (self.single_up >= 0)
+        rows=np.flatnonzero(link_up)
+        link_up[rows]=self.single_dn[self.single_up[rows]]==rows
+        linked_dn=np.full(nrows,-1,dtype=np.int64)
+        linked_dn[self.single_up[link_up]]=np.flatnonzero(link_up)
+
+        chain_of_row=np.full(nrows,-1,dtype=np.int64)
+        position_of_row=np.zeros(nrows,dtype=np.int64)
+        chain_rows=np.empty(nrows,dtype=np.int64)
+        chain_starts=[0]
+
+        # walk down from every chain head, rows on a loop have no head
+        next_row=linked_dn.tolist()
+        nfilled=0
+        for head in np.flatnonzero(~link_up).tolist():
+            row=head
+            while row != -1:
+                chain_rows[nfilled]=row
+                nfilled+=1
+                row=next_row[row]
+            chain_starts.append(nfilled)
+
+        chain_rows=chain_rows[:nfilled]
+        chain_indptr=np.array(chain_starts,dtype=np.int64)
+        lengths=np.diff(chain_indptr)
+        chain_of_row[chain_rows]=np.repeat(np.arange(len(lengths)),lengths)
+        position_of_row[chain_rows]=np.arange(nfilled)-np.repeat(chain_indptr[:-1],lengths)
+
+        return chain_rows,chain_indptr,chain_of_row,position_of_row
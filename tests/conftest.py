@@ -0,0 +1,164 @@
+# Standard imports
+import sys
+import types
+
+# Third-party imports
+import netCDF4
+import numpy as np
+import pytest
+from shapely.geometry import box, mapping, shape
+
+# Modules the scripts import only for S3 and CMR access, which the tests
+# never reach, stand in for packages that are not installed
+for module, names in (("fsspec", {}), ("bs4", {"BeautifulSoup": None})):
+    try:
+        __import__(module)
+    except ImportError:
+        sys.modules[module] = types.SimpleNamespace(**names)
+
+# Local imports
+import datagen.Ssc as ssc
+
+class StandInItem:
+    """pystac Item stand-in that returns its dictionary."""
+
+    def __init__(self, item):
+        self.item = item
+
+    def to_dict(self):
+        return self.item
+
+class StandInCatalog:
+    """Stand-in STAC catalog that returns the items intersecting a search
+    bounding box and records searches."""
+
+    def __init__(self, items):
+        self.items = items
+        self.searches = []
+
+    def search(self, collections, bbox, datetime):
+        self.searches.append((tuple(bbox), datetime))
+        matches = [StandInItem(item) for item in intersecting_items(self.items, bbox)]
+        return type("Search", (), {"item_collection": lambda search: matches})()
+
+def intersecting_items(items, bbox):
+    """Return the items whose geometry intersects a bounding box."""
+
+    footprint = box(*bbox)
+    return [item for item in items if shape(item["geometry"]).intersects(footprint)]
+
+@pytest.fixture
+def hls_items():
+    """HLS items with two bands and a mask in a row of overlapping tiles."""
+
+    items = []
+    for i in range(10):
+        name = f"HLS.S30.T{i:05d}"
+        items.append({
+            "id": name,
+            "geometry": mapping(box(i * 0.5, 0, i * 0.5 + 0.6, 0.6)),
+            "assets": {
+                "B02": {"href": f"https://data/{name}.v2.0.B02.tif"},
+                "B03": {"href": f"https://data/{name}.v2.0.B03.tif"},
+                "Fmask": {"href": f"https://data/{name}.v2.0.Fmask.tif"}
+            }
+        })
+    return items
+
+@pytest.fixture
+def catalog(monkeypatch, hls_items):
+    catalog = StandInCatalog(hls_items)
+    monkeypatch.setattr(ssc.Client, "open", staticmethod(lambda url: catalog))
+    return catalog
+
+@pytest.fixture
+def sword_file(tmp_path):
+    """SWORD nodes of three reaches, one with a single node."""
+
+    filename = tmp_path.joinpath("na_sword_v16.nc")
+    with netCDF4.Dataset(filename, "w") as sword:
+        nodes = sword.createGroup("nodes")
+        nodes.createDimension("num_nodes", None)
+        columns = {
+            "reach_id": ("i8", [11, 11, 11, 22, 33, 33]),
+            "x": ("f8", [0.1, 0.2, 0.3, 1.0, 2.1, 3.2]),
+            "y": ("f8", [0.1, 0.1, 0.1, 0.1, 0.1, 0.1])
+        }
+        for name, (dtype, values) in columns.items():
+            nodes.createVariable(name, dtype, ("num_nodes",))[:] = values
+    return str(filename)
+
+def sword_reach_table(rows, num_domains=4, num_orbits=4):
+    """Return SWORD reach identifiers and the reach table Sets extracts from
+    SWORD, given (reach_id, upstream ids, downstream ids, facc, orbits) rows."""
+
+    reach_id = np.array([row[0] for row in rows], dtype=np.int64)
+    num_reaches = len(rows)
+    table = {"orbits": num_orbits, "num_domains": num_domains, "num_reaches": num_reaches, "reach_id": reach_id,
+             "facc": np.array([row[3] for row in rows], dtype=np.float64),
+             "n_rch_up": np.array([len(row[1]) for row in rows], dtype=np.int32),
+             "n_rch_down": np.array([len(row[2]) for row in rows], dtype=np.int32),
+             "rch_id_up": np.zeros((num_domains, num_reaches), dtype=np.int64),
+             "rch_id_dn": np.zeros((num_domains, num_reaches), dtype=np.int64),
+             "swot_obs": np.array([len(row[4]) for row in rows], dtype=np.int32),
+             "swot_orbits": np.zeros((num_orbits, num_reaches), dtype=np.int64),
+             "reach_type": reach_id % 10}
+    for i, (_, up, down, _, orbits) in enumerate(rows):
+        table["rch_id_up"][:len(up), i] = up
+        table["rch_id_dn"][:len(down), i] = down
+        table["swot_orbits"][:len(orbits), i] = orbits
+    return reach_id, table
+
+def random_sword_rows(seed, num_chains=80, basins=(7410, 7420, 7430, 7440)):
+    """Return SWORD reach rows of a random river network: chains of reaches
+    that flow into earlier chains at junctions, some running across basins,
+    with lake reaches, one-way links, up and down cycles and neighbours
+    missing from SWORD."""
+
+    rng = np.random.default_rng(seed)
+    ids, up, down, facc, orbits = [], [], [], [], []
+    for _ in range(num_chains):
+        basin = int(rng.choice(basins))
+        switch = int(rng.integers(1, 12)) if rng.random() < 0.2 else None
+        chain = []
+        for position in range(int(rng.integers(1, 12))):
+            if position == switch:
+                basin = int(rng.choice(basins))
+            reach_type = 3 if rng.random() < 0.08 else 1
+            chain.append(len(ids))
+            ids.append(basin * 10**7 + len(ids) * 10 + reach_type)
+            up.append([ids[chain[-2]]] if position else [])
+            down.append([])
+            facc.append(float(rng.uniform(100, 1000)) if position == 0 else facc[-1] * float(rng.choice([1.01, 1.05, 1.5])))
+            orbits.append([5, 9] if rng.random() < 0.9 else [5, 11])
+            if position:
+                down[chain[-2]] = [ids[-1]]
+        # the chain flows into an earlier one
+        if len(ids) > len(chain) and rng.random() < 0.8:
+            junction = int(rng.integers(0, len(ids) - len(chain)))
+            down[chain[-1]] = [ids[junction]]
+            up[junction] = up[junction] + [ids[chain[-1]]]
+
+    num_reaches = len(ids)
+    for row in rng.choice(num_reaches, num_reaches // 15, replace=False).tolist():
+        # a downstream link the other reach doesn't have
+        down[row] = [ids[int(rng.integers(0, num_reaches))]] + down[row][1:]
+    for row in rng.choice(num_reaches, num_reaches // 30, replace=False).tolist():
+        # an upstream link the other reach doesn't have
+        up[row] = [ids[int(rng.integers(0, num_reaches))]]
+    for row in rng.choice(num_reaches, num_reaches // 30, replace=False).tolist():
+        # two reaches each upstream of the other
+        if len(down[row]) == 1 and down[row][0] in ids:
+            other = ids.index(down[row][0])
+            up[row], down[other] = [ids[other]], [ids[row]]
+    for row in rng.choice(num_reaches, num_reaches // 40, replace=False).tolist():
+        down[row] = [99990000011]
+    return [(ids[i], up[i][:4], down[i][:4], facc[i], orbits[i]) for i in range(num_reaches)]
+
+def run_reaches(reach_ids, seed, fraction=0.85):
+    """Return the reach list of a run over most SWORD reaches, shuffled."""
+
+    rng = np.random.default_rng(seed)
+    reach_ids = rng.permutation(np.asarray(reach_ids))[:int(len(reach_ids) * fraction)]
+    return [{"reach_id": int(reach_id), "sword": "na_sword_v16.nc", "sos": "na_sword_v16_SOS_priors.nc"}
+            for reach_id in reach_ids.tolist()]
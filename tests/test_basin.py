@@ -0,0 +1,53 @@
+# Standard imports
+import re
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from datagen.Basin import Basin
+
+def old_get_sword(reach_ids):
+    """Return basin_data as Basin.get_sword built it with a regular expression
+    per basin over the reach identifiers, basins in set order."""
+
+    basin_data = []
+    basin_ids = set(list(map(lambda x: int(str(x)[0:4]), reach_ids)))
+    for basin_id in basin_ids:
+        basin_r = re.compile(f"^{basin_id}.*")
+        basin_data.append({"basin_id": basin_id,
+                           "reach_id": list(filter(basin_r.match, reach_ids)),
+                           "sword": "na_sword_v16.nc",
+                           "sos": "na_sword_v16_SOS_priors.nc"})
+    return basin_data
+
+def continent_reach_ids(num_reaches=50000, num_basins=250, seed=7):
+    """Return a sorted list of unique string reach identifiers spread over
+    basins, the size of a continent's reach list."""
+
+    rng = np.random.default_rng(seed)
+    basins = rng.choice(np.arange(7000, 10000), num_basins, replace=False)
+    reach_ids = rng.choice(basins, num_reaches) * 10**7 + rng.integers(0, 10**6, num_reaches) * 10 + rng.integers(1, 7, num_reaches)
+    return [str(reach_id) for reach_id in np.unique(reach_ids).tolist()]
+
+def test_get_sword_matches_regex_grouping():
+    reach_ids = continent_reach_ids()
+    basin = Basin(reach_ids, "na_sword_v16.nc", "na_sword_v16_SOS_priors.nc")
+    basin_data = basin.extract_data()
+
+    old_basin_data = old_get_sword(reach_ids)
+    for element in old_basin_data:
+        element["swot"] = [f"{reach_id}_SWOT.nc" for reach_id in element["reach_id"]]
+
+    # Same basins with the same reaches in the same order, basins now sorted
+    assert basin_data == sorted(old_basin_data, key=lambda element: element["basin_id"])
+    assert sum(len(element["reach_id"]) for element in basin_data) == len(reach_ids)
+
+def test_get_sword_keeps_reach_order_within_basin():
+    reach_ids = ["74100100021", "81200300011", "74100100011", "74100100031"]
+    basin = Basin(reach_ids, "na_sword_v16.nc", "na_sword_v16_SOS_priors.nc")
+    basin_data = basin.extract_data()
+
+    assert [element["basin_id"] for element in basin_data] == [7410, 8120]
+    assert basin_data[0]["reach_id"] == ["74100100021", "74100100011", "74100100031"]
+    assert basin_data[0]["swot"] == ["74100100021_SWOT.nc", "74100100011_SWOT.nc", "74100100031_SWOT.nc"]
@@ -0,0 +1,73 @@
+# Standard imports
+import zipfile
+
+# Third-party imports
+import numpy as np
+import pytest
+
+# Local imports
+from datagen.Columnar import ColumnarReader, write_columns
+from datagen.JsonWriter import load_json, write_json
+from datagen.Reach import Reach
+from datagen.ReachNode import ReachNode
+from generate_data import s3_reach_columns
+
+# Reach identifiers in the unsorted order a set gives them, one without nodes
+REACH_IDS = [74100100021, 74100100011, 74100100031, 74100100051, 74100100041]
+NODE_IDS = [741001000100011, 741001000100021, 741001000200011, 741001000300011, 741001000300021,
+            741001000300031, 741001000500011]
+MISSING_REACH_ID = 74100100061
+
+def write_table(table, json_data, json_file):
+    """Write JSON data and its npz table, returning the reader and the JSON
+    entries."""
+
+    write_json(json_data, json_file)
+    write_columns(table, json_file, "npz")
+    return ColumnarReader(json_file.with_suffix(".npz")), load_json(json_file)
+
+def test_reach_rows_match_json(tmp_path):
+    reach = Reach(REACH_IDS, "na_sword_v16.nc", "na_sword_v16_SOS_priors.nc")
+    reader, entries = write_table(reach.get_columns(), reach.iter_data(), tmp_path.joinpath("reaches_na.json"))
+
+    assert len(reader) == len(entries)
+    for i, entry in enumerate(entries):
+        assert reader.read_row(i) == entry
+        assert reader.read_reach(entry["reach_id"]) == entry
+    assert reader.read_values("swot", 1, 3) == [entry["swot"] for entry in entries[1:3]]
+    assert reader.read_reach(MISSING_REACH_ID) is None
+
+def test_reach_node_rows_match_json(tmp_path):
+    reach_node = ReachNode(np.array(REACH_IDS), np.array(NODE_IDS))
+    reader, entries = write_table(reach_node.get_columns(), reach_node.iter_data(),
+                                  tmp_path.joinpath("reach_node_na.json"))
+
+    assert len(reader) == len(entries)
+    for i, (reach_id, node_ids) in enumerate(entries):
+        row = {"reach_id": int(reach_id), "node_id": [int(node_id) for node_id in node_ids]}
+        assert reader.read_row(i) == row
+        assert reader.read_reach(reach_id) == row
+    assert reader.read_row(REACH_IDS.index(74100100041))["node_id"] == []
+    assert reader.read_values("node_id", 0, 2) == [[int(node_id) for node_id in node_ids]
+                                                    for _, node_ids in entries[:2]]
+    assert reader.read_reach(MISSING_REACH_ID) is None
+
+def test_s3_reach_rows_match_json(tmp_path):
+    rid_s3 = {reach_id: [f"s3://bucket/SWOT_L2_HR_RiverSP_Reach_001_{i + j:03d}_NA.zip" for j in range(i % 3 + 1)]
+              for i, reach_id in enumerate(REACH_IDS)}
+    reader, entries = write_table(s3_reach_columns(rid_s3), rid_s3, tmp_path.joinpath("s3_reach_na.json"))
+
+    assert len(reader) == len(entries)
+    for i, (reach_id, s3_uris) in enumerate(entries.items()):
+        assert reader.read_row(i) == {"reach_id": int(reach_id), "s3": s3_uris}
+        assert reader.read_reach(reach_id) == {"reach_id": int(reach_id), "s3": s3_uris}
+    assert reader.read_reach(MISSING_REACH_ID) is None
+
+def test_compressed_members_are_rejected(tmp_path):
+    filename = tmp_path.joinpath("reaches_na.npz")
+    np.savez_compressed(filename, reach_id=np.array(REACH_IDS, dtype=np.int64))
+    with zipfile.ZipFile(filename) as zf:
+        assert zf.infolist()[0].compress_type == zipfile.ZIP_DEFLATED
+
+    with pytest.raises(ValueError, match="compressed"):
+        ColumnarReader(filename)
@@ -0,0 +1,104 @@
+# Standard imports
+import io
+import struct
+
+# Third-party imports
+import numpy as np
+import pytest
+import shapefile
+
+# Local imports
+from datagen.Dbf import read_dbf_column
+
+FIELDS = [("lake_id", "N", 10, 0), ("name", "C", 20, 0), ("wse", "N", 12, 3), ("obs", "F", 8, 0)]
+
+def make_dbf(fields, rows, deleted=()):
+    """Return the bytes of a DBF table written by hand, numeric values padded
+    with blanks and the records in deleted flagged as deleted."""
+
+    record_length = 1 + sum(length for _, _, length, _ in fields)
+    dbf = io.BytesIO()
+    dbf.write(struct.pack("<B3xIHH20x", 3, len(rows), 32 + 32 * len(fields) + 1, record_length))
+    for name, field_type, length, decimals in fields:
+        dbf.write(struct.pack("<11sc4xBB14x", name.encode(), field_type.encode(), length, decimals))
+    dbf.write(b"\r")
+    for i, row in enumerate(rows):
+        dbf.write(b"*" if i in deleted else b" ")
+        for (_, field_type, length, _), value in zip(fields, row):
+            value = str(value).encode()
+            dbf.write(value.rjust(length) if field_type in ("N", "F") else value.ljust(length))
+    dbf.write(b"\x1a")
+    return dbf.getvalue()
+
+def pyshp_dbf(fields, rows):
+    """Return the bytes of a DBF table written by pyshp."""
+
+    dbf = io.BytesIO()
+    writer = shapefile.Writer(dbf=dbf)
+    for field in fields:
+        writer.field(*field)
+    for row in rows:
+        writer.record(*row)
+    writer.close()
+    return dbf.getvalue()
+
+def pyshp_column(data, field):
+    """Return the values pyshp reads for a field, leaving out None integers
+    and reading None floats as NaN."""
+
+    reader = shapefile.Reader(dbf=io.BytesIO(data))
+    _, field_type, _, decimals = next(f for f in reader.fields if f[0] == field)
+    values = [record[field] for record in reader.records()]
+    if field_type in ("N", "F") and decimals == 0:
+        return [value for value in values if value is not None]
+    if field_type in ("N", "F"):
+        return [np.nan if value is None else value for value in values]
+    return values
+
+def assert_matches_pyshp(data, field):
+    values = read_dbf_column(io.BytesIO(data), field)
+    expected = pyshp_column(data, field)
+
+    assert len(values) == len(expected)
+    if values.dtype == np.float64:
+        np.testing.assert_array_equal(values, np.array(expected, dtype=np.float64))
+    else:
+        assert values.tolist() == expected
+
+@pytest.mark.parametrize("field", [field[0] for field in FIELDS])
+def test_pyshp_written_table(field):
+    rows = [
+        [7420000001, "Lake One", 12.5, 3],
+        [None, "", None, None],
+        [7420000003, "Étang", -0.125, 0],
+        [7420000004, "  padded  ", 1000000.0, 12]
+    ]
+    data = pyshp_dbf(FIELDS, rows)
+
+    # pyshp fills empty numbers with asterisks
+    assert b"**********" in data
+    assert_matches_pyshp(data, field)
+
+@pytest.mark.parametrize("field", [field[0] for field in FIELDS])
+def test_deleted_and_blank_records(field):
+    rows = [
+        [7420000001, "kept", "12.500", "3"],
+        [7420000002, "deleted", "1.000", "4"],
+        ["", "blank numbers", "", ""],
+        [7420000004, "deleted", "2.000", "5"],
+        ["7.42e9", "float text", "nan", "abc"],
+        ["abc", "not numbers", "x", "6.0"]
+    ]
+    data = make_dbf(FIELDS, rows, deleted={1, 3})
+
+    assert_matches_pyshp(data, field)
+
+def test_all_records_deleted():
+    data = make_dbf(FIELDS, [[7420000001, "a", "1.0", "1"]], deleted={0})
+
+    assert read_dbf_column(io.BytesIO(data), "lake_id").tolist() == []
+    assert read_dbf_column(io.BytesIO(data), "wse").tolist() == []
+
+def test_missing_field():
+    with pytest.raises(KeyError):
+        read_dbf_column(io.BytesIO(make_dbf(FIELDS, [])), "area")
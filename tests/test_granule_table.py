@@ -0,0 +1,126 @@
+# Standard imports
+import fnmatch
+import os
+import random
+import re
+
+# Third-party imports
+import pytest
+
+# Local imports
+from datagen.CyclePass import CyclePass
+from datagen.GranuleTable import GranuleTable
+from datagen.S3List import S3List
+
+PREFIX = "s3://podaac-swot-ops-cumulus-protected/SWOT_L2_HR_RiverSP_2.0"
+
+def old_sort_shapefiles(shapefile):
+    """Return the sort key generate_data.sort_shapefiles gave a shapefile."""
+
+    return [int(shp) if shp.isdigit() else shp for shp in re.split(r'(\d+)', shapefile)]
+
+def old_in_passes(shpfile, pass_list_data):
+    """Return True if extract_s3_uris kept a shapefile for a pass list."""
+
+    pass_number = str(os.path.basename(shpfile)).split('_')[6]
+    return str(pass_number) in pass_list_data or int(pass_number) in pass_list_data
+
+def old_parse_duplicate_files(s3_urls):
+    """Return the shapefiles S3List.parse_duplicate_files kept with fnmatch."""
+
+    parsed = []
+    for i in s3_urls:
+        all_processings = fnmatch.filter(s3_urls, i[:-6] + '*')
+        if len(all_processings) > 1:
+            all_processings_nums = [int(i[-6:].replace('.zip', '')) for i in all_processings]
+            padded_max = str("{:02d}".format(max(all_processings_nums)))
+            parsed.append(fnmatch.filter(all_processings, f'*{padded_max}.zip')[0])
+        else:
+            parsed.append(i)
+    return list(set(parsed))
+
+def old_cycle_pass_data(shp_files):
+    """Return the cycle pass data CyclePass built from shapefile names."""
+
+    cycle_pass_data, pass_num = {}, {}
+    p = 1
+    for shp_file in shp_files:
+        shp_name = shp_file.split('/')[-1]
+        cycle_no = shp_name.split('_')[5]
+        pass_no = shp_name.split('_')[6]
+        if not f"{cycle_no}_{pass_no}" in cycle_pass_data:
+            cycle_pass_data[f"{cycle_no}_{pass_no}"] = p
+            pass_num[p] = [cycle_no, pass_no]
+        p += 1
+    return cycle_pass_data, pass_num
+
+def shapefile_uri(cycle, pass_number, kind="Reach", tile="NA", crid="PIC0", counter=1):
+    """Return the URI of a river shapefile."""
+
+    return (f"{PREFIX}/SWOT_L2_HR_RiverSP_{kind}_{cycle:03d}_{pass_number:03d}_{tile}_"
+            f"20230610T193337_20230610T193344_{crid}_{counter:02d}.zip")
+
+@pytest.fixture
+def uris():
+    """Shuffled shapefile URIs over cycles, passes, both kinds, two CRIDs and
+    reprocessed counters."""
+
+    uris = [shapefile_uri(cycle, pass_number, kind, crid=crid, counter=counter)
+            for cycle in (1, 2, 10, 100)
+            for pass_number in (5, 20, 99, 500)
+            for kind in ("Reach", "Node")
+            for crid, counter in (("PIC0", 1), ("PIC0", 2), ("PIC0", 10), ("PGC0", 1))]
+    random.Random(3).shuffle(uris)
+    return uris
+
+def test_sorted_matches_natural_sort(uris):
+    paths = [uri.replace(PREFIX, "/data/shp") for uri in uris] + ["/data/shp/notes_2.txt", "/data/shp/notes_10.txt"]
+
+    assert GranuleTable(uris).sorted().tolist() == sorted(uris, key=old_sort_shapefiles)
+    assert GranuleTable(paths).sorted().tolist() == sorted(paths, key=old_sort_shapefiles)
+
+@pytest.mark.parametrize("pass_list", [[20, 500], ["020", "500"], [5, "099"], ["20", "5"], []])
+def test_in_passes_matches_pass_filter(uris, pass_list):
+    granules = GranuleTable(uris)
+
+    assert granules.filter(granules.in_passes(pass_list)).tolist() == [uri for uri in uris if old_in_passes(uri, pass_list)]
+
+def test_latest_keeps_highest_counter(uris):
+    granules = GranuleTable(uris)
+    latest = granules.latest()
+
+    assert sorted(latest.tolist()) == sorted(old_parse_duplicate_files(uris))
+    assert sorted(S3List().parse_duplicate_files(uris)) == sorted(old_parse_duplicate_files(uris))
+    assert set(latest.data["counter"].tolist()) == {1, 10}
+    # Table order is kept
+    assert latest.tolist() == [uri for uri in uris if uri in set(latest.tolist())]
+
+def test_cycle_pass_data_matches_names(uris):
+    uris = GranuleTable(uris).sorted().tolist()
+
+    assert CyclePass(GranuleTable(uris)).get_cycle_pass_data() == old_cycle_pass_data(uris)
+
+def test_unparseable_names():
+    uris = [
+        shapefile_uri(1, 5),
+        f"{PREFIX}/SWOT_L2_HR_RiverSP_Reach_0x1_005_NA_20230610T193337_20230610T193344_PIC0_01.zip",
+        f"{PREFIX}/SWOT_L2_HR_RiverSP_Reach_7_12_NA.zip",
+        f"{PREFIX}/SWOT_L2_HR_RiverSP_Reach_001_005_NA_notatime_20230610T193344_PIC0_xx.zip",
+        shapefile_uri(1, 5, kind="Node")
+    ]
+    granules = GranuleTable(uris)
+
+    # Fields that are not numbers or times are -1 or NaT
+    assert granules.data["cycle"].tolist() == [1, -1, -1, 1, 1]
+    assert granules.data["counter"].tolist() == [1, 1, -1, -1, 1]
+    assert str(granules.data["start"][3]) == "NaT"
+    assert granules.sorted().tolist() == sorted(uris, key=old_sort_shapefiles)
+
+    # Cycle pass keys are the name's fields as written
+    assert CyclePass(granules).get_cycle_pass_data() == old_cycle_pass_data(uris)
+
+    # A name without cycle and pass fields is left out, the old loop raised
+    short_uris = uris + [f"{PREFIX}/readme.zip"]
+    with pytest.raises(IndexError):
+        old_cycle_pass_data(short_uris)
+    assert CyclePass(GranuleTable(short_uris)).get_cycle_pass_data() == old_cycle_pass_data(uris)
@@ -0,0 +1,139 @@
+# Standard imports
+import gzip
+import json
+import os
+import shutil
+
+# Third-party imports
+import pytest
+
+# Local imports
+import datagen.JsonWriter as json_writer
+from datagen.JsonWriter import index_filename, load_json, read_json_entry, read_shard_entry, write_json
+
+COMPRESSIONS = [None, "gzip", pytest.param("zstd", marks=pytest.mark.skipif(json_writer.zstandard is None,
+                                                                          reason="needs zstandard"))]
+
+REACHES = [{"reach_id": 74100100011 + 10 * i, "nodes": list(range(i % 7)), "name": f"reach {i}"} for i in range(500)]
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Record the files read_json_entry parses whole."""
+
+    parsed = []
+    parsed_entry = json_writer.parsed_entry
+    def record(filename, index):
+        parsed.append(filename)
+        return parsed_entry(filename, index)
+    monkeypatch.setattr(json_writer, "parsed_entry", record)
+    return parsed
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_entries_are_read_from_the_index(tmp_path, parses, compression):
+    filename = tmp_path.joinpath("reaches_na.json")
+    write_json(REACHES, filename, compression=compression)
+
+    assert load_json(filename) == REACHES
+    for i in (0, 1, 250, 499, -1, -500):
+        assert read_json_entry(filename, i) == REACHES[i]
+    with pytest.raises(IndexError):
+        read_json_entry(filename, 500)
+
+    write_json({"a": 1, "b": [2, 3]}, filename, compression=compression)
+    assert read_json_entry(filename, -1) == ("b", [2, 3])
+    assert parses == []
+
+def test_written_text_matches_json_dump(tmp_path):
+    filename = tmp_path.joinpath("reaches_na.json")
+    write_json(REACHES, filename)
+
+    assert filename.read_text() == json.dumps(REACHES, indent=2)
+
+@pytest.mark.parametrize("compression", COMPRESSIONS[1:])
+def test_compressed_blocks_are_read_alone(tmp_path, monkeypatch, parses, compression):
+    monkeypatch.setattr(json_writer, "BLOCK_SIZE", 4096)
+    filename = tmp_path.joinpath("reaches_na.json")
+    write_json(REACHES, filename, compression=compression)
+    with open(index_filename(filename), "rb") as ixf:
+        num_blocks = json_writer.INDEX_HEADER.unpack(ixf.read(json_writer.INDEX_HEADER.size))[3]
+    assert num_blocks > 5
+
+    # The blocks read as one stream
+    assert load_json(filename) == REACHES
+    if compression == "gzip":
+        assert gzip.decompress(filename.read_bytes()).decode() == json.dumps(REACHES, indent=2)
+
+    # Reading the last entry starts decompressing at its block
+    decompressed = []
+    decompressed_reader = json_writer.decompressed_reader
+    def record(fh, name):
+        decompressed.append(fh.tell())
+        return decompressed_reader(fh, name)
+    monkeypatch.setattr(json_writer, "decompressed_reader", record)
+    assert read_json_entry(filename, -1) == REACHES[-1]
+    assert decompressed[-1] > filename.stat().st_size // 2
+    assert parses == []
+
+def test_stale_index_parses_the_file(tmp_path, parses):
+    filename = tmp_path.joinpath("reaches_na.json")
+    write_json(REACHES, filename)
+    stale_index = index_filename(filename).read_bytes()
+
+    # A file replaced after a reader opened the old index, and one whose
+    # index was lost along the way
+    reaches = [{**reach, "name": reach["name"].upper()} for reach in REACHES[::-1]]
+    write_json(reaches, filename)
+    index_filename(filename).write_bytes(stale_index)
+    assert read_json_entry(filename, 3) == reaches[3]
+    assert read_json_entry(filename, -1) == reaches[-1]
+
+    index_filename(filename).write_bytes(b"")
+    assert read_json_entry(filename, 3) == reaches[3]
+    assert len(parses) == 3
+
+def test_copied_file_keeps_its_index(tmp_path, parses):
+    filename = tmp_path.joinpath("reaches_na.json")
+    write_json(REACHES, filename)
+    copy = tmp_path.joinpath("copy", filename.name)
+    copy.parent.mkdir()
+    shutil.copy(filename, copy)
+    shutil.copy(index_filename(filename), index_filename(copy))
+    os.utime(copy, ns=(0, 0))
+
+    assert read_json_entry(copy, 42) == REACHES[42]
+    assert parses == []
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_shards_are_indexed(tmp_path, monkeypatch, parses, compression):
+    monkeypatch.setattr(json_writer, "BLOCK_SIZE", 1024)
+    filename = tmp_path.joinpath("reaches_na.json")
+    write_json(REACHES, filename, max_entries=64, compression=compression)
+    manifest_file = tmp_path.joinpath("reaches_na.manifest.json")
+
+    shards = load_json(manifest_file)["shards"]
+    assert len(shards) == 8
+    for i in (0, 63, 64, 300, -1):
+        assert read_shard_entry(manifest_file, i) == REACHES[i]
+    for shard in shards:
+        shard_file = tmp_path.joinpath(shard["file"])
+        assert load_json(shard_file) == REACHES[shard["start"]:shard["start"] + shard["num_entries"]]
+        assert (shard_file.read_bytes()[:1] == b"[") == (compression is None)
+        with open(index_filename(shard_file), "rb") as ixf:
+            num_blocks = json_writer.INDEX_HEADER.unpack(ixf.read(json_writer.INDEX_HEADER.size))[3]
+        assert (num_blocks > 1) == (compression is not None)
+    assert parses == []
+
+def test_stale_shards_are_removed(tmp_path):
+    filename = tmp_path.joinpath("reaches_na.json")
+    manifest_file = tmp_path.joinpath("reaches_na.manifest.json")
+    write_json(REACHES, filename, max_entries=64)
+    assert len(list(tmp_path.glob("reaches_na.0*.json"))) == 8
+
+    # Fewer shards, then none
+    write_json(REACHES[:100], filename, max_entries=64)
+    assert sorted(path.name for path in tmp_path.glob("reaches_na.0*.json*")) == [
+        "reaches_na.00000.json", "reaches_na.00000.json.idx", "reaches_na.00001.json", "reaches_na.00001.json.idx"]
+    assert read_shard_entry(manifest_file, -1) == REACHES[99]
+
+    write_json(REACHES[:10], filename)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["reaches_na.json", "reaches_na.json.idx"]
@@ -0,0 +1,77 @@
+# Standard imports
+import io
+import zipfile
+
+# Third-party imports
+import numpy as np
+import pytest
+import shapefile
+
+# Local imports
+from datagen.GranuleTable import GranuleTable
+from datagen.JsonWriter import write_json
+from datagen.Lake import Lake
+from generate_data_lake import indexed_shapefiles
+
+def write_shapefile(directory, pass_number, lake_ids):
+    """Write a Prior lake shapefile zip holding only its DBF table."""
+
+    name = f"SWOT_L2_HR_LakeSP_Prior_001_{pass_number:03d}_NA_20230610T193337_20230610T193344_PIC0_01"
+    dbf = io.BytesIO()
+    writer = shapefile.Writer(dbf=dbf)
+    writer.field("lake_id", "N", 10, 0)
+    for lake_id in lake_ids:
+        writer.record(lake_id)
+    writer.close()
+    filename = directory.joinpath(f"{name}.zip")
+    with zipfile.ZipFile(filename, "w") as zip_file:
+        zip_file.writestr(f"{name}.dbf", dbf.getvalue())
+    return str(filename)
+
+@pytest.fixture
+def shapefiles(tmp_path):
+    """Four shapefiles of a previous run, lakes shared between passes."""
+
+    return [
+        write_shapefile(tmp_path, 1, [7420000001, 7420000002]),
+        write_shapefile(tmp_path, 2, [7420000002, 7420000003]),
+        write_shapefile(tmp_path, 3, [7420000004]),
+        write_shapefile(tmp_path, 4, [7420000003, 7420000005])
+    ]
+
+@pytest.fixture
+def index_file(tmp_path, shapefiles):
+    """s3_lake.json of a continent-wide run over the shapefiles."""
+
+    lake = Lake(shapefiles)
+    lake.extract_local()
+    json_file = tmp_path.joinpath("s3_lake.json")
+    write_json(lake.get_lake_s3(), json_file)
+    return json_file
+
+def extract(shapefiles, lake_list):
+    lake = Lake(shapefiles, lake_list=lake_list)
+    lake.extract_local()
+    return lake.get_lake_s3()
+
+def test_index_prunes_shapefiles(tmp_path, shapefiles, index_file):
+    # A pass published since the index was written
+    new_shapefile = write_shapefile(tmp_path, 5, [7420000003, 7420000006])
+    granules = GranuleTable(shapefiles + [new_shapefile]).sorted()
+    lake_list = ["7420000003"]
+
+    keep = indexed_shapefiles(granules, lake_list, index_file)
+    assert np.asarray(granules.tolist())[keep].tolist() == [shapefiles[1], shapefiles[3], new_shapefile]
+    assert extract(granules.filter(keep).tolist(), lake_list) == extract(granules.tolist(), lake_list)
+
+    lake_list = [7420000001, 7420000004]
+    keep = indexed_shapefiles(granules, lake_list, index_file)
+    assert np.asarray(granules.tolist())[keep].tolist() == [shapefiles[0], shapefiles[2], new_shapefile]
+    assert extract(granules.filter(keep).tolist(), lake_list) == extract(granules.tolist(), lake_list)
+
+def test_full_read_without_a_complete_index(tmp_path, shapefiles, index_file):
+    granules = GranuleTable(shapefiles).sorted()
+
+    # A lake the index does not list, perhaps written by a subset run
+    assert indexed_shapefiles(granules, ["7420000001", "7420000009"], index_file) is None
+    assert indexed_shapefiles(granules, ["7420000001"], tmp_path.joinpath("missing.json")) is None
@@ -0,0 +1,51 @@
+# Third-party imports
+import netCDF4
+import numpy as np
+import pytest
+
+# Local imports
+from datagen.ReachNode import ReachNode
+
+# Reaches of the run in set order, one without nodes in SWORD
+REACH_IDS = np.array([74100100031, 74100100011, 74100100021, 74100100061])
+
+@pytest.fixture
+def sword_nodes(tmp_path):
+    """SWORD nodes group of the run's reaches and of a reach outside it,
+    nodes in no particular order."""
+
+    node_ids = [74100100030011, 74100100010021, 74100100050011, 74100100020011, 74100100010011,
+                74100100030031, 74100100030021, 74100100010031, 74100100050021]
+    node_ids = np.random.default_rng(7).permutation(np.array(node_ids, dtype=np.int64))
+    reach_ids = node_ids // 10**4 * 10 + 1
+
+    filename = tmp_path.joinpath("na_sword_v16.nc")
+    with netCDF4.Dataset(filename, "w") as sword:
+        nodes = sword.createGroup("nodes")
+        nodes.createDimension("num_nodes", None)
+        nodes.createVariable("node_id", "i8", ("num_nodes",))[:] = node_ids
+        nodes.createVariable("reach_id", "i8", ("num_nodes",))[:] = reach_ids
+    return str(filename), node_ids
+
+def test_sword_nodes_match_granule_nodes(sword_nodes):
+    sword_file, node_ids = sword_nodes
+
+    # Node shapefiles of a run that observed every SWORD node
+    granule_data = ReachNode(REACH_IDS, node_ids).extract_data()
+    sword_data = ReachNode(REACH_IDS, None, sword_file).extract_data()
+
+    assert sword_data == granule_data
+    assert [reach_id for reach_id, _ in sword_data] == [str(reach_id) for reach_id in REACH_IDS]
+    assert dict(sword_data)["74100100061"] == []
+    assert dict(sword_data)["74100100011"] == ["74100100010011", "74100100010021", "74100100010031"]
+
+def test_observed_sword_nodes_match_granule_nodes(sword_nodes):
+    sword_file, node_ids = sword_nodes
+    observed = node_ids[::2]
+
+    granule = ReachNode(REACH_IDS, observed)
+    sword = ReachNode(REACH_IDS, observed, sword_file)
+
+    assert sword.extract_data() == granule.extract_data()
+    for column in ("reach_id", "node_id.offsets", "node_id.items"):
+        np.testing.assert_array_equal(sword.get_columns()[column], granule.get_columns()[column])
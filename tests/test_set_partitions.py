@@ -0,0 +1,60 @@
+# Third-party imports
+import pytest
+
+# Local imports
+from conftest import random_sword_rows, run_reaches, sword_reach_table
+from datagen.JsonWriter import load_json
+import sets.getAllSets as get_all_sets
+
+ALGORITHMS = ["MetroMan", "HiVDI", "SIC"]
+
+def find_sets(output_dir, sword_data, reaches, algorithm, partitioned):
+    """Return the reach identifiers of each set written by a continent-wide
+    or a partitioned search."""
+
+    get_all_sets.SET_INPUTS.update(sword_data=sword_data, reaches=reaches, write_options={})
+    try:
+        output_dir.mkdir()
+        if partitioned:
+            get_all_sets.find_sets_by_partition([algorithm], "na", output_dir, 1)
+        else:
+            get_all_sets.find_sets_for_algorithm(algorithm, "na", output_dir)
+    finally:
+        get_all_sets.SET_INPUTS.clear()
+    sets = load_json(output_dir.joinpath(get_all_sets.SetParameters(algorithm, "na")["Filename"]))
+    return [[reach["reach_id"] for reach in reach_set] for reach_set in sets]
+
+def reach_id(basin, number):
+    return basin * 10**7 + number * 10 + 1
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_downstream_tail_in_another_basin(tmp_path, algorithm):
+    # The walk from origin reach x steps up to m, but m flows into y, a
+    # junction reach in another basin, so get_reach_list ends the set with y
+    m, x, y = reach_id(7410, 1), reach_id(7410, 2), reach_id(7420, 5)
+    rows = [
+        (m, [], [y], 100.0, [5, 9]),
+        (x, [m], [], 101.0, [5, 9]),
+        (y, [reach_id(7420, 4)], [reach_id(7420, 6), reach_id(7420, 7)], 300.0, [5, 9]),
+        (reach_id(7420, 4), [], [y], 290.0, [5, 9]),
+        (reach_id(7420, 6), [y], [], 310.0, [5, 9]),
+        (reach_id(7420, 7), [y], [], 310.0, [5, 9])
+    ]
+    sword_data = sword_reach_table(rows)
+    reaches = [{"reach_id": row[0], "sword": "na_sword_v16.nc", "sos": "na_sword_v16_SOS_priors.nc"}
+               for row in rows if row[0] != reach_id(7420, 4)]
+
+    sets = find_sets(tmp_path.joinpath("continent"), sword_data, reaches, algorithm, False)
+    assert find_sets(tmp_path.joinpath("partitions"), sword_data, reaches, algorithm, True) == sets
+    if algorithm != "MetroMan":
+        # y's single-reach set is dropped as y is in the set of x
+        assert [y, m] in sets and [y] not in sets
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_partitioned_sets_match_continent_sets(tmp_path, algorithm, seed):
+    sword_data = sword_reach_table(random_sword_rows(seed))
+    reaches = run_reaches(sword_data[0], seed)
+
+    sets = find_sets(tmp_path.joinpath("continent"), sword_data, reaches, algorithm, False)
+    assert find_sets(tmp_path.joinpath("partitions"), sword_data, reaches, algorithm, True) == sets
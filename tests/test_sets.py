@@ -0,0 +1,309 @@
+# Standard imports
+import itertools
+
+# Third-party imports
+import numpy as np
+import pytest
+
+# Local imports
+from conftest import random_sword_rows, run_reaches, sword_reach_table
+from sets.getAllSets import SetParameters
+from sets.sets import Sets
+
+ALGORITHMS = ["MetroMan", "HiVDI", "SIC"]
+
+def old_reach(table, k):
+    """Return the SWORD attributes of a row as pull_sword_attributes_for_reach
+    pulled them into a dictionary."""
+
+    return {"reach_id": table["reach_id"][k], "facc": table["facc"][k],
+            "n_rch_up": table["n_rch_up"][k], "n_rch_down": table["n_rch_down"][k],
+            "rch_id_up": table["rch_id_up"][:table["n_rch_up"][k], k],
+            "rch_id_dn": table["rch_id_dn"][:table["n_rch_down"][k], k],
+            "swot_obs": table["swot_obs"][k], "swot_orbits": table["swot_orbits"][:table["swot_obs"][k], k]}
+
+def old_check_reaches(params, reach_ids, reach, adjacent):
+    """Return True if CheckReaches let a walk add the adjacent reach."""
+
+    OrbitsAreIdentical = False
+    if reach["swot_obs"] == adjacent["swot_obs"]:
+        OrbitsAreIdentical = list(reach["swot_orbits"]) == list(adjacent["swot_orbits"])
+    AccumulationAreaDifferencePct = (adjacent["facc"] - reach["facc"]) / reach["facc"] * 100
+    RiverJunctionPresent = reach["n_rch_up"] > 1 or reach["n_rch_down"] > 1 \
+        or adjacent["n_rch_up"] > 1 or adjacent["n_rch_down"] > 1
+
+    return not ((params["RequireIdenticalOrbits"] and not OrbitsAreIdentical)
+                or AccumulationAreaDifferencePct > params["DrainageAreaPctCutoff"]
+                or (not params["AllowRiverJunction"] and RiverJunctionPresent)
+                or adjacent["reach_id"] not in reach_ids)
+
+def old_neighbour(swordreachids, neighbour_ids):
+    """Return the row np.argwhere(swordreachids == neighbour_ids) found when
+    it found exactly one, None otherwise. Comparing with more or fewer than
+    one neighbour identifier failed to broadcast and found nothing."""
+
+    if len(neighbour_ids) != 1:
+        return None
+    rows = np.flatnonzero(swordreachids == neighbour_ids[0])
+    return int(rows[0]) if len(rows) == 1 else None
+
+def old_find_set_for_reach(params, reach_ids, swordreachids, table, k):
+    """Return the set the walk of find_set_for_reach found for origin row k
+    before sets were cut from chains, reaches kept in dictionaries."""
+
+    origin = old_reach(table, k)
+    InversionSet = {"OriginReach": origin, "Reaches": {origin["reach_id"]: origin},
+                    "UpstreamReach": origin, "DownstreamReach": origin}
+    for end, neighbours in (("UpstreamReach", "rch_id_up"), ("DownstreamReach", "rch_id_dn")):
+        num_added = 0
+        while True:
+            row = old_neighbour(swordreachids, InversionSet[end][neighbours])
+            if row is None:
+                break
+            adjacent = old_reach(table, row)
+            if not old_check_reaches(params, reach_ids, origin, adjacent):
+                break
+            InversionSet["Reaches"][adjacent["reach_id"]] = adjacent
+            InversionSet[end] = adjacent
+            num_added += 1
+            if num_added > params["MaximumReachesEachDirection"]:
+                break
+    return InversionSet
+
+def old_get_reach_list(InversionSet, max_steps=10000):
+    """Return the reach list get_reach_list made from the reaches of a set,
+    None when it would never have ended."""
+
+    if len(InversionSet["Reaches"]) == 1:
+        return [InversionSet["OriginReach"]["reach_id"]]
+    ReachList = [InversionSet["UpstreamReach"]["reach_id"]]
+    EndOfSetReached = False
+    while not EndOfSetReached:
+        if len(ReachList) > max_steps:
+            return None
+        try:
+            next_reach_id_downstream = InversionSet["Reaches"][ReachList[-1]]["rch_id_dn"][0]
+        except (KeyError, IndexError):
+            break
+        ReachList.append(next_reach_id_downstream)
+        EndOfSetReached = ReachList[-1] == InversionSet["DownstreamReach"]["reach_id"]
+    return ReachList
+
+def walked_reach_lists(algorithm, swordreachids, table, reaches):
+    """Return the old and the current reach list of the walked set of each
+    origin reach."""
+
+    params = SetParameters(algorithm, "na")
+    algoset = Sets(params, reaches, None, sword_data=(swordreachids, table))
+    topology = algoset.build_topology(table, swordreachids)
+    reach_ids = [reach["reach_id"] for reach in reaches]
+    reach_lists = []
+    for k in topology.rows_for_ids(reach_ids).tolist():
+        if k == -1 or table["n_rch_up"][k] != 1:
+            continue
+        old_list = old_get_reach_list(old_find_set_for_reach(params, reach_ids, swordreachids, table, k))
+        InversionSet = algoset.find_set_for_reach(k, topology, table)
+        rows, num_reaches = algoset.get_reach_list(InversionSet, topology, table)
+        assert num_reaches == len(rows)
+        reach_lists.append((old_list, swordreachids[rows].tolist()))
+    return reach_lists
+
+def reach_id(number, basin=7410):
+    return basin * 10**7 + number * 10 + 1
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_walked_reach_lists_match_old_walk(algorithm, seed):
+    swordreachids, table = sword_reach_table(random_sword_rows(seed))
+    reaches = run_reaches(swordreachids, seed)
+
+    for old_list, reach_list in walked_reach_lists(algorithm, swordreachids, table, reaches):
+        if old_list is None:
+            assert len(set(reach_list)) == len(reach_list)
+        elif old_list[-1] not in swordreachids:
+            assert reach_list == old_list[:-1]
+        else:
+            assert reach_list == old_list
+
+def test_reach_list_tail_and_loop():
+    # The walk from 3 steps up to 2 and 1, whose first downstream reach is
+    # not in SWORD, and from 13 up to 12 and 11, whose first downstream
+    # reaches run in a loop
+    missing = reach_id(99, basin=9999)
+    rows = [
+        (reach_id(1), [], [missing], 100.0, [5, 9]),
+        (reach_id(2), [reach_id(1)], [reach_id(3)], 101.0, [5, 9]),
+        (reach_id(3), [reach_id(2)], [], 102.0, [5, 9]),
+        (reach_id(11), [], [reach_id(12)], 100.0, [5, 9]),
+        (reach_id(12), [reach_id(11)], [reach_id(11)], 101.0, [5, 9]),
+        (reach_id(13), [reach_id(12)], [], 102.0, [5, 9])
+    ]
+    swordreachids, table = sword_reach_table(rows)
+    reaches = [{"reach_id": row[0]} for row in rows]
+
+    (old_tail, tail), (old_loop, loop) = walked_reach_lists("HiVDI", swordreachids, table, reaches)[1::2]
+    # The old list ends with the missing reach, the current one a reach shorter
+    assert old_tail == [reach_id(1), missing]
+    assert tail == [reach_id(1)]
+    assert old_loop is None
+    assert loop == [reach_id(11), reach_id(12)]
+
+# A chain of 8 into a junction, longer than the MetroMan walk, a chain whose
+# head reach flows elsewhere and one whose bottom reach flows into a reach
+# upstream of another, two reaches each upstream of the other, and a drainage
+# area jump and change of orbits
+CHAIN_END_ROWS = [
+    *[(reach_id(i), [reach_id(i - 1)] if i > 1 else [], [reach_id(i + 1)], 100.0 + i, [5, 9]) for i in range(1, 9)],
+    (reach_id(9), [reach_id(8), reach_id(20)], [reach_id(10)], 200.0, [5, 9]),
+    (reach_id(10), [reach_id(9)], [], 201.0, [5, 9]),
+    (reach_id(20), [], [reach_id(9)], 90.0, [5, 9]),
+    (reach_id(30), [], [reach_id(99)], 100.0, [5, 9]),
+    (reach_id(31), [reach_id(30)], [reach_id(32)], 101.0, [5, 9]),
+    (reach_id(32), [reach_id(31)], [], 102.0, [5, 9]),
+    (reach_id(33), [], [reach_id(34)], 100.0, [5, 9]),
+    (reach_id(34), [reach_id(33)], [reach_id(35)], 101.0, [5, 9]),
+    (reach_id(35), [reach_id(34)], [reach_id(36)], 102.0, [5, 9]),
+    (reach_id(36), [reach_id(37)], [], 103.0, [5, 9]),
+    (reach_id(37), [], [reach_id(36)], 103.0, [5, 9]),
+    (reach_id(40), [reach_id(41)], [reach_id(41)], 100.0, [5, 9]),
+    (reach_id(41), [reach_id(40)], [reach_id(40)], 101.0, [5, 9]),
+    (reach_id(42), [reach_id(41)], [], 102.0, [5, 9]),
+    (reach_id(49), [], [reach_id(50)], 99.0, [5, 9]),
+    (reach_id(50), [reach_id(49)], [reach_id(51)], 100.0, [5, 9]),
+    (reach_id(51), [reach_id(50)], [reach_id(52)], 180.0, [5, 9]),
+    (reach_id(52), [reach_id(51)], [reach_id(53)], 181.0, [5, 11]),
+    (reach_id(53), [reach_id(52)], [], 182.0, [5, 11])
+]
+
+def chain_end_table():
+    swordreachids, table = sword_reach_table(CHAIN_END_ROWS)
+    reaches = [{"reach_id": row[0], "sword": "na_sword_v16.nc", "sos": "na_sword_v16_SOS_priors.nc"}
+               for row in CHAIN_END_ROWS if row[0] != reach_id(37)]
+    return swordreachids, table, reaches
+
+def cut_sets(algorithm, swordreachids, table, reaches):
+    """Return the old walked reach list and the reach identifiers of the set
+    cut from its chain of each origin reach, None when it has to be walked."""
+
+    params = SetParameters(algorithm, "na")
+    algoset = Sets(params, reaches, None, sword_data=(swordreachids, table))
+    topology = algoset.build_topology(table, swordreachids)
+    chains = algoset.find_valid_chains(topology, table)
+    reach_ids = [reach["reach_id"] for reach in reaches]
+    cut = {}
+    for k in topology.rows_for_ids(reach_ids).tolist():
+        if k == -1 or table["n_rch_up"][k] != 1:
+            continue
+        old_list = old_get_reach_list(old_find_set_for_reach(params, reach_ids, swordreachids, table, k))
+        InversionSet = algoset.cut_set_from_chain(chains, k, table)
+        if InversionSet is not None:
+            assert InversionSet["numReaches"] == len(InversionSet["Rows"])
+            InversionSet = swordreachids[InversionSet["Rows"]].tolist()
+        cut[int(swordreachids[k])] = (old_list, InversionSet)
+    return cut
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_cut_sets_match_old_walk(algorithm, seed):
+    swordreachids, table = sword_reach_table(random_sword_rows(seed))
+    reaches = run_reaches(swordreachids, seed)
+
+    cut = cut_sets(algorithm, swordreachids, table, reaches).values()
+    assert sum(reach_list is None for _, reach_list in cut) < len(cut) / 2
+    for old_list, reach_list in cut:
+        assert reach_list is None or reach_list == old_list
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_cut_sets_at_chain_ends(algorithm):
+    cut = cut_sets(algorithm, *chain_end_table())
+
+    for old_list, reach_list in cut.values():
+        assert reach_list is None or reach_list == old_list
+    # Walks that carry on through a one-way link or run around a loop
+    for number in (31, 32, 34, 35, 40, 41, 42):
+        assert cut[reach_id(number)][1] is None
+    # Sets end at the junction, the drainage area jump and, for MetroMan,
+    # three reaches each side of the origin
+    first = 2 if algorithm == "MetroMan" else 1
+    assert cut[reach_id(5)][1] == [reach_id(i) for i in range(first, 9)]
+    assert cut[reach_id(50)][1] == [reach_id(49), reach_id(50)]
+
+def set_rows(algorithm, swordreachids, table, reaches):
+    """Return the key, reach identifiers and length of each set getsets finds."""
+
+    algoset = Sets(SetParameters(algorithm, "na"), reaches, None, sword_data=(swordreachids, table))
+    return [(key, swordreachids[InversionSet["Rows"]].tolist(), InversionSet["numReaches"])
+            for key, InversionSet in algoset.getsets().items()]
+
+@pytest.fixture
+def walk_every_set(monkeypatch):
+    """Have extract_inversion_sets_by_reach walk every set once switched on."""
+
+    switch = {"on": False}
+    cut_set_from_chain = Sets.cut_set_from_chain
+    def cut(self, chains, k, sword_data_continent):
+        return None if switch["on"] else cut_set_from_chain(self, chains, k, sword_data_continent)
+    monkeypatch.setattr(Sets, "cut_set_from_chain", cut)
+    return switch
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_chain_sets_match_walked_sets(walk_every_set, algorithm, seed):
+    swordreachids, table = sword_reach_table(random_sword_rows(seed))
+    reaches = run_reaches(swordreachids, seed)
+
+    sets = set_rows(algorithm, swordreachids, table, reaches)
+    walk_every_set["on"] = True
+    assert set_rows(algorithm, swordreachids, table, reaches) == sets
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_chain_end_sets_match_walked_sets(walk_every_set, algorithm):
+    swordreachids, table, reaches = chain_end_table()
+
+    sets = set_rows(algorithm, swordreachids, table, reaches)
+    walk_every_set["on"] = True
+    assert set_rows(algorithm, swordreachids, table, reaches) == sets
+
+def old_remove_high_overlap_sets(self, InversionSets):
+    """Remove high overlap sets with the restart loop remove_high_overlap_sets
+    ran before the heap sweep, without its iteration cap."""
+
+    HighOverlap = True
+    while HighOverlap:
+        HighOverlap = False
+        for combo in itertools.combinations(list(InversionSets.keys()), 2):
+            is0 = InversionSets[combo[0]]["Rows"].tolist()
+            is1 = InversionSets[combo[1]]["Rows"].tolist()
+            pctoverlap = len(set(is0) & set(is1)) / ((len(is0) + len(is1)) / 2)
+            if pctoverlap > self.params["AllowedReachOverlap"]:
+                del InversionSets[combo[1]]
+                HighOverlap = True
+                break
+    return InversionSets
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("overlap", [0.5, 0.67])
+def test_overlap_sweep_matches_restart_loop(overlap, seed):
+    # Windows of up to 8 rows along a river of 60, keyed in no particular order
+    rng = np.random.default_rng(seed)
+    InversionSets = {}
+    for key in rng.permutation(1000)[:40].tolist():
+        first = int(rng.integers(60))
+        rows = np.arange(first, min(first + int(rng.integers(1, 9)), 60))
+        InversionSets[key] = {"Rows": rows, "numReaches": len(rows)}
+    algoset = Sets({"AllowedReachOverlap": overlap}, [], None)
+
+    old_sets = old_remove_high_overlap_sets(algoset, dict(InversionSets))
+    sets = algoset.remove_high_overlap_sets(dict(InversionSets))
+    assert list(sets.keys()) == list(old_sets.keys())
+    assert len(sets) < len(InversionSets)
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("algorithm", ["HiVDI", "SIC"])
+def test_overlap_sweep_sets_match_restart_loop(monkeypatch, algorithm, seed):
+    swordreachids, table = sword_reach_table(random_sword_rows(seed))
+    reaches = run_reaches(swordreachids, seed)
+
+    sets = set_rows(algorithm, swordreachids, table, reaches)
+    monkeypatch.setattr(Sets, "remove_high_overlap_sets", old_remove_high_overlap_sets)
+    assert set_rows(algorithm, swordreachids, table, reaches) == sets
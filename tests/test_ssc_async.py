@@ -0,0 +1,114 @@
+# Standard imports
+import asyncio
+import threading
+
+# Third-party imports
+from aiohttp import web
+import numpy as np
+import pytest
+
+# Local imports
+import datagen.Ssc as ssc
+from conftest import intersecting_items
+
+TEMPORAL_RANGE = "2023-01-01T00:00:00Z,2023-07-01T00:00:00Z"
+
+class StandInStacServer:
+    """
+    Stand-in STAC API that pages search results one item at a time. The
+    first page links to the next with a merged POST body and later pages
+    with GET links, as the CMR STAC API does. Each request takes a moment so
+    requests overlap, and the most in flight at once is recorded.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.searches = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.app = web.Application()
+        self.app.router.add_post("/LPCLOUD/search", self.post)
+        self.app.router.add_get("/LPCLOUD/search", self.get)
+
+    async def post(self, request):
+        body = await request.json()
+        self.requests.append("POST")
+        return await self.page(request, body)
+
+    async def get(self, request):
+        self.requests.append("GET")
+        body = {**self.searches[request.query["search"]], "page": int(request.query["page"])}
+        return await self.page(request, body)
+
+    async def page(self, request, body):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            matches = intersecting_items(self.items, body["bbox"])
+            page, limit = body.get("page", 1), body["limit"]
+            response = {"type": "FeatureCollection", "features": matches[(page - 1) * limit:page * limit], "links": []}
+            if page * limit < len(matches):
+                if page == 1:
+                    link = {"rel": "next", "href": str(request.url), "method": "POST", "merge": True,
+                            "body": {"page": 2}}
+                else:
+                    key = str(len(self.searches))
+                    self.searches[key] = {"bbox": body["bbox"], "limit": limit}
+                    link = {"rel": "next", "method": "GET",
+                            "href": str(request.url.with_query({"search": key, "page": page + 1}))}
+                response["links"].append(link)
+            return web.json_response(response)
+        finally:
+            self.in_flight -= 1
+
+@pytest.fixture
+def stac_server(monkeypatch, hls_items):
+    """Run the stand-in STAC API on a local port in a thread of its own."""
+
+    server = StandInStacServer(hls_items)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(server.app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = runner.addresses[0][1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(ssc, "STAC_URL", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(ssc, "STAC_PAGE_SIZE", 1)
+    yield server
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.run_until_complete(runner.cleanup())
+    loop.close()
+
+def test_async_links_match_thread_pool_links(stac_server, catalog, sword_file):
+    reach_ids = np.array([11, 22, 33])
+    links, errors = ssc.find_reach_links(reach_ids, sword_file, TEMPORAL_RANGE)
+    async_links, async_errors = asyncio.run(ssc.find_reach_links_async(reach_ids, sword_file, TEMPORAL_RANGE,
+                                                                       concurrency=3))
+
+    assert async_links == links
+    assert async_errors == errors
+    assert len(links[2]) == 4 * 2
+
+def test_pages_are_followed(stac_server, sword_file):
+    reach_ids = np.array([33])
+    links, _ = asyncio.run(ssc.find_reach_links_async(reach_ids, sword_file, "2023-01-01T00:00:00Z,2023-01-20T00:00:00Z",
+                                                      concurrency=3))
+
+    # Four items one page each: a search, a merged POST and two GETs
+    assert stac_server.requests == ["POST", "POST", "GET", "GET"]
+    assert {link.split("/")[-1].split(".")[2] for link in links[0]} == {"T00003", "T00004", "T00005", "T00006"}
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_requests_in_flight_are_bounded(stac_server, sword_file, concurrency):
+    reach_ids = np.array([11, 22, 33])
+    asyncio.run(ssc.find_reach_links_async(reach_ids, sword_file, TEMPORAL_RANGE, concurrency=concurrency))
+
+    assert len(stac_server.requests) > 3 * concurrency
+    assert stac_server.max_in_flight == concurrency
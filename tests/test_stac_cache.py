@@ -0,0 +1,120 @@
+# Standard imports
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import zlib
+
+# Third-party imports
+import numpy as np
+import pytest
+
+# Local imports
+import datagen.Ssc as ssc
+import datagen.StacCache as stac_cache
+from datagen.StacCache import StacCache, cache_key, is_recent
+
+COLLECTIONS = ["HLSL30.v2.0", "HLSS30.v2.0"]
+PAST_WINDOW = "2023-01-01T00:00:00Z,2023-01-31T00:00:00Z"
+
+def recent_window():
+    """Return a 30 day window that ends now."""
+
+    now = datetime.now(timezone.utc)
+    return f"{(now - timedelta(days=30)):%Y-%m-%dT%H:%M:%SZ},{now:%Y-%m-%dT%H:%M:%SZ}"
+
+class Clock:
+    """Stand-in for time.time that only moves when told to."""
+
+    def __init__(self):
+        self.now = 1.7e9
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(stac_cache.time, "time", clock)
+    return clock
+
+def test_cache_key_normalizes_searches():
+    key = cache_key([0.1, -0.0, 1.2, 3.4], COLLECTIONS, PAST_WINDOW)
+
+    assert cache_key([0.10000001, 0.0, 1.2, 3.4], COLLECTIONS, PAST_WINDOW) == key
+    assert cache_key([0.1, 0.0, 1.2, 3.4], COLLECTIONS[::-1], PAST_WINDOW) == key
+    assert cache_key([0.1, 0.0, 1.2, 3.4], COLLECTIONS, PAST_WINDOW.replace(",", "/")) == key
+    assert cache_key([0.1001, 0.0, 1.2, 3.4], COLLECTIONS, PAST_WINDOW) != key
+    assert cache_key([0.1, 0.0, 1.2, 3.4], COLLECTIONS[:1], PAST_WINDOW) != key
+
+def test_hits_and_misses(tmp_path, clock):
+    cache = StacCache(tmp_path.joinpath("stac.db"))
+    items = [{"id": "a", "assets": {}}]
+
+    assert cache.get([0, 0, 1, 1], COLLECTIONS, PAST_WINDOW) is None
+    cache.put([0, 0, 1, 1], COLLECTIONS, PAST_WINDOW, items)
+    assert cache.get([0, 0, 1, 1], COLLECTIONS, PAST_WINDOW) == items
+    assert cache.get([0, 0, 2, 2], COLLECTIONS, PAST_WINDOW) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # Results outlive the connection
+    cache.close()
+    cache = StacCache(tmp_path.joinpath("stac.db"))
+    assert cache.get([0, 0, 1, 1], COLLECTIONS, PAST_WINDOW) == items
+
+def test_recent_windows_expire_and_past_windows_do_not(tmp_path, clock):
+    cache = StacCache(tmp_path.joinpath("stac.db"))
+    window = recent_window()
+    assert is_recent(window) and not is_recent(PAST_WINDOW)
+
+    cache.put([0, 0, 1, 1], COLLECTIONS, window, [])
+    cache.put([0, 0, 1, 1], COLLECTIONS, PAST_WINDOW, [])
+    clock.now += stac_cache.RECENT_TTL.total_seconds() - 1
+    assert cache.get([0, 0, 1, 1], COLLECTIONS, window) == []
+
+    clock.now += 2
+    assert cache.get([0, 0, 1, 1], COLLECTIONS, window) is None
+    assert cache.expired == 1
+
+    clock.now += 10 * 365 * 86400
+    assert cache.get([0, 0, 1, 1], COLLECTIONS, PAST_WINDOW) == []
+
+def test_least_recently_used_results_are_evicted(tmp_path, clock):
+    # Random ids barely compress, so the results are all about the same size
+    results = {i: [{"id": os.urandom(500).hex()}] for i in range(4)}
+    size = len(zlib.compress(json.dumps(results[0], separators=(",", ":")).encode()))
+    cache = StacCache(tmp_path.joinpath("stac.db"), max_bytes=int(3.5 * size))
+    for i in range(3):
+        cache.put([i, 0, 1, 1], COLLECTIONS, PAST_WINDOW, results[i])
+        clock.now += 1
+
+    # Reading result 0 makes result 1 the least recently used
+    assert cache.get([0, 0, 1, 1], COLLECTIONS, PAST_WINDOW) == results[0]
+    clock.now += 1
+    cache.put([3, 0, 1, 1], COLLECTIONS, PAST_WINDOW, results[3])
+
+    assert cache.evicted == 1
+    assert cache.get([1, 0, 1, 1], COLLECTIONS, PAST_WINDOW) is None
+    for i in (0, 2, 3):
+        assert cache.get([i, 0, 1, 1], COLLECTIONS, PAST_WINDOW) == results[i]
+
+def test_cached_searches_are_not_repeated(tmp_path, clock, catalog, sword_file):
+    cache_file = tmp_path.joinpath("stac.db")
+    reach_ids = np.array([11, 22, 33])
+    temporal_range = "2023-01-01T00:00:00Z,2023-03-01T00:00:00Z"
+
+    scenes, index = ssc.ssc_process_continent(reach_ids, "na", sword_file, temporal_range, cache_file)
+    num_searches = len(catalog.searches)
+    assert num_searches == 4
+
+    cached_scenes, cached_index = ssc.ssc_process_continent(reach_ids, "na", sword_file, temporal_range, cache_file)
+    assert len(catalog.searches) == num_searches
+    assert sorted(cached_scenes) == sorted(scenes)
+    assert cached_index == index
+    assert index["reach_scenes"][0] and index["reach_scenes"][2]
+    assert list(index["errors"]) == ["22"]
+
+    # Extending the range only searches the windows that changed
+    ssc.ssc_process_continent(reach_ids, "na", sword_file, "2023-01-01T00:00:00Z,2023-04-01T00:00:00Z", cache_file)
+    windows = [window for _, window in catalog.searches[num_searches:]]
+    assert len(windows) == 6
+    assert "2023-01-01T00:00:00Z/2023-01-31T00:00:00Z" not in windows